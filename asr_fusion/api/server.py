@@ -1,9 +1,38 @@
+import asyncio
+import logging
+import signal
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from asr_fusion.routers.transcription import router as transcription_router
+from asr_fusion.routers.models import router as models_router
+from asr_fusion.routers.realtime.ws import router as realtime_router
+from asr_fusion.routers.realtime.mux import router as realtime_mux_router
+from asr_fusion.routers.metrics import router as metrics_router
+from asr_fusion.routers.debug import router as debug_router
+from asr_fusion.routers.transcription import model_manager
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # kill -HUP reloads config.yaml, see ModelManager.reload
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, model_manager.reload_in_background)
+    except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+        # no SIGHUP on Windows, and signals only reach the main thread
+        logger.info("Configuration reload on SIGHUP is not available, use POST /debug/reload")
+    debug_config = model_manager.config.get_debug_config()
+    if not debug_config.get("token") and debug_config.get("allow_loopback", False):
+        logger.warning("The /debug endpoints answer any request from localhost without a token, "
+                       "including requests forwarded by a reverse proxy on this host; set debug.token")
+    yield
+
 
-app = FastAPI(title="ASR Fusion API", version="0.1.0")
+app = FastAPI(title="ASR Fusion API", version="0.1.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -16,6 +45,11 @@ app.add_middleware(
 
 # Include routers
 app.include_router(transcription_router)
+app.include_router(models_router)
+app.include_router(realtime_router)
+app.include_router(realtime_mux_router)
+app.include_router(metrics_router)
+app.include_router(debug_router)
 
 @app.get("/")
 async def root():
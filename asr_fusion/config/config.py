@@ -25,4 +25,36 @@ class Config:
     def get_model_config(self, engine_name: str, model_name: str) -> Dict[str, Any]:
         return self.config_data.get('model', {}).get(engine_name, {}).get(model_name, {})
 
+    def get_model_configs(self) -> Dict[str, Dict[str, Any]]:
+        """Get all model configurations, keyed by engine then model name"""
+        return self.config_data.get('model', {}) or {}
+
+    def get_routing_config(self, name: str) -> Dict[str, Any]:
+        """Get configuration of a routing model, e.g. "auto" """
+        return (self.config_data.get('routing', {}) or {}).get(name, {}) or {}
+
+    def get_slo_config(self, model_identifier: str) -> Dict[str, Any]:
+        """Get the latency SLO and degradation settings of a model, empty if it has none"""
+        return (self.config_data.get('slo', {}) or {}).get(model_identifier, {}) or {}
+
+    def get_scheduling_config(self) -> Dict[str, Any]:
+        """Get tenant weights and API key mapping of the request scheduler"""
+        return self.config_data.get('scheduling', {}) or {}
+
+    def get_recording_config(self) -> Dict[str, Any]:
+        """Get where realtime sessions are recorded, and which"""
+        return self.config_data.get('recording', {}) or {}
+
+    def get_debug_config(self) -> Dict[str, Any]:
+        """Get access settings of the /debug endpoints"""
+        return self.config_data.get('debug', {}) or {}
+
+    def get_reload_config(self) -> Dict[str, Any]:
+        """Get how models are warmed and drained when the configuration is reloaded"""
+        return self.config_data.get('reload', {}) or {}
+
+    def get_threads_config(self) -> Dict[str, Any]:
+        """Get CPU thread budgeting configuration"""
+        return self.config_data.get('threads', {}) or {}
+
 global_config = Config()
@@ -0,0 +1,74 @@
+import os
+import resource
+import tempfile
+import tracemalloc
+from typing import Dict, Any, List
+
+# Uploaded files are written to the temp directory under this prefix while they are transcribed
+UPLOAD_PREFIX = "asr-upload-"
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def process_rss() -> int:
+    """Resident set size of the process in bytes (the peak where /proc isn't available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def spooled_usage(file) -> Dict[str, Any]:
+    """Bytes written to a tempfile.SpooledTemporaryFile, and whether it rolled over to disk"""
+    try:
+        size = file.tell()
+    except (ValueError, OSError):
+        size = 0  # closed
+    return {"bytes": size, "on_disk": bool(getattr(file, "_rolled", False))}
+
+
+def upload_spool_usage() -> Dict[str, Any]:
+    """Uploaded files currently written to the temp directory"""
+    directory = tempfile.gettempdir()
+    files, size = 0, 0
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        entries = []
+    for entry in entries:
+        if entry.name.startswith(UPLOAD_PREFIX):
+            try:
+                size += entry.stat().st_size
+                files += 1
+            except OSError:
+                pass  # removed meanwhile
+    return {"directory": directory, "files": files, "bytes": size}
+
+
+def tracemalloc_top(limit: int = 20, group_by: str = "lineno") -> Dict[str, Any]:
+    """
+    Largest allocation sites of the Python heap since tracing started
+
+    Args:
+        limit: Sites to return
+        group_by: "lineno", "filename" or "traceback"
+    """
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    statistics = snapshot.statistics(group_by)
+    current, peak = tracemalloc.get_traced_memory()
+    top: List[Dict[str, Any]] = []
+    for stat in statistics[:limit]:
+        top.append({
+            "size": stat.size,
+            "count": stat.count,
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        })
+    return {"tracing": True, "traced_bytes": current, "peak_traced_bytes": peak, "sites": len(statistics), "top": top}
@@ -0,0 +1,195 @@
+import logging
+from typing import Dict, Any, Generator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+
+def _identifier(name: str) -> str:
+    """"large-v3" -> "faster-whisper/large-v3", full identifiers are kept"""
+    return name if "/" in name else f"faster-whisper/{name}"
+
+
+def _midpoint(item: Dict[str, Any]) -> float:
+    return (item["start"] + item["end"]) / 2
+
+
+class CascadeModel:
+    # Built from other models of the ModelManager rather than loaded itself
+    composite = True
+
+    def __init__(self, model_name: str, fast_model, accurate_model, fast_identifier: str, accurate_identifier: str,
+                 avg_logprob_threshold: float = -0.7, compression_ratio_threshold: float = 2.4,
+                 no_speech_threshold: float = 0.5, padding: float = 0.5, merge_gap: float = 1.0):
+        """
+        Transcribes with a cheap model and re-decodes only its low-confidence time ranges with an expensive one
+
+        A segment of the cheap model is escalated when its avg_logprob is below avg_logprob_threshold, its
+        compression_ratio above compression_ratio_threshold (repetitions), or when it has text although
+        no_speech_prob is above no_speech_threshold (a likely hallucination on noise). A segment without an
+        avg_logprob (or FunASR's 0.0), from an engine that doesn't score its segments, can't be trusted and is
+        escalated too.
+
+        Args:
+            model_name: Name of the cascade (e.g., "small->large-v3")
+            fast_model: ReplicaPool of the cheap model
+            accurate_model: ReplicaPool of the expensive model
+            fast_identifier: Model identifier of the cheap model
+            accurate_identifier: Model identifier of the expensive model
+            avg_logprob_threshold: Escalate segments with a lower average token log probability
+            compression_ratio_threshold: Escalate segments with a higher gzip compression ratio
+            no_speech_threshold: Escalate non-empty segments with a higher no-speech probability
+            padding: Seconds of context added on both sides of an escalated segment
+            merge_gap: Escalated ranges closer than this many seconds are re-decoded together
+        """
+        self.model_name = model_name
+        self.fast_model = fast_model
+        self.accurate_model = accurate_model
+        self.fast_identifier = fast_identifier
+        self.accurate_identifier = accurate_identifier
+        self.avg_logprob_threshold = avg_logprob_threshold
+        self.compression_ratio_threshold = compression_ratio_threshold
+        self.no_speech_threshold = no_speech_threshold
+        self.padding = padding
+        self.merge_gap = merge_gap
+
+    @classmethod
+    def from_manager(cls, model_manager, model_name: str, model_settings: Dict[str, Any]) -> "CascadeModel":
+        """
+        Create the cascade from its name, loading both models through the manager
+
+        Args:
+            model_manager: ModelManager that owns the cascaded models
+            model_name: "fast->accurate", each a model name of faster-whisper or a full model identifier
+            model_settings: Engine and model settings from the configuration
+        """
+        if "->" not in model_name:
+            raise ValueError(f"Cascade model name must be in the format 'fast->accurate': {model_name}")
+        fast, accurate = (_identifier(name.strip()) for name in model_name.split("->", 1))
+        return cls(
+            model_name=model_name,
+            fast_model=model_manager.load_model(fast),
+            accurate_model=model_manager.load_model(accurate),
+            fast_identifier=fast,
+            accurate_identifier=accurate,
+            avg_logprob_threshold=model_settings.get("avg_logprob_threshold", -0.7),
+            compression_ratio_threshold=model_settings.get("compression_ratio_threshold", 2.4),
+            no_speech_threshold=model_settings.get("no_speech_threshold", 0.5),
+            padding=model_settings.get("padding", 0.5),
+            merge_gap=model_settings.get("merge_gap", 1.0),
+        )
+
+    def low_confidence(self, segment: Dict[str, Any]) -> bool:
+        avg_logprob = segment.get("avg_logprob")
+        return (
+            # FunASR reports 0.0, which is no score either (see fusion_model.result_confidence)
+            not avg_logprob
+            or avg_logprob < self.avg_logprob_threshold
+            or segment.get("compression_ratio", 0.0) > self.compression_ratio_threshold
+            or (segment.get("no_speech_prob", 0.0) > self.no_speech_threshold and segment.get("text", "").strip() != "")
+        )
+
+    def escalated_ranges(self, segments: List[Dict[str, Any]], duration: float) -> List[Tuple[float, float]]:
+        """Padded, merged (start, end) ranges around the low-confidence segments.
+
+        Padding only extends into the gaps to the neighbouring segments, so no kept segment's
+        speech is decoded twice.
+        """
+        ranges = []
+        for index, segment in enumerate(segments):
+            if not self.low_confidence(segment):
+                continue
+            previous_end = segments[index - 1]["end"] if index > 0 else 0.0
+            next_start = segments[index + 1]["start"] if index + 1 < len(segments) else duration
+            start = max(0.0, previous_end, segment["start"] - self.padding)
+            end = min(duration, next_start, segment["end"] + self.padding)
+            if ranges and start - ranges[-1][1] < self.merge_gap:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def transcribe_file(self, audio_file_path: str, **kwargs) -> Dict[str, Any]:
+        """
+        Transcribe an audio file
+
+        Args:
+            audio_file_path: Path to the audio file
+            **kwargs: Additional arguments for transcription
+
+        Returns:
+            Dictionary with transcription result, and how much of it was escalated under "cascade"
+        """
+        from faster_whisper import decode_audio
+
+        timestamp_granularities = kwargs.pop("timestamp_granularities", None) or ["segments"]
+        granularities = ["segments", "word"] if "word" in timestamp_granularities else ["segments"]
+
+        audio = decode_audio(audio_file_path, sampling_rate=SAMPLING_RATE)
+        duration = len(audio) / SAMPLING_RATE
+
+        draft = self.fast_model.transcribe_file(audio, timestamp_granularities=granularities, **kwargs)
+        ranges = self.escalated_ranges(draft["segments"], duration)
+        # The accurate model sees short excerpts: don't let it guess the language from them
+        kwargs.setdefault("language", draft["language"])
+
+        segments = draft["segments"]
+        words = draft.get("words", [])
+        for start, end in ranges:
+            excerpt = audio[int(start * SAMPLING_RATE):int(end * SAMPLING_RATE)]
+            result = self.accurate_model.transcribe_file(excerpt, timestamp_granularities=granularities, **kwargs)
+            for item in result["segments"] + result.get("words", []):
+                item["start"] += start
+                item["end"] += start
+            # the accurate model's output replaces whatever the fast one had in the range
+            segments = [s for s in segments if not start <= _midpoint(s) < end] + result["segments"]
+            words = [w for w in words if not start <= _midpoint(w) < end] + result.get("words", [])
+
+        segments.sort(key=lambda s: s["start"])
+        words.sort(key=lambda w: w["start"])
+        for index, segment in enumerate(segments):
+            segment["id"] = index
+
+        escalated_seconds = sum(end - start for start, end in ranges)
+        logger.info(f"{self.model_name}: escalated {escalated_seconds:.1f} of {duration:.1f} s to {self.accurate_identifier}")
+
+        transcription_result = {
+            "task": "transcribe",
+            "language": draft["language"],
+            "duration": duration,
+            "text": "".join(segment["text"] for segment in segments).strip(),
+            "cascade": {
+                "models": [self.fast_identifier, self.accurate_identifier],
+                "escalated_seconds": round(escalated_seconds, 3),
+                "escalated_ratio": round(escalated_seconds / duration, 4) if duration else 0.0,
+                "escalated_ranges": [[round(start, 3), round(end, 3)] for start, end in ranges],
+            },
+        }
+        if "segments" in timestamp_granularities:
+            transcription_result["segments"] = segments
+        if "word" in timestamp_granularities:
+            transcription_result["words"] = words
+        return transcription_result
+
+    def transcribe_file_to_streaming(self, audio_file_path: str, **kwargs) -> Generator[Dict[str, Any], None, None]:
+        """
+        Transcribe an audio file and yield results in OpenAI format
+
+        Segments can only be final once the escalated ranges are re-decoded, so the deltas
+        follow the complete transcription.
+        """
+        kwargs["timestamp_granularities"] = ["segments"]
+        result = self.transcribe_file(audio_file_path, **kwargs)
+        for segment in result["segments"]:
+            yield {
+                "type": "transcript.text.delta",
+                "delta": segment["text"],
+            }
+        yield {
+            "type": "transcript.text.done",
+            "language": result["language"],
+            "duration": result["duration"],
+            "text": result["text"],
+            "cascade": result["cascade"],
+        }
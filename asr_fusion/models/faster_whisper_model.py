@@ -2,9 +2,13 @@ from faster_whisper import WhisperModel
 from typing import Dict, Any, Generator, List
 import os
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 class FasterWhisperModel:
-    def __init__(self, model_name: str, model_path: str, device: str = "cpu", compute_type: str = "int8"):
+    def __init__(self, model_name: str, model_path: str, device: str = "cpu", compute_type: str = "int8",
+                 cpu_threads: int = 0, num_workers: int = 1, beam_size: int = 5, download_root: str = None):
         """
         Initialize FasterWhisper model
         
@@ -13,13 +17,43 @@ class FasterWhisperModel:
             model_path: Path to the model directory
             device: Device to run the model on ("cpu" or "cuda")
             compute_type: Compute type for the model ("int8", "float16", etc.)
+            cpu_threads: CTranslate2 threads per worker on CPU (0 lets CTranslate2 decide)
+            num_workers: Number of transcriptions that can run in parallel on this model
+            beam_size: Default beam size when a request doesn't set one
+            download_root: Directory where models downloaded from the hub are saved
         """
         self.model_name = model_name
         self.model_path = model_path
         self.device = device
         self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.num_workers = num_workers
+        self.beam_size = beam_size
 
-        self.model = WhisperModel(model_path, device=device, compute_type=compute_type)
+        self.model = WhisperModel(model_path, device=device, compute_type=compute_type,
+                                  cpu_threads=cpu_threads, num_workers=num_workers,
+                                  download_root=download_root)
+
+    @classmethod
+    def from_config(cls, model_name: str, model_settings: Dict[str, Any], allocation=None) -> "FasterWhisperModel":
+        """
+        Create the model from its config.yaml settings and thread allocation
+        
+        Args:
+            model_name: Name of the model (e.g., "large-v3")
+            model_settings: Engine and model settings from the configuration
+            allocation: ThreadAllocation for this replica, None to let CTranslate2 decide
+        """
+        return cls(
+            model_name=model_name,
+            model_path=model_settings.get("path", model_name),
+            device=model_settings.get("device", "cpu"),
+            compute_type=model_settings.get("compute_type", "int8"),
+            cpu_threads=model_settings.get("cpu_threads", allocation.cpu_threads if allocation else 0),
+            num_workers=model_settings.get("num_workers", allocation.num_workers if allocation else 1),
+            beam_size=model_settings.get("beam_size", 5),
+            download_root=model_settings.get("download_root")
+        )
 
     def transcribe_file(self, audio_file_path: str, **kwargs) -> Dict[str, Any]:
         """
@@ -27,22 +61,37 @@ class FasterWhisperModel:
         
         Args:
             audio_file_path: Path to the audio file
-            **kwargs: Additional arguments for transcription
+            **kwargs: Additional arguments for transcription. A threading.Event passed as `cancel`
+                stops the transcription at the next segment once set; a `checkpoint` callable is
+                called between segments, where the scheduler may pause a batch request.
             
         Returns:
-            Dictionary with transcription result
+            Dictionary with transcription result, marked "cancelled" if it was stopped early
         """
+        cancel = kwargs.pop("cancel", None)
+        checkpoint = kwargs.pop("checkpoint", None)
         timestamp_granularities = ["segments"]
         if "timestamp_granularities" in kwargs:
-            timestamp_granularities = kwargs["timestamp_granularities"]
+            timestamp_granularities = kwargs.pop("timestamp_granularities")
+        kwargs.setdefault("beam_size", self.beam_size)
 
-        print(f"Faster-Whisper start transcribe file: {audio_file_path}")
+        if isinstance(audio_file_path, str):
+            logger.debug("Faster-Whisper start transcribe file: %s", audio_file_path)
+        else:
+            logger.debug("Faster-Whisper start transcribe %.1fs of samples", len(audio_file_path) / 16000)
         segments, transcription_info = self.model.transcribe(audio_file_path, **kwargs)
         
         # Convert segments to the desired format
         segments_list = []
         words_list = []
+        cancelled = False
         for segment in segments:
+            if cancel is not None and cancel.is_set():
+                # segments are decoded lazily, nothing more is computed after this
+                cancelled = True
+                break
+            if checkpoint is not None:
+                checkpoint()
             segment_dict = {
                 "id": segment.id,
                 "seek": segment.seek,
@@ -80,8 +129,33 @@ class FasterWhisperModel:
             transcription_result["segments"] = segments_list
         if "word" in timestamp_granularities:
             transcription_result["words"] = words_list
+        if cancelled:
+            transcription_result["cancelled"] = True
         return transcription_result
 
+    def detect_language(self, audio, **kwargs) -> Dict[str, Any]:
+        """
+        Detect the spoken language from the first 30 seconds of audio
+
+        Only the encoder and a single decoder step run: the segments are never decoded.
+
+        Args:
+            audio: Path to the audio file, or 16 kHz float32 samples
+            **kwargs: Additional arguments for transcription (e.g. vad_filter)
+
+        Returns:
+            Dictionary with the language, its probability and the most likely alternatives
+        """
+        _, transcription_info = self.model.transcribe(audio, beam_size=1, **kwargs)
+        return {
+            "language": transcription_info.language,
+            "probability": transcription_info.language_probability,
+            "alternatives": [
+                {"language": language, "probability": probability}
+                for language, probability in (transcription_info.all_language_probs or [])[:5]
+            ],
+        }
+
     def transcribe_file_to_streaming(self, audio_file_path: str, **kwargs) -> Generator[Dict[str, Any], None, None]:
         """
         Transcribe audio stream and yield results in OpenAI format
@@ -94,13 +168,18 @@ class FasterWhisperModel:
             Dictionary with transcription result in OpenAI format
         """
 
-        print(f"Faster-Whisper start transcribe file: {audio_file_path}")
+        logger.debug("Faster-Whisper start transcribe file: %s", audio_file_path)
+        kwargs.pop("timestamp_granularities", None)
+        checkpoint = kwargs.pop("checkpoint", None)
+        kwargs.setdefault("beam_size", self.beam_size)
         segments, transcription_info = self.model.transcribe(audio_file_path, **kwargs)
         
         # Collect all segments and their words
         full_text = ""
         
         for segment in segments:
+            if checkpoint is not None:
+                checkpoint()
             full_text = segment.text + "/n"
             yield {
                 "type":"transcript.text.delta",
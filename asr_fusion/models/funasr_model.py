@@ -4,7 +4,9 @@ import os
 from funasr import AutoModel
 
 class FunASRModel:
-    def __init__(self, model_name: str, model_path: str = ".", device: str = "cpu"):
+    uses_torch = True
+
+    def __init__(self, model_name: str, model_path: str = ".", device: str = "cpu", ncpu: int = 4):
         """
         Initialize FunASR model
         
@@ -12,14 +14,35 @@ class FunASRModel:
             model_name: Name of the model
             model_path: Path to the model directory
             device: Device to run the model on ("cpu" or "cuda")
+            ncpu: torch intra-op threads, FunASR applies it process wide when the model loads
         """
         self.model_name = model_name
         self.model_path = model_path
         self.device = device
+        self.ncpu = ncpu
         
         # Initialize the model
         full_model_path = os.path.join(model_path, model_name) if model_path else model_name
-        self.model = AutoModel(model=full_model_path, device=device)
+        self.model = AutoModel(model=full_model_path, device=device, ncpu=ncpu)
+
+    @classmethod
+    def from_config(cls, model_name: str, model_settings: Dict[str, Any], allocation=None) -> "FunASRModel":
+        """
+        Create the model from its config.yaml settings
+        
+        Args:
+            model_name: Name of the model
+            model_settings: Engine and model settings from the configuration
+            allocation: ThreadAllocation for this replica (torch threads are sized process wide)
+        """
+        import torch
+        return cls(
+            model_name=model_name,
+            model_path=model_settings.get("path", model_name),
+            device=model_settings.get("device", "cpu"),
+            # AutoModel re-applies ncpu process wide, so keep what the thread budget set
+            ncpu=model_settings.get("ncpu", torch.get_num_threads())
+        )
     
     def transcribe_file(self, audio_file_path: str, **kwargs) -> Dict[str, Any]:
         """
@@ -32,6 +55,10 @@ class FunASRModel:
         Returns:
             Dictionary with transcription result
         """
+        # generate() runs to completion, there is no point to stop or pause at
+        kwargs.pop("cancel", None)
+        kwargs.pop("checkpoint", None)
+
         # Perform transcription
         result = self.model.generate(input=audio_file_path, **kwargs)
         
@@ -0,0 +1,265 @@
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Generator, List, Optional
+
+from asr_fusion.models.replica_pool import audio_duration
+
+logger = logging.getLogger(__name__)
+
+
+def result_confidence(result: Dict[str, Any]) -> Optional[float]:
+    """
+    Confidence in [0, 1] of a transcription result, None if the engine doesn't report any
+
+    Mean word probability when words are available, otherwise the duration weighted
+    exp(avg_logprob) of the segments (FunASR reports 0.0 there, which is treated as unknown).
+    """
+    segments = result.get("segments", [])
+    words = result.get("words") or [w for s in segments for w in s.get("words", [])]
+    probabilities = [w["probability"] for w in words if w.get("probability")]
+    if probabilities:
+        return sum(probabilities) / len(probabilities)
+
+    scored = [s for s in segments if s.get("avg_logprob")]
+    if not scored:
+        return None
+    weights = [max(s["end"] - s["start"], 1e-3) for s in scored]
+    avg_logprob = sum(w * s["avg_logprob"] for w, s in zip(weights, scored)) / sum(weights)
+    return math.exp(avg_logprob)
+
+
+class LatencyTracker:
+    def __init__(self, size: int = 200):
+        """Recent transcription latencies of one model, relative to the audio duration"""
+        self.ratios = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, duration: float):
+        if duration > 0:
+            with self._lock:
+                self.ratios.append(latency / duration)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self.ratios:
+                return None
+            ordered = sorted(self.ratios)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self):
+        return len(self.ratios)
+
+
+class FusionModel:
+    # Built from other models of the ModelManager rather than loaded itself
+    composite = True
+
+    def __init__(self, model_name: str, models: List[Any], identifiers: List[str], confidence_threshold: float = 0.6,
+                 hedge: bool = True, hedge_quantile: float = 0.95, hedge_delay: float = 1.0, min_samples: int = 20,
+                 accept_unscored: bool = False):
+        """
+        Sends the same audio to several models and returns the first result that is confident enough
+
+        The models are tried in order. With hedging, the next one only gets the audio when the previous
+        hasn't answered within its hedge_quantile latency for audio of that length (hedge_delay seconds
+        until min_samples latencies are known), or as soon as it answered without enough confidence or
+        failed. Without hedging all models start at once. Once a result is accepted, the others are
+        cancelled: engines that decode segment by segment (faster-whisper) stop at the next segment.
+        When no result reaches confidence_threshold, the most confident one is returned; a result without
+        any confidence (e.g. FunASR's Paraformer without word probabilities) ranks below every scored one.
+
+        Args:
+            model_name: Name of the fusion (e.g., "funasr/paraformer+faster-whisper/small")
+            models: ReplicaPools of the fused models, in order of preference
+            identifiers: Model identifiers of the fused models
+            confidence_threshold: Lowest accepted confidence, see result_confidence
+            hedge: Start the next model only after a delay instead of all at once
+            hedge_quantile: Latency quantile of a model that its successor waits for
+            hedge_delay: Seconds to wait while a model's latency is not yet known
+            min_samples: Latencies recorded before the quantile is used
+            accept_unscored: Accept results of engines that report no confidence as they are, instead
+                of going on to the next model
+        """
+        self.model_name = model_name
+        self.models = models
+        self.identifiers = identifiers
+        self.confidence_threshold = confidence_threshold
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_delay = hedge_delay
+        self.min_samples = min_samples
+        self.accept_unscored = accept_unscored
+
+        self.latencies = [LatencyTracker() for _ in models]
+        self.executor = ThreadPoolExecutor(thread_name_prefix="fusion")
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.selected = {identifier: 0 for identifier in identifiers}
+
+    @classmethod
+    def from_manager(cls, model_manager, model_name: str, model_settings: Dict[str, Any]) -> "FusionModel":
+        """
+        Create the fusion from its name, loading every model through the manager
+
+        Args:
+            model_manager: ModelManager that owns the fused models
+            model_name: Model identifiers joined by "+", e.g. "funasr/paraformer+faster-whisper/small"
+            model_settings: Engine and model settings from the configuration
+        """
+        identifiers = [identifier.strip() for identifier in model_name.split("+")]
+        if len(identifiers) < 2 or any("/" not in identifier for identifier in identifiers):
+            raise ValueError(f"Fusion model name must be model identifiers joined by '+': {model_name}")
+        return cls(
+            model_name=model_name,
+            models=[model_manager.load_model(identifier) for identifier in identifiers],
+            identifiers=identifiers,
+            confidence_threshold=model_settings.get("confidence_threshold", 0.6),
+            hedge=model_settings.get("hedge", True),
+            hedge_quantile=model_settings.get("hedge_quantile", 0.95),
+            hedge_delay=model_settings.get("hedge_delay", 1.0),
+            min_samples=model_settings.get("min_samples", 20),
+            accept_unscored=model_settings.get("accept_unscored", False),
+        )
+
+    def delay_after(self, index: int, duration: float) -> float:
+        """Seconds model index gets to answer before the next model is started"""
+        if not self.hedge:
+            return 0.0
+        tracker = self.latencies[index]
+        if len(tracker) < self.min_samples or duration <= 0:
+            return self.hedge_delay
+        return tracker.quantile(self.hedge_quantile) * duration
+
+    def accepted(self, confidence: Optional[float]) -> bool:
+        if confidence is None:
+            return self.accept_unscored
+        return confidence >= self.confidence_threshold
+
+    def _run(self, index: int, audio_file_path: str, duration: float, cancel: threading.Event, kwargs: Dict[str, Any]):
+        start = time.time()
+        result = self.models[index].transcribe_file(audio_file_path, cancel=cancel, **kwargs)
+        if not result.get("cancelled"):
+            self.latencies[index].record(time.time() - start, duration)
+        return result
+
+    def transcribe_file(self, audio_file_path: str, **kwargs) -> Dict[str, Any]:
+        """
+        Transcribe an audio file
+
+        Args:
+            audio_file_path: Path to the audio file
+            **kwargs: Additional arguments for transcription
+
+        Returns:
+            Dictionary with the selected transcription result, and how it was selected under "fusion"
+        """
+        start = time.time()
+        duration = audio_duration(audio_file_path)
+        cancel = threading.Event()
+        pending = {}
+        launched = []
+        best = None  # (confidence, index, result) of the best unaccepted result
+        error = None
+
+        def launch():
+            index = len(launched)
+            launched.append(self.identifiers[index])
+            # the fused models are scheduled for the tenant and priority of this request
+            context = contextvars.copy_context()
+            future = self.executor.submit(context.run, self._run, index, audio_file_path, duration, cancel, dict(kwargs))
+            pending[future] = index
+            return time.time() + self.delay_after(index, duration)
+
+        next_launch = launch()
+        try:
+            while pending or len(launched) < len(self.models):
+                if len(launched) < len(self.models) and (not pending or time.time() >= next_launch):
+                    next_launch = launch()
+                    continue
+                timeout = max(0.0, next_launch - time.time()) if len(launched) < len(self.models) else None
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.warning(f"{self.identifiers[index]} failed in {self.model_name}: {e}")
+                        error = e
+                        next_launch = time.time()
+                        continue
+                    confidence = result_confidence(result)
+                    if self.accepted(confidence):
+                        return self._selected(result, index, confidence, True, launched, start)
+                    logger.debug(f"{self.identifiers[index]} confidence {confidence} below threshold")
+                    # unscored results rank last, kept only for when every other model fails
+                    rank = -1.0 if confidence is None else confidence
+                    if best is None or rank > best[0]:
+                        best = (rank, index, result)
+                    next_launch = time.time()
+        finally:
+            # stop whatever is still running, its result isn't needed any more
+            cancel.set()
+
+        if best is None:
+            raise error
+        return self._selected(best[2], best[1], best[0] if best[0] >= 0 else None, False, launched, start)
+
+    def _selected(self, result: Dict[str, Any], index: int, confidence: Optional[float], accepted: bool,
+                  launched: List[str], start: float) -> Dict[str, Any]:
+        with self._lock:
+            self.requests += 1
+            self.hedged += len(launched) > 1
+            self.selected[self.identifiers[index]] += 1
+        result["fusion"] = {
+            "models": self.identifiers,
+            "launched": launched,
+            "selected": self.identifiers[index],
+            "confidence": None if confidence is None else round(confidence, 4),
+            "accepted": accepted,
+            "latency": round(time.time() - start, 3),
+        }
+        return result
+
+    def transcribe_file_to_streaming(self, audio_file_path: str, **kwargs) -> Generator[Dict[str, Any], None, None]:
+        """
+        Transcribe an audio file and yield results in OpenAI format
+
+        Which result is used is only known once one is accepted, so the deltas follow it.
+        """
+        kwargs["timestamp_granularities"] = ["segments"]
+        result = self.transcribe_file(audio_file_path, **kwargs)
+        for segment in result["segments"]:
+            yield {
+                "type": "transcript.text.delta",
+                "delta": segment["text"],
+            }
+        yield {
+            "type": "transcript.text.done",
+            "language": result["language"],
+            "duration": result["duration"],
+            "text": "".join(segment["text"] for segment in result["segments"]).strip(),
+            "fusion": result["fusion"],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "selected": dict(self.selected),
+                # seconds a model gets per second of audio before the next one is started
+                "hedge_delay_per_audio_second": {
+                    identifier: tracker.quantile(self.hedge_quantile)
+                    for identifier, tracker in zip(self.identifiers, self.latencies)
+                },
+            }
+
+    def close(self):
+        """Stop the hedging threads once the requests left on them finish; the parts are closed by their own pools"""
+        self.executor.shutdown(wait=False)
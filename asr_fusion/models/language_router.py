@@ -0,0 +1,209 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Generator, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+
+def audio_hash(audio) -> str:
+    """Content hash of an audio file path or sample array"""
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(audio, (str, os.PathLike)):
+        with open(audio, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    else:
+        digest.update(np.ascontiguousarray(audio).tobytes())
+    return digest.hexdigest()
+
+
+def load_audio_head(audio, seconds: float) -> np.ndarray:
+    """
+    The first seconds of an audio file or sample array as 16 kHz mono float32
+
+    Files are decoded only as far as needed, unlike faster_whisper.decode_audio.
+    """
+    needed = int(seconds * SAMPLING_RATE)
+    if not isinstance(audio, (str, os.PathLike)):
+        return audio[:needed]
+
+    import av
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=SAMPLING_RATE)
+    chunks = []
+    decoded = 0
+    with av.open(os.fspath(audio), mode="r") as container:
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                chunk = resampled.to_ndarray().reshape(-1)
+                chunks.append(chunk)
+                decoded += len(chunk)
+            if decoded >= needed:
+                break
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks)[:needed].astype(np.float32) / 32768.0
+
+
+class LanguageCache:
+    def __init__(self, size: int = 10000):
+        """LRU cache of detection results by audio hash"""
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self.entries), "max_size": self.size, "hits": self.hits, "misses": self.misses}
+
+
+class LanguageRouter:
+    # Built from other models of the ModelManager rather than loaded itself
+    composite = True
+
+    def __init__(self, model_name: str, model_manager, detector: str, languages: Dict[str, str], default: str,
+                 detect_seconds: float = 5.0, min_probability: float = 0.5, cache_size: int = 10000):
+        """
+        Detects the language of the audio and transcribes it with the model configured for that language
+
+        Detection runs one language-ID pass of a small faster-whisper model on the first detect_seconds
+        of audio and is cached by audio content hash. Routed models are loaded when first used.
+
+        Args:
+            model_name: Name of the routing configuration (e.g., "auto")
+            model_manager: ModelManager that owns the detector and the routed models
+            detector: Model identifier of the faster-whisper model used for detection
+            languages: Model identifier per language code
+            default: Model identifier for other languages and uncertain detections
+            detect_seconds: Seconds of audio from the start used for detection
+            min_probability: Detections less likely than this are routed to default
+            cache_size: Detection results kept, by audio hash
+        """
+        self.model_name = model_name
+        self.model_manager = model_manager
+        self.detector = detector
+        self.languages = languages
+        self.default = default
+        self.detect_seconds = detect_seconds
+        self.min_probability = min_probability
+        self.cache = LanguageCache(cache_size)
+
+        self._lock = threading.Lock()
+        self.routed = {}
+
+    @classmethod
+    def from_manager(cls, model_manager, model_name: str, model_settings: Dict[str, Any]) -> "LanguageRouter":
+        """
+        Create the router from the `routing` section of the configuration
+
+        Args:
+            model_manager: ModelManager that owns the detector and the routed models
+            model_name: Name of the routing configuration, "auto" for the `auto` model identifier
+            model_settings: Engine and model settings from the configuration
+        """
+        routing = {**model_settings, **model_manager.config.get_routing_config(model_name)}
+        return cls(
+            model_name=model_name,
+            model_manager=model_manager,
+            detector=routing.get("detector", "faster-whisper/tiny"),
+            languages=routing.get("languages", {}) or {},
+            default=routing.get("default", "faster-whisper/large-v3"),
+            detect_seconds=routing.get("detect_seconds", 5.0),
+            min_probability=routing.get("min_probability", 0.5),
+            cache_size=routing.get("cache_size", 10000),
+        )
+
+    def route(self, language: Optional[str], probability: float = 1.0) -> str:
+        """Model identifier for a language"""
+        if language is None or probability < self.min_probability:
+            return self.default
+        return self.languages.get(language, self.default)
+
+    def detect(self, audio) -> Dict[str, Any]:
+        """
+        Detect the language of an audio file or sample array
+
+        Returns:
+            Dictionary with the language, its probability, the model it routes to and whether it was cached
+        """
+        key = audio_hash(audio)
+        detection = self.cache.get(key)
+        cached = detection is not None
+        if detection is None:
+            head = load_audio_head(audio, self.detect_seconds)
+            detection = self.model_manager.load_model(self.detector).detect_language(head)
+            self.cache.put(key, detection)
+        return {
+            **detection,
+            "route": self.route(detection["language"], detection["probability"]),
+            "cached": cached,
+        }
+
+    def _target(self, audio_file_path: str, kwargs: Dict[str, Any]):
+        if kwargs.get("language"):
+            routing = {"language": kwargs["language"], "probability": 1.0, "route": self.route(kwargs["language"]),
+                       "cached": False, "detected": False}
+        else:
+            routing = {**self.detect(audio_file_path), "detected": True}
+            if routing["route"].startswith("faster-whisper/"):
+                # spare the routed model its own language detection
+                kwargs["language"] = routing["language"]
+        with self._lock:
+            self.routed[routing["route"]] = self.routed.get(routing["route"], 0) + 1
+        logger.info(f"{self.model_name}: {routing['language']} ({routing['probability']:.2f}) -> {routing['route']}")
+        return self.model_manager.load_model(routing["route"]), routing
+
+    def transcribe_file(self, audio_file_path: str, **kwargs) -> Dict[str, Any]:
+        """
+        Transcribe an audio file with the model of its language
+
+        Args:
+            audio_file_path: Path to the audio file
+            **kwargs: Additional arguments for transcription; with a language, detection is skipped
+
+        Returns:
+            Dictionary with transcription result, and the routing decision under "routing"
+        """
+        model, routing = self._target(audio_file_path, kwargs)
+        result = model.transcribe_file(audio_file_path, **kwargs)
+        result["routing"] = routing
+        return result
+
+    def transcribe_file_to_streaming(self, audio_file_path: str, **kwargs) -> Generator[Dict[str, Any], None, None]:
+        """
+        Transcribe an audio file with the model of its language and yield results in OpenAI format
+        """
+        model, routing = self._target(audio_file_path, kwargs)
+        for result in model.transcribe_file_to_streaming(audio_file_path, **kwargs):
+            if result.get("type") == "transcript.text.done":
+                result["routing"] = routing
+            yield result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            routed = dict(self.routed)
+        return {"routed": routed, "cache": self.cache.stats()}
@@ -1,8 +1,28 @@
-from typing import Dict, Any, Optional
+import json
+import logging
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
 from asr_fusion.config.config import Config
-from asr_fusion.models.faster_whisper_model import FasterWhisperModel
-from asr_fusion.models.funasr_model import FunASRModel
-from asr_fusion.models.sensevoice_model import SenseVoiceModel
+from asr_fusion.memory import process_rss
+from asr_fusion.models.registry import engine_registry
+from asr_fusion.models.replica_pool import Replica, ReplicaPool
+from asr_fusion.models.scheduler import FairScheduler
+from asr_fusion.models.thread_budget import ThreadBudget
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+
+class ReloadInProgress(Exception):
+    """Another configuration reload is running"""
+
 
 class ModelManager:
     def __init__(self, config_path: str = "config.yaml"):
@@ -13,9 +33,20 @@ class ModelManager:
             config_path: Path to the configuration file
         """
         self.config = Config(config_path)
+        self.thread_budget = ThreadBudget(self.config)
         self.models = {}
+        # Growth of the process RSS while each model loaded, its weights and runtime buffers in host memory
+        self.model_rss: Dict[str, int] = {}
+        # Reentrant: composite models load their parts while being loaded
+        self._load_lock = threading.RLock()
+        # Configuration reloads: one at a time, and the pools they replaced until those drain
+        self._reload_lock = threading.Lock()
+        self.version = 0
+        self.last_reload: Optional[Dict[str, Any]] = None
+        self.retiring: List[ReplicaPool] = []
+        self._retired: List[weakref.ref] = []
     
-    def load_model(self, model_identifier: str) -> Any:
+    def load_model(self, model_identifier: str) -> ReplicaPool:
         """
         Load a model based on the model identifier (e.g., "faster-whisper/large-v3")
         
@@ -23,46 +54,290 @@ class ModelManager:
             model_identifier: Model identifier in the format "engine/model_name"
             
         Returns:
-            Loaded model instance
+            Pool of the model's loaded replicas, routing requests to the least loaded one
         """
         if model_identifier in self.models:
             return self.models[model_identifier]
         
         # Parse the model identifier
-        if "/" not in model_identifier:
+        if model_identifier == "auto":
+            # language routing with the "auto" routing configuration
+            engine, model_name = "auto", "auto"
+        elif "/" not in model_identifier:
             raise ValueError("Model identifier must be in the format 'engine/model_name'")
-        
-        engine, model_name = model_identifier.split("/", 1)
-        
-        # Get engine-specific configuration
-        model_settings = self.config.get_model_config(engine, model_name)
-        
-        # Load the appropriate model
-        if engine == "faster-whisper":
-            model = FasterWhisperModel(
-                model_name=model_name,
-                model_path=model_settings.get("path", model_name),
-                device=model_settings.get("device", "cpu"),
-                compute_type=model_settings.get("compute_type", "int8")
-            )
-        elif engine == "funasr":
-            model = FunASRModel(
-                model_name=model_name,
-                model_path=model_settings.get("path", model_name),
-                device=model_settings.get("device", "cpu")
-            )
-        elif engine == "sensevoice":
-            model = SenseVoiceModel(
-                model_name=model_name,
-                model_path=model_settings.get("path", model_name),
-                device=model_settings.get("device", "cpu")
-            )
         else:
-            raise ValueError(f"Unsupported engine: {engine}")
+            engine, model_name = model_identifier.split("/", 1)
         
-        # Cache the model
-        self.models[model_identifier] = model
-        return model
+        with self._load_lock:
+            if model_identifier in self.models:
+                return self.models[model_identifier]
+
+            # Engine classes are imported only now, on the first model of that engine
+            engine_cls = engine_registry.get(engine)
+
+            if getattr(engine_cls, "composite", False):
+                # Runs on its parts' replicas and threads
+                model = engine_cls.from_manager(self, model_name, self._model_settings(self.config, engine, model_name))
+                pool = ReplicaPool(model_identifier, [Replica(0, model)])
+                self.models[model_identifier] = pool
+                return pool
+
+            rss_before = process_rss()
+            pool = self._build(model_identifier, self.config, self.thread_budget)
+            self.model_rss[model_identifier] = max(0, process_rss() - rss_before)
+            self.models[model_identifier] = pool
+            return pool
+
+    @staticmethod
+    def _parse(model_identifier: str):
+        """(engine, model_name) of a loaded model identifier"""
+        if model_identifier == "auto":
+            return "auto", "auto"
+        return tuple(model_identifier.split("/", 1))
+
+    @staticmethod
+    def _model_settings(config: Config, engine: str, model_name: str) -> Dict[str, Any]:
+        # Model settings override the engine-wide defaults
+        return {
+            **config.get_engine_config(engine),
+            **config.get_model_config(engine, model_name),
+        }
+
+    def _build(self, model_identifier: str, config: Config, thread_budget: ThreadBudget) -> ReplicaPool:
+        """Load the replicas of a model that isn't composite, as configured in config"""
+        engine, model_name = self._parse(model_identifier)
+        engine_cls = engine_registry.get(engine)
+        model_settings = self._model_settings(config, engine, model_name)
+        replicas = []
+        for index in range(int(model_settings.get("replicas", 1))):
+            # Threads for each replica come out of the machine-wide budget
+            allocation = thread_budget.allocation_for(model_identifier, index)
+            if getattr(engine_cls, "uses_torch", False):
+                thread_budget.configure_torch(engine)
+
+            # CTranslate2 workers inherit the affinity of the loading thread
+            with allocation.pinned() if allocation else nullcontext():
+                model = engine_cls.from_config(model_name, model_settings, allocation)
+            replicas.append(Replica(index, model, allocation))
+
+        # Requests are admitted by priority and tenant share, as many at a time as the replicas run
+        scheduling = config.get_scheduling_config()
+        scheduler = None
+        if scheduling.get("enabled", True):
+            capacity = sum(max(1, getattr(replica.model, "num_workers", 1)) for replica in replicas)
+            weights = {tenant: (settings or {}).get("weight", 1.0) for tenant, settings in (scheduling.get("tenants") or {}).items()}
+            scheduler = FairScheduler(model_identifier, capacity, weights, scheduling.get("default_weight", 1.0),
+                                      known_tenants=(scheduling.get("api_keys") or {}).values(),
+                                      max_dynamic_tenants=int(scheduling.get("max_dynamic_tenants", 1000)))
+        return ReplicaPool(model_identifier, replicas, scheduler=scheduler)
+
+    def _fingerprint(self, config: Config, thread_budget: ThreadBudget, model_identifier: str, composite: bool) -> str:
+        """Everything in config a loaded model was built from; a model is reloaded when it changes"""
+        engine, model_name = self._parse(model_identifier)
+        settings = self._model_settings(config, engine, model_name)
+        if composite:
+            parts = [settings, config.get_routing_config(model_name)]
+        else:
+            allocations = [thread_budget.allocation_for(model_identifier, index)
+                           for index in range(int(settings.get("replicas", 1)))]
+            parts = [settings, config.get_scheduling_config(),
+                     [allocation.to_dict() if allocation else None for allocation in allocations]]
+        return json.dumps(parts, sort_keys=True, default=str)
+
+    @staticmethod
+    def _warm(pool: ReplicaPool, seconds: float):
+        """Run every replica once on silence: the first transcription of a model pays for allocations and kernel setup"""
+        if seconds <= 0:
+            return
+        silence = np.zeros(int(seconds * SAMPLING_RATE), dtype=np.float32)
+        for replica in pool.replicas:
+            with replica.pinned():
+                replica.model.transcribe_file(silence)
+
+    @staticmethod
+    def _uses(model: Any, pools: List[ReplicaPool]) -> bool:
+        """Whether a composite model holds one of the pools, directly or in a list"""
+        for value in vars(model).values():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            if any(item is pool for item in values for pool in pools):
+                return True
+        return False
+
+    def reload(self) -> Dict[str, Any]:
+        """
+        Read the configuration file again and move the loaded models to it without dropping requests
+
+        Models whose settings, scheduling or thread allocation changed are loaded and warmed anew
+        next to the running ones, which keep serving meanwhile. Once all of them are ready, routing
+        switches to them at once, together with the configuration every other component reads
+        through self.config; composite models holding a replaced part are rebuilt on the new one.
+        Replaced pools are retired: a background thread unloads each once the requests on it
+        finished. Realtime sessions keep the model they started with until they end.
+        If any model fails to load or warm up, nothing is switched.
+
+        Returns:
+            The changed configuration sections and the models swapped, rebuilt and unchanged
+
+        Raises:
+            ReloadInProgress: Another reload is running
+            Exception: The configuration can't be read or a model failed to load; the old one stays in effect
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            raise ReloadInProgress("A configuration reload is already running")
+        try:
+            started = time.perf_counter()
+            config = Config(str(self.config.config_path))
+            thread_budget = self.thread_budget.for_config(config)
+            reload_settings = config.get_reload_config()
+            changed_sections = sorted(
+                section for section in set(self.config.config_data or {}) | set(config.config_data or {})
+                if (self.config.config_data or {}).get(section) != (config.config_data or {}).get(section)
+            )
+
+            models = dict(self.models)
+            # composite model identifier -> whether its own settings changed
+            composites: Dict[str, bool] = {}
+            changed, unchanged = [], []
+            for model_identifier in models:
+                engine, _ = self._parse(model_identifier)
+                composite = getattr(engine_registry.get(engine), "composite", False)
+                differs = (self._fingerprint(self.config, self.thread_budget, model_identifier, composite)
+                           != self._fingerprint(config, thread_budget, model_identifier, composite))
+                if composite:
+                    composites[model_identifier] = differs
+                elif differs:
+                    changed.append(model_identifier)
+                else:
+                    unchanged.append(model_identifier)
+
+            # Load the new versions while the old ones serve; all or nothing
+            pools: Dict[str, ReplicaPool] = {}
+            rss: Dict[str, int] = {}
+            for model_identifier in changed:
+                logger.info(f"Reload: loading the new version of {model_identifier}")
+                rss_before = process_rss()
+                try:
+                    pools[model_identifier] = self._build(model_identifier, config, thread_budget)
+                    self._warm(pools[model_identifier], float(reload_settings.get("warmup_seconds", 1.0)))
+                except Exception:
+                    logger.exception(f"Reload: {model_identifier} failed, keeping the running configuration")
+                    self._unload(list(pools.values()))
+                    raise
+                rss[model_identifier] = max(0, process_rss() - rss_before)
+
+            with self._load_lock:
+                replaced = [self.models[model_identifier] for model_identifier in pools if model_identifier in self.models]
+                # One assignment each: readers see the old or the new mapping, never a mix of a model's replicas
+                self.config = config
+                self.thread_budget = thread_budget
+                self.models = {**self.models, **pools}
+                self.model_rss.update(rss)
+
+                rebuilt = []
+                for model_identifier, differs in composites.items():
+                    old = models[model_identifier]
+                    if not differs and not self._uses(old.model, replaced):
+                        unchanged.append(model_identifier)
+                        continue
+                    engine, model_name = self._parse(model_identifier)
+                    try:
+                        model = engine_registry.get(engine).from_manager(self, model_name, self._model_settings(config, engine, model_name))
+                    except Exception:
+                        logger.exception(f"Reload: rebuilding {model_identifier} failed, it keeps its old parts")
+                        continue
+                    self.models = {**self.models, model_identifier: ReplicaPool(model_identifier, [Replica(0, model)])}
+                    replaced.append(old)
+                    rebuilt.append(model_identifier)
+                self.version += 1
+
+            self._retire(replaced, float(reload_settings.get("drain_timeout", 600)))
+            report = {
+                "version": self.version,
+                "changed_sections": changed_sections,
+                "swapped": sorted(pools),
+                "rebuilt": sorted(rebuilt),
+                "unchanged": sorted(unchanged),
+                # read once at startup by uvicorn
+                "restart_required": ["server"] if "server" in changed_sections else [],
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+            self.last_reload = {**report, "finished_at": time.time()}
+            logger.info(f"Reloaded configuration version {self.version}: swapped {report['swapped']}, rebuilt {report['rebuilt']}")
+            return report
+        finally:
+            self._reload_lock.release()
+
+    def reload_in_background(self) -> bool:
+        """Start reload() on a thread of its own, e.g. from a signal handler. False if one is running."""
+        if self._reload_lock.locked():
+            return False
+
+        def run():
+            try:
+                self.reload()
+            except ReloadInProgress:
+                pass
+            except Exception:
+                logger.exception("Configuration reload failed")
+
+        threading.Thread(target=run, name="config-reload", daemon=True).start()
+        return True
+
+    def _retire(self, pools: List[ReplicaPool], timeout: float):
+        """Unload replaced pools once the requests running or queued on them are done"""
+        if not pools:
+            return
+        self.retiring.extend(pools)
+
+        def drain():
+            deadline = time.monotonic() + timeout
+            waiting = list(pools)
+            while waiting:
+                timed_out = time.monotonic() >= deadline
+                if timed_out:
+                    logger.warning(f"Reload: {[pool.model_identifier for pool in waiting]} still busy after "
+                                   f"{timeout:.0f}s, released without closing")
+                for pool in list(waiting):
+                    if pool.in_flight and not timed_out:
+                        continue
+                    waiting.remove(pool)
+                    if not timed_out:
+                        self._unload([pool])
+                        logger.info(f"Reload: unloaded the previous version of {pool.model_identifier}")
+                    self.retiring = [retiring for retiring in self.retiring if retiring is not pool]
+                    self._retired.append(weakref.ref(pool))
+                if waiting:
+                    time.sleep(0.1)
+
+        threading.Thread(target=drain, name="model-drain", daemon=True).start()
+
+    @staticmethod
+    def _unload(pools: List[ReplicaPool]):
+        """Release what the models hold beyond memory (threads, connections); memory goes with the last reference"""
+        for pool in pools:
+            for replica in pool.replicas:
+                close = getattr(replica.model, "close", None)
+                if callable(close):
+                    try:
+                        close()
+                    except Exception:
+                        logger.exception(f"Closing a replica of {pool.model_identifier} failed")
+
+    def stats(self) -> Dict[str, Any]:
+        """Health and utilization of every loaded replica, with the thread budget behind them"""
+        self._retired = [ref for ref in self._retired if ref() is not None]
+        return {
+            "models": [pool.stats() for pool in list(self.models.values())],
+            "threads": self.thread_budget.to_dict(),
+            "reload": {
+                "version": self.version,
+                "last": self.last_reload,
+                # replaced, with requests still running on them
+                "draining": [{"model": pool.model_identifier, "in_flight": pool.in_flight} for pool in list(self.retiring)],
+                # unloaded, but still referenced (e.g. by realtime sessions started before the reload)
+                "retired_in_use": [ref().model_identifier for ref in self._retired if ref() is not None],
+            },
+        }
     
     def transcribe_file(self, model_identifier: str, audio_file_path: str, **kwargs) -> Dict[str, Any]:
         """
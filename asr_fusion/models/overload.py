@@ -0,0 +1,124 @@
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+from asr_fusion.metrics import registry
+from asr_fusion.models.scheduler import PRIORITIES
+
+logger = logging.getLogger(__name__)
+
+degradations = registry.counter(
+    "asr_degradations_total", "Requests degraded by the overload controller", ("model", "action")
+)
+predicted_wait_gauge = registry.gauge(
+    "asr_predicted_wait_seconds", "Predicted queue wait of a new request", ("model",)
+)
+outstanding_gauge = registry.gauge(
+    "asr_outstanding_audio_seconds", "Audio seconds queued or running", ("model",)
+)
+
+
+class Overloaded(Exception):
+    def __init__(self, model_identifier: str, predicted_wait: float, max_wait: float):
+        """A request was shed because its model can't serve it within the SLO"""
+        super().__init__(
+            f"{model_identifier} is overloaded: predicted wait {predicted_wait:.1f}s exceeds the {max_wait:.1f}s SLO"
+        )
+        self.model_identifier = model_identifier
+        self.predicted_wait = predicted_wait
+        self.max_wait = max_wait
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the queue is expected to be back within the SLO"""
+        return max(1.0, self.predicted_wait - self.max_wait)
+
+
+class OverloadController:
+    def __init__(self, model_manager):
+        """
+        Keeps requests within the per-model latency SLOs of the `slo` configuration section
+
+        A request whose predicted queue wait exceeds its model's max_wait is degraded step by step:
+        up to beam_factor times the SLO it is decoded with min_beam_size; beyond that it goes to the
+        fallback model if that one is within its own SLO; otherwise requests of a priority listed in
+        shed are rejected, and the others are served with min_beam_size anyway.
+
+        Args:
+            model_manager: ModelManager whose loaded pools are observed
+        """
+        self.model_manager = model_manager
+        registry.add_collector(self.collect)
+
+    def slo_for(self, model_identifier: str) -> Dict[str, Any]:
+        return self.model_manager.config.get_slo_config(model_identifier)
+
+    def predicted_wait(self, model_identifier: str) -> float:
+        pool = self.model_manager.models.get(model_identifier)
+        if pool is None:
+            return 0.0
+        return pool.predicted_wait(self.slo_for(model_identifier).get("real_time_factor", 0.5))
+
+    def admit(self, model_identifier: str, audio_seconds: float, priority: str = "interactive",
+              kwargs: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Decide how to serve a request
+
+        Args:
+            model_identifier: Requested model
+            audio_seconds: Audio length of the request
+            priority: One of scheduler.PRIORITIES
+            kwargs: Transcription arguments, beam_size is lowered in place when degraded
+
+        Returns:
+            The model identifier to use, and the applied degradation or None
+
+        Raises:
+            Overloaded: The request is shed
+        """
+        slo = self.slo_for(model_identifier)
+        if not slo or "max_wait" not in slo:
+            return model_identifier, None
+        max_wait = float(slo["max_wait"])
+        wait = self.predicted_wait(model_identifier)
+        if wait <= max_wait:
+            return model_identifier, None
+
+        degradation = {
+            "requested_model": model_identifier,
+            "model": model_identifier,
+            "predicted_wait": round(wait, 3),
+            "max_wait": max_wait,
+        }
+        fallback = slo.get("fallback")
+        fallback_slo = self.slo_for(fallback) if fallback else {}
+        reduce_beam = model_identifier.startswith("faster-whisper/") and kwargs is not None
+
+        if reduce_beam and wait <= max_wait * slo.get("beam_factor", 2.0):
+            action = "beam_size"
+        elif fallback and self.predicted_wait(fallback) <= fallback_slo.get("max_wait", max_wait):
+            action = "fallback"
+            degradation["model"] = fallback
+        elif priority in slo.get("shed", ["batch"]):
+            degradations.inc(model=model_identifier, action="shed")
+            logger.warning(f"Shedding {priority} request of {audio_seconds:.1f}s for {model_identifier}, predicted wait {wait:.1f}s")
+            raise Overloaded(model_identifier, wait, max_wait)
+        elif reduce_beam:
+            action = "beam_size"
+        else:
+            action = "none"
+
+        if action == "beam_size":
+            kwargs["beam_size"] = min(kwargs.get("beam_size", slo.get("min_beam_size", 1)), slo.get("min_beam_size", 1))
+            degradation["beam_size"] = kwargs["beam_size"]
+        degradation["action"] = action
+        degradations.inc(model=model_identifier, action=action)
+        logger.info(f"Degraded {priority} request for {model_identifier}: {action}, predicted wait {wait:.1f}s")
+        return degradation["model"], degradation
+
+    def collect(self):
+        """Refresh the queue gauges, called on every /metrics scrape"""
+        predicted_wait_gauge.clear()
+        outstanding_gauge.clear()
+        for model_identifier, pool in list(self.model_manager.models.items()):
+            predicted_wait_gauge.set(self.predicted_wait(model_identifier), model=model_identifier)
+            outstanding_gauge.set(pool.outstanding_seconds, model=model_identifier)
@@ -0,0 +1,102 @@
+import importlib
+import logging
+import threading
+from importlib.metadata import entry_points
+from typing import Dict, Any, List, Union
+
+logger = logging.getLogger(__name__)
+
+# Entry point group third-party packages use to provide engines, e.g. in their pyproject.toml:
+#   [project.entry-points."asr_fusion.engines"]
+#   my-engine = "my_package.engine:MyEngineModel"
+ENTRY_POINT_GROUP = "asr_fusion.engines"
+
+# Built-in engines as "module:attribute" so nothing is imported until a model is loaded
+BUILTIN_ENGINES = {
+    "faster-whisper": "asr_fusion.models.faster_whisper_model:FasterWhisperModel",
+    "funasr": "asr_fusion.models.funasr_model:FunASRModel",
+    "sensevoice": "asr_fusion.models.sensevoice_model:SenseVoiceModel",
+    "cascade": "asr_fusion.models.cascade_model:CascadeModel",
+    "fusion": "asr_fusion.models.fusion_model:FusionModel",
+    "auto": "asr_fusion.models.language_router:LanguageRouter",
+    "remote": "asr_fusion.models.remote_model:RemoteModel",
+}
+
+
+class EngineRegistry:
+    def __init__(self):
+        """
+        Maps engine names to model classes, importing each class on first use.
+
+        An engine class is constructed through its `from_config(model_name, model_settings, allocation)`
+        classmethod and may set `uses_torch = True` to have torch's thread pools sized before it loads.
+        Engines combining other models set `composite = True` instead and are constructed through
+        `from_manager(model_manager, model_name, model_settings)`, without a thread allocation.
+        """
+        self._targets: Dict[str, Any] = dict(BUILTIN_ENGINES)
+        self._classes: Dict[str, type] = {}
+        self._discovered = False
+        self._lock = threading.Lock()
+
+    def register(self, name: str, target: Union[str, type]):
+        """
+        Register an engine
+
+        Args:
+            name: Engine name used in model identifiers ("name/model_name")
+            target: Engine class, or "module:attribute" string imported on first use
+        """
+        with self._lock:
+            self._targets[name] = target
+            self._classes.pop(name, None)
+
+    def _discover(self):
+        """Collect engines advertised through entry points; reads package metadata only"""
+        if self._discovered:
+            return
+        self._discovered = True
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            # Explicit registrations and built-ins take precedence
+            self._targets.setdefault(entry_point.name, entry_point)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            self._discover()
+            return sorted(self._targets)
+
+    def get(self, name: str) -> type:
+        """
+        Get the class of an engine, importing it if needed
+
+        Args:
+            name: Engine name
+
+        Returns:
+            Engine class
+        """
+        with self._lock:
+            if name in self._classes:
+                return self._classes[name]
+            self._discover()
+            if name not in self._targets:
+                raise ValueError(f"Unsupported engine: {name}")
+
+            target = self._targets[name]
+            if isinstance(target, str):
+                module_name, attribute = target.split(":", 1)
+                engine_cls = getattr(importlib.import_module(module_name), attribute)
+            elif hasattr(target, "load"):
+                engine_cls = target.load()
+            else:
+                engine_cls = target
+            logger.info(f"Loaded engine {name}: {engine_cls.__module__}.{engine_cls.__name__}")
+            self._classes[name] = engine_cls
+            return engine_cls
+
+
+engine_registry = EngineRegistry()
+
+
+def register_engine(name: str, target: Union[str, type]):
+    """Register an engine on the default registry, see EngineRegistry.register"""
+    engine_registry.register(name, target)
@@ -0,0 +1,400 @@
+import bisect
+import contextlib
+import hashlib
+import http.client
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Any, Generator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from asr_fusion.models.replica_pool import audio_duration
+from asr_fusion.models.scheduler import request_context
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_BLOCK = 64 * 1024
+
+
+class RemoteError(Exception):
+    def __init__(self, url: str, status: int, detail: str):
+        """A node answered with an error status"""
+        super().__init__(f"{url} answered {status}: {detail}")
+        self.url = url
+        self.status = status
+        self.detail = detail
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def multipart_body(fields: List[Tuple[str, str]], audio_file_path: str) -> Tuple[str, int, Any]:
+    """
+    multipart/form-data request body with the audio file streamed from disk
+
+    Returns:
+        Content type, content length, and a function returning a fresh iterator over the body
+    """
+    boundary = uuid.uuid4().hex
+    head = b"".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields
+    )
+    filename = os.path.basename(audio_file_path).replace('"', "")
+    head += (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+             f'Content-Type: application/octet-stream\r\n\r\n').encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    length = len(head) + os.path.getsize(audio_file_path) + len(tail)
+
+    def body():
+        yield head
+        with open(audio_file_path, "rb") as f:
+            for block in iter(lambda: f.read(UPLOAD_BLOCK), b""):
+                yield block
+        yield tail
+
+    return f"multipart/form-data; boundary={boundary}", length, body
+
+
+class ConnectionPool:
+    def __init__(self, url: str, max_idle: int = 8, timeout: float = 600.0):
+        """
+        Keep-alive HTTP connections to one node
+
+        Args:
+            url: Base URL of the node, e.g. "http://10.0.0.2:8603"
+            max_idle: Idle connections kept open
+            timeout: Socket timeout of a request in seconds
+        """
+        parts = urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.https else 80)
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle: List[http.client.HTTPConnection] = []
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self, timeout: Optional[float] = None) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        with self._lock:
+            self.opened += 1
+        return cls(self.host, self.port, timeout=timeout or self.timeout)
+
+    def _get(self) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return self._connect(), False
+
+    def _put(self, connection: http.client.HTTPConnection):
+        with self._lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    @contextlib.contextmanager
+    def request(self, method: str, path: str, body=None, headers: Optional[Dict[str, str]] = None,
+                timeout: Optional[float] = None) -> Generator[http.client.HTTPResponse, None, None]:
+        """
+        Send a request and yield the response; the connection goes back to the pool if the
+        response was read to the end
+
+        Args:
+            body: Bytes, or a function returning an iterator over the body, so it can be sent again
+                when an idle connection turns out to be closed by the node
+            timeout: Socket timeout instead of the pool's, on a fresh connection
+        """
+        headers = dict(headers or {})
+        for attempt in range(2):
+            if timeout is not None:
+                connection, reused = self._connect(timeout), False
+            else:
+                connection, reused = self._get()
+            try:
+                connection.request(method, path, body=body() if callable(body) else body, headers=headers)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused and attempt == 0:
+                    # the node closed the idle connection, retry once on a new one
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            break
+
+        try:
+            yield response
+        except BaseException:
+            connection.close()
+            raise
+        if response.isclosed() and not response.will_close and timeout is None:
+            self._put(connection)
+        else:
+            connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+
+class RemoteNode:
+    def __init__(self, index: int, url: str, max_idle: int = 8, timeout: float = 600.0):
+        """One ASR Fusion node serving a model, and the work this node sent to it"""
+        self.index = index
+        self.url = url.rstrip("/")
+        self.pool = ConnectionPool(self.url, max_idle, timeout)
+
+        self.outstanding_seconds = 0.0  # audio seconds sent and not answered yet
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+        self.healthy = True
+        self.last_check = None
+        self.check_latency = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "node": self.url,
+            "healthy": self.healthy,
+            "outstanding_seconds": round(self.outstanding_seconds, 3),
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "audio_seconds": round(self.audio_seconds, 3),
+            "real_time_factor": round(self.busy_seconds / self.audio_seconds, 4) if self.audio_seconds else None,
+            "check_latency": None if self.check_latency is None else round(self.check_latency, 4),
+            "connections": {"opened": self.pool.opened, "idle": len(self.pool.idle)},
+        }
+
+
+class RemoteModel:
+    # Runs on other nodes rather than loaded here
+    composite = True
+
+    def __init__(self, model_name: str, remote_model: str, nodes: List[str], health_interval: float = 5.0,
+                 health_timeout: float = 2.0, max_failures: int = 3, retries: int = 1, virtual_nodes: int = 64,
+                 max_idle_connections: int = 8, timeout: float = 600.0):
+        """
+        Serves a model from other ASR Fusion nodes over their HTTP API
+
+        Requests go to the healthy node with the least outstanding audio; requests of one streaming
+        session (session=...) stick to one node, chosen on a consistent hash ring, so that adding or
+        losing a node moves only the sessions of that node. Nodes are health checked in the
+        background and a node failing max_failures requests in a row is out of rotation until it
+        passes a check again. Failed requests are retried on other nodes.
+
+        Args:
+            model_name: Name of the remote model (e.g., "large-v3" of "remote/large-v3")
+            remote_model: Model identifier requested from the nodes (e.g., "faster-whisper/large-v3")
+            nodes: Base URLs of the nodes
+            health_interval: Seconds between health checks of each node
+            health_timeout: Socket timeout of a health check
+            max_failures: Consecutive failures after which a node is taken out of rotation
+            retries: Other nodes tried after a failed request
+            virtual_nodes: Points of each node on the hash ring
+            max_idle_connections: Keep-alive connections kept per node
+            timeout: Socket timeout of a transcription request
+        """
+        if not nodes:
+            raise ValueError(f"Remote model {model_name} has no nodes")
+        self.model_name = model_name
+        self.remote_model = remote_model
+        self.nodes = [RemoteNode(index, url, max_idle_connections, timeout) for index, url in enumerate(nodes)]
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.max_failures = max_failures
+        self.retries = retries
+
+        self.ring = sorted((_hash(f"{node.url}#{i}"), node.index) for node in self.nodes for i in range(virtual_nodes))
+        self._ring_keys = [key for key, _ in self.ring]
+        self._lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._checker = threading.Thread(target=self._check_loop, name=f"remote-health-{model_name}", daemon=True)
+        self._checker.start()
+
+    @classmethod
+    def from_manager(cls, model_manager, model_name: str, model_settings: Dict[str, Any]) -> "RemoteModel":
+        """
+        Create the remote model from its configuration under `model.remote`
+
+        Args:
+            model_manager: ModelManager the model is loaded by
+            model_name: Name of the remote model
+            model_settings: Engine and model settings from the configuration, with `nodes` and
+                `model`, the identifier requested from the nodes (faster-whisper/<model_name> by default)
+        """
+        return cls(
+            model_name=model_name,
+            remote_model=model_settings.get("model", f"faster-whisper/{model_name}"),
+            nodes=model_settings.get("nodes", []) or [],
+            health_interval=model_settings.get("health_interval", 5.0),
+            health_timeout=model_settings.get("health_timeout", 2.0),
+            max_failures=model_settings.get("max_failures", 3),
+            retries=model_settings.get("retries", 1),
+            virtual_nodes=model_settings.get("virtual_nodes", 64),
+            max_idle_connections=model_settings.get("max_idle_connections", 8),
+            timeout=model_settings.get("timeout", 600.0),
+        )
+
+    def check(self, node: RemoteNode) -> bool:
+        """Health check a node, taking it in or out of rotation"""
+        start = time.time()
+        try:
+            with node.pool.request("GET", "/health", timeout=self.health_timeout) as response:
+                response.read()
+                healthy = response.status == 200
+        except (OSError, http.client.HTTPException):
+            healthy = False
+        with self._lock:
+            node.last_check = time.time()
+            if healthy:
+                node.check_latency = node.last_check - start
+                node.consecutive_failures = 0
+            if healthy != node.healthy:
+                logger.warning(f"{self.model_name}: node {node.url} is {'back' if healthy else 'down'}")
+            node.healthy = healthy
+        return healthy
+
+    def _check_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for node in self.nodes:
+                self.check(node)
+
+    def close(self):
+        self._stop.set()
+        for node in self.nodes:
+            node.pool.close()
+
+    def _pick(self, session: Optional[str], exclude: List[RemoteNode]) -> RemoteNode:
+        """Node for a request; called with the lock held"""
+        candidates = [node for node in self.nodes if node.healthy and node not in exclude]
+        # With every node failing keep trying rather than rejecting everything
+        candidates = candidates or [node for node in self.nodes if node not in exclude] or self.nodes
+        if session is None:
+            return min(candidates, key=lambda n: (n.outstanding_seconds, n.in_flight, n.index))
+        start = bisect.bisect(self._ring_keys, _hash(session))
+        for offset in range(len(self.ring)):
+            node = self.nodes[self.ring[(start + offset) % len(self.ring)][1]]
+            if node in candidates:
+                return node
+        return candidates[0]
+
+    @contextlib.contextmanager
+    def _reserve(self, audio_seconds: float, session: Optional[str], exclude: List[RemoteNode]):
+        with self._lock:
+            node = self._pick(session, exclude)
+            node.outstanding_seconds += audio_seconds
+            node.in_flight += 1
+        start = time.time()
+        try:
+            yield node
+        except Exception:
+            with self._lock:
+                node.failed += 1
+                node.consecutive_failures += 1
+                if node.healthy and node.consecutive_failures >= self.max_failures:
+                    node.healthy = False
+                    logger.warning(f"{self.model_name}: node {node.url} taken out of rotation "
+                                   f"after {node.consecutive_failures} consecutive failures")
+            raise
+        else:
+            with self._lock:
+                node.completed += 1
+                node.consecutive_failures = 0
+                node.audio_seconds += audio_seconds
+                node.busy_seconds += time.time() - start
+        finally:
+            with self._lock:
+                node.outstanding_seconds -= audio_seconds
+                node.in_flight -= 1
+
+    def _fields(self, kwargs: Dict[str, Any], stream: bool) -> List[Tuple[str, str]]:
+        fields = [("model", self.remote_model), ("stream", "true" if stream else "false")]
+        for name, field in (("language", "language"), ("initial_prompt", "prompt"), ("temperature", "temperature")):
+            if kwargs.get(name) is not None:
+                fields.append((field, str(kwargs[name])))
+        for granularity in kwargs.get("timestamp_granularities") or []:
+            fields.append(("timestamp_granularities", granularity))
+        ignored = set(kwargs) - {"language", "initial_prompt", "temperature", "timestamp_granularities", "cancel", "checkpoint"}
+        if ignored:
+            logger.debug(f"{self.model_name}: not sent to the nodes: {', '.join(sorted(ignored))}")
+        return fields
+
+    def _headers(self, content_type: str, length: int) -> Dict[str, str]:
+        # the nodes schedule the request for the same tenant and priority
+        tenant, priority = request_context.get()
+        return {"Content-Type": content_type, "Content-Length": str(length), "X-Tenant": tenant, "X-Priority": priority}
+
+    def _post(self, audio_file_path: str, kwargs: Dict[str, Any], stream: bool):
+        """Yield (node, response) of the first node that accepts the request"""
+        session = kwargs.pop("session", None)
+        content_type, length, body = multipart_body(self._fields(kwargs, stream), audio_file_path)
+        headers = self._headers(content_type, length)
+        duration = audio_duration(audio_file_path)
+        tried = []
+        answered = False
+        while True:
+            try:
+                with self._reserve(duration, session, tried) as node:
+                    tried.append(node)
+                    with node.pool.request("POST", "/v1/audio/transcriptions", body, headers) as response:
+                        if response.status != 200:
+                            raise RemoteError(node.url, response.status, response.read().decode("utf-8", "replace"))
+                        answered = True
+                        yield node, response
+                return
+            except (OSError, http.client.HTTPException, RemoteError) as e:
+                # once events were passed on the request can't be repeated elsewhere
+                retryable = not answered and (not isinstance(e, RemoteError) or e.status >= 500 or e.status == 429)
+                if not retryable or len(tried) > self.retries or len(tried) >= len(self.nodes):
+                    raise
+                logger.warning(f"{self.model_name}: retrying on another node after {e}")
+
+    def transcribe_file(self, audio_file_path: str, **kwargs) -> Dict[str, Any]:
+        """
+        Transcribe an audio file on one of the nodes
+
+        Args:
+            audio_file_path: Path to the audio file
+            **kwargs: Additional arguments for transcription; session keeps requests of one session on one node
+
+        Returns:
+            Dictionary with the node's transcription result, and the node under "remote"
+        """
+        for node, response in self._post(audio_file_path, kwargs, stream=False):
+            result = json.loads(response.read())
+            result["remote"] = {"model": self.remote_model, "node": node.url}
+        return result
+
+    def transcribe_file_to_streaming(self, audio_file_path: str, **kwargs) -> Generator[Dict[str, Any], None, None]:
+        """
+        Transcribe an audio file on one of the nodes and pass on its events as they arrive
+        """
+        for node, response in self._post(audio_file_path, kwargs, stream=True):
+            for line in response:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                event = json.loads(line[5:])
+                if event.get("type") == "transcript.text.done":
+                    event["remote"] = {"model": self.remote_model, "node": node.url}
+                yield event
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"model": self.remote_model, "nodes": [node.to_dict() for node in self.nodes]}
@@ -0,0 +1,239 @@
+import contextlib
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, Any, List, Generator
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+
+def audio_duration(audio) -> float:
+    """
+    Duration in seconds of an audio file path or a 16 kHz sample array, 0.0 if it can't be read cheaply
+
+    Only the container header is read, the audio itself is not decoded.
+    """
+    if not isinstance(audio, (str, os.PathLike)):
+        return len(audio) / SAMPLING_RATE
+    try:
+        import soundfile
+        return soundfile.info(audio).duration
+    except Exception:
+        pass
+    try:
+        import librosa
+        return librosa.get_duration(path=audio)
+    except Exception:
+        return 0.0
+
+
+class Replica:
+    def __init__(self, index: int, model: Any, allocation=None):
+        """
+        One loaded copy of a model and its share of the machine
+
+        Args:
+            index: Replica index within its pool
+            model: Loaded model instance
+            allocation: ThreadAllocation of the replica, None when the model is not budgeted
+        """
+        self.index = index
+        self.model = model
+        self.allocation = allocation
+
+        self.outstanding_seconds = 0.0  # audio seconds queued or running on this replica
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.audio_seconds = 0.0  # audio seconds completed
+        self.busy_seconds = 0.0  # wall seconds spent transcribing
+        self.healthy = True
+        self.unhealthy_since = None
+        self.created = time.time()
+
+    def pinned(self):
+        return self.allocation.pinned() if self.allocation else nullcontext()
+
+    def to_dict(self) -> Dict[str, Any]:
+        uptime = max(time.time() - self.created, 1e-6)
+        return {
+            "replica": self.index,
+            "healthy": self.healthy,
+            "outstanding_seconds": round(self.outstanding_seconds, 3),
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "audio_seconds": round(self.audio_seconds, 3),
+            "busy_seconds": round(self.busy_seconds, 3),
+            # share of wall time spent transcribing; above 1.0 when requests overlap on CTranslate2 workers
+            "utilization": round(self.busy_seconds / uptime, 4),
+            "real_time_factor": round(self.busy_seconds / self.audio_seconds, 4) if self.audio_seconds else None,
+            "threads": self.allocation.to_dict() if self.allocation else None,
+            # engine specific counters, e.g. of composite models
+            "engine": self.model.stats() if hasattr(self.model, "stats") else None,
+        }
+
+
+class ReplicaPool:
+    def __init__(self, model_identifier: str, replicas: List[Replica], max_failures: int = 3, retry_after: float = 30.0,
+                 scheduler=None):
+        """
+        Routes each request to the replica with the least outstanding audio
+
+        Args:
+            model_identifier: Model identifier in the format "engine/model_name"
+            replicas: Loaded replicas of the model
+            max_failures: Consecutive failures after which a replica is taken out of rotation
+            retry_after: Seconds before an unhealthy replica is given another request
+            scheduler: FairScheduler admitting requests to the replicas, None to admit all at once
+        """
+        self.model_identifier = model_identifier
+        self.replicas = replicas
+        self.max_failures = max_failures
+        self.retry_after = retry_after
+        self.scheduler = scheduler
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> Any:
+        """The first replica's model, for callers that only need its attributes"""
+        return self.replicas[0].model
+
+    @property
+    def queued_seconds(self) -> float:
+        """Audio seconds waiting for the scheduler to admit them"""
+        return self.scheduler.queued_seconds if self.scheduler is not None else 0.0
+
+    @property
+    def in_flight(self) -> int:
+        """Requests running on the replicas or waiting for the scheduler"""
+        waiting = len(self.scheduler.waiting) if self.scheduler is not None else 0
+        return sum(replica.in_flight for replica in self.replicas) + waiting
+
+    @property
+    def outstanding_seconds(self) -> float:
+        return sum(replica.outstanding_seconds for replica in self.replicas) + self.queued_seconds
+
+    def predicted_wait(self, default_real_time_factor: float = 0.5) -> float:
+        """
+        Seconds a new request would wait before the least loaded replica starts on it
+
+        Estimated from each replica's outstanding audio and measured real time factor, shared
+        among the transcriptions the model runs in parallel (num_workers), plus the audio still
+        waiting in the scheduler spread over all of them.
+
+        Args:
+            default_real_time_factor: Processing seconds per audio second of replicas without history
+        """
+        queued = self.queued_seconds
+        with self._lock:
+            waits = []
+            rates = []
+            for replica in self._available():
+                rtf = replica.busy_seconds / replica.audio_seconds if replica.audio_seconds else default_real_time_factor
+                parallel = max(1, getattr(replica.model, "num_workers", 1))
+                waits.append(replica.outstanding_seconds * rtf / parallel)
+                rates.append(parallel / rtf if rtf > 0 else float("inf"))
+            return min(waits) + (queued / sum(rates) if queued else 0.0)
+
+    def _available(self) -> List[Replica]:
+        now = time.time()
+        available = [
+            replica for replica in self.replicas
+            if replica.healthy or now - replica.unhealthy_since >= self.retry_after
+        ]
+        # With every replica failing keep serving rather than rejecting everything
+        return available or self.replicas
+
+    def _pick(self) -> Replica:
+        return min(self._available(), key=lambda r: (r.outstanding_seconds, r.in_flight, r.index))
+
+    @contextlib.contextmanager
+    def acquire(self, audio_seconds: float, pin: bool = True) -> Generator[Replica, None, None]:
+        """
+        Reserve the least loaded replica for a request of the given audio length, once the
+        scheduler admits it
+
+        Args:
+            audio_seconds: Audio length of the request, the unit of outstanding work
+            pin: Pin the calling thread to the replica's cores while the block runs
+        """
+        with self._scheduled(audio_seconds, pin) as (replica, _):
+            yield replica
+
+    @contextlib.contextmanager
+    def _scheduled(self, audio_seconds: float, pin: bool = True):
+        """acquire(), also yielding the checkpoint to call between chunks of work (None without a scheduler)"""
+        if self.scheduler is None:
+            with self._reserve(audio_seconds, pin) as replica:
+                yield replica, None
+            return
+        with self.scheduler.slot(audio_seconds) as ticket:
+            with self._reserve(audio_seconds, pin) as replica:
+                yield replica, functools.partial(self.scheduler.checkpoint, ticket)
+
+    @contextlib.contextmanager
+    def _reserve(self, audio_seconds: float, pin: bool = True) -> Generator[Replica, None, None]:
+        with self._lock:
+            replica = self._pick()
+            replica.outstanding_seconds += audio_seconds
+            replica.in_flight += 1
+
+        start = time.time()
+        try:
+            with replica.pinned() if pin else nullcontext():
+                yield replica
+        except Exception:
+            with self._lock:
+                replica.failed += 1
+                replica.consecutive_failures += 1
+                if replica.consecutive_failures >= self.max_failures:
+                    if replica.healthy:
+                        logger.warning(f"{self.model_identifier} replica {replica.index} marked unhealthy")
+                    replica.healthy = False
+                    replica.unhealthy_since = time.time()
+            raise
+        else:
+            with self._lock:
+                replica.completed += 1
+                replica.consecutive_failures = 0
+                replica.audio_seconds += audio_seconds
+                replica.healthy = True
+        finally:
+            with self._lock:
+                replica.outstanding_seconds = max(0.0, replica.outstanding_seconds - audio_seconds)
+                replica.in_flight -= 1
+                replica.busy_seconds += time.time() - start
+
+    def transcribe_file(self, audio_file_path: str, **kwargs) -> Dict[str, Any]:
+        with self._scheduled(audio_duration(audio_file_path)) as (replica, checkpoint):
+            if checkpoint is not None:
+                kwargs["checkpoint"] = checkpoint
+            return replica.model.transcribe_file(audio_file_path, **kwargs)
+
+    def transcribe_file_to_streaming(self, audio_file_path: str, **kwargs) -> Generator[Dict[str, Any], None, None]:
+        # The replica stays reserved until the stream is exhausted or closed. Not pinned, since
+        # a streaming response may resume the generator on a different thread each time.
+        with self._scheduled(audio_duration(audio_file_path), pin=False) as (replica, checkpoint):
+            if checkpoint is not None:
+                kwargs["checkpoint"] = checkpoint
+            yield from replica.model.transcribe_file_to_streaming(audio_file_path, **kwargs)
+
+    def detect_language(self, audio, **kwargs) -> Dict[str, Any]:
+        with self.acquire(audio_duration(audio)) as replica:
+            return replica.model.detect_language(audio, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "model": self.model_identifier,
+                "replicas": [replica.to_dict() for replica in self.replicas],
+                "outstanding_seconds": round(self.outstanding_seconds, 3),
+                "scheduler": self.scheduler.stats() if self.scheduler is not None else None,
+            }
@@ -0,0 +1,260 @@
+import contextlib
+import contextvars
+import hashlib
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, Any, Generator, Iterable, Optional, Tuple
+
+from asr_fusion.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Strict order between the classes, weighted fair sharing between tenants within one
+PRIORITIES = ("realtime", "interactive", "batch")
+PRIORITY_RANK = {priority: rank for rank, priority in enumerate(PRIORITIES)}
+
+DEFAULT_TENANT = "default"
+# Shared tenant of requests beyond max_dynamic_tenants, and metric label of every unconfigured tenant
+OTHER_TENANT = "other"
+
+# (tenant, priority) of the request the current thread works for
+request_context: contextvars.ContextVar = contextvars.ContextVar("request_context", default=(DEFAULT_TENANT, "interactive"))
+
+tenant_audio_seconds = registry.counter(
+    "asr_tenant_audio_seconds_total", "Audio seconds admitted per tenant", ("tenant", "priority")
+)
+scheduler_wait = registry.histogram(
+    "asr_scheduler_wait_seconds", "Time requests waited for a model slot", ("tenant", "priority")
+)
+
+
+def run_as(tenant: str, priority: str, function, *args, **kwargs):
+    """Call function with the scheduling context of a request, e.g. through run_in_threadpool"""
+    token = request_context.set((tenant, priority))
+    try:
+        return function(*args, **kwargs)
+    finally:
+        request_context.reset(token)
+
+
+def tenant_of(config: Dict[str, Any], api_key: Optional[str] = None, tenant: Optional[str] = None) -> str:
+    """
+    Tenant of a request: the tenant its API key is mapped to in `scheduling.api_keys`,
+    otherwise the X-Tenant header, otherwise a tenant per unmapped API key
+    """
+    if api_key:
+        mapped = (config.get("api_keys") or {}).get(api_key)
+        if mapped:
+            return mapped
+    if tenant:
+        return tenant
+    if api_key:
+        return "key-" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    return DEFAULT_TENANT
+
+
+class Ticket:
+    def __init__(self, seq: int, tenant: str, priority: str, cost: float, start_tag: float, finish_tag: float):
+        """One request waiting for or holding a slot"""
+        self.seq = seq
+        self.tenant = tenant
+        self.priority = priority
+        self.cost = cost
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.enqueued = time.time()
+        self.granted = False
+        self.waited = 0.0
+
+    def sort_key(self) -> Tuple[int, float, int]:
+        return PRIORITY_RANK[self.priority], self.start_tag, self.seq
+
+
+class TenantStats:
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.finish_tag = 0.0  # virtual time at which the tenant's admitted work is done
+        self.audio_seconds = 0.0
+        self.requests = 0
+        self.waiting = 0
+        self.running = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.yields = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "weight": self.weight,
+            "audio_seconds": round(self.audio_seconds, 3),
+            "requests": self.requests,
+            "waiting": self.waiting,
+            "running": self.running,
+            "mean_wait_seconds": round(self.wait_seconds / self.requests, 3) if self.requests else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+            "yields": self.yields,
+        }
+
+
+class FairScheduler:
+    def __init__(self, name: str, capacity: int, weights: Optional[Dict[str, float]] = None, default_weight: float = 1.0,
+                 known_tenants: Optional[Iterable[str]] = None, max_dynamic_tenants: int = 1000):
+        """
+        Admits requests to a model's workers by priority class, then by weighted fair share of audio seconds
+
+        Start-time fair queueing: a request of cost c (audio seconds) from a tenant of weight w gets the
+        start tag max(virtual time, the tenant's previous finish tag) and the finish tag start + c / w;
+        free slots go to the waiting request of the highest class with the smallest start tag. A tenant
+        submitting a large backlog thus only gets its weighted share while others are waiting.
+
+        Tenant names come from request headers, so the ones not in the configuration are bounded: at most
+        max_dynamic_tenants of them are tracked, idle ones whose share is used up are forgotten to make
+        room, and beyond that new ones share the tenant "other". Metrics label them all "other".
+
+        Args:
+            name: Model identifier, for logs and stats
+            capacity: Requests that may run at once (the model's replicas times their workers)
+            weights: Weight per tenant
+            default_weight: Weight of tenants not in weights
+            known_tenants: Configured tenants besides those in weights (e.g. targets of API keys), labeled by name
+            max_dynamic_tenants: Unconfigured tenants tracked at once
+
+        Raises:
+            ValueError: If a weight is not positive
+        """
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.weights = {tenant: float(weight) for tenant, weight in (weights or {}).items()}
+        self.default_weight = float(default_weight)
+        for tenant, weight in [*self.weights.items(), ("default_weight", self.default_weight)]:
+            if not weight > 0:
+                raise ValueError(f"Scheduling weight of {tenant} for {name} must be positive, got {weight}")
+        self.known_tenants = {DEFAULT_TENANT, OTHER_TENANT} | set(self.weights) | set(known_tenants or ())
+        self.max_dynamic_tenants = max_dynamic_tenants
+        self.dynamic_tenants = 0
+        self.virtual_time = 0.0
+        self.running = 0
+        self.waiting = []
+        self.tenants: Dict[str, TenantStats] = {}
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+
+    def _tenant(self, tenant: str) -> TenantStats:
+        if tenant not in self.tenants:
+            self.tenants[tenant] = TenantStats(self.weights.get(tenant, self.default_weight))
+            self.dynamic_tenants += tenant not in self.known_tenants
+        return self.tenants[tenant]
+
+    def _admit_tenant(self, tenant: str) -> str:
+        """The tenant a request is scheduled as, within max_dynamic_tenants; called with the condition held"""
+        if tenant in self.tenants or tenant in self.known_tenants:
+            return tenant
+        if self.dynamic_tenants >= self.max_dynamic_tenants:
+            # an idle tenant whose finish tag the virtual time has passed has no share left to remember
+            for name, stats in list(self.tenants.items()):
+                if (name not in self.known_tenants and not stats.waiting and not stats.running
+                        and stats.finish_tag <= self.virtual_time):
+                    del self.tenants[name]
+                    self.dynamic_tenants -= 1
+        if self.dynamic_tenants >= self.max_dynamic_tenants:
+            return OTHER_TENANT
+        return tenant
+
+    def label(self, tenant: str) -> str:
+        """Metric label of a tenant: its name if configured, "other" otherwise"""
+        return tenant if tenant in self.known_tenants else OTHER_TENANT
+
+    def _dispatch(self):
+        """Hand free slots to the best waiting tickets; called with the condition held"""
+        granted = False
+        while self.running < self.capacity and self.waiting:
+            ticket = min(self.waiting, key=Ticket.sort_key)
+            self.waiting.remove(ticket)
+            ticket.granted = True
+            self.running += 1
+            self.virtual_time = max(self.virtual_time, ticket.start_tag)
+            stats = self._tenant(ticket.tenant)
+            stats.waiting -= 1
+            stats.running += 1
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def _wait_for_slot(self, ticket: Ticket):
+        """Queue the ticket and block until it holds a slot; called with the condition held"""
+        ticket.granted = False
+        self._tenant(ticket.tenant).waiting += 1
+        self.waiting.append(ticket)
+        self._dispatch()
+        start = time.time()
+        while not ticket.granted:
+            self._condition.wait()
+        ticket.waited += time.time() - start
+
+    def _release_slot(self, ticket: Ticket):
+        """Called with the condition held"""
+        self.running -= 1
+        self._tenant(ticket.tenant).running -= 1
+        self._dispatch()
+
+    @contextlib.contextmanager
+    def slot(self, cost: float, tenant: Optional[str] = None, priority: Optional[str] = None) -> Generator[Ticket, None, None]:
+        """
+        Hold one of the model's slots while the block runs
+
+        Args:
+            cost: Audio seconds of the request
+            tenant, priority: Scheduling context, by default the one of request_context
+        """
+        context_tenant, context_priority = request_context.get()
+        tenant = tenant or context_tenant
+        priority = priority or context_priority
+        with self._condition:
+            tenant = self._admit_tenant(tenant)
+            stats = self._tenant(tenant)
+            start_tag = max(self.virtual_time, stats.finish_tag)
+            stats.finish_tag = start_tag + cost / stats.weight
+            ticket = Ticket(next(self._seq), tenant, priority, cost, start_tag, stats.finish_tag)
+            self._wait_for_slot(ticket)
+            stats.requests += 1
+            stats.audio_seconds += cost
+            stats.wait_seconds += ticket.waited
+            stats.max_wait_seconds = max(stats.max_wait_seconds, ticket.waited)
+        tenant_audio_seconds.inc(cost, tenant=self.label(tenant), priority=priority)
+        scheduler_wait.observe(ticket.waited, tenant=self.label(tenant), priority=priority)
+        try:
+            yield ticket
+        finally:
+            with self._condition:
+                self._release_slot(ticket)
+
+    @property
+    def queued_seconds(self) -> float:
+        """Audio seconds of the waiting requests"""
+        with self._condition:
+            return sum(ticket.cost for ticket in self.waiting)
+
+    def checkpoint(self, ticket: Ticket):
+        """
+        Called by a running request between chunks of work (e.g. segments). A batch request gives
+        its slot to waiting requests of a higher class and continues once it gets one again.
+        """
+        if ticket.priority != "batch":
+            return
+        with self._condition:
+            if not any(PRIORITY_RANK[t.priority] < PRIORITY_RANK["batch"] for t in self.waiting):
+                return
+            self._tenant(ticket.tenant).yields += 1
+            self._release_slot(ticket)
+            self._wait_for_slot(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "capacity": self.capacity,
+                "running": self.running,
+                "waiting": len(self.waiting),
+                "virtual_time": round(self.virtual_time, 3),
+                "tenants": {tenant: stats.to_dict() for tenant, stats in self.tenants.items()},
+            }
@@ -5,6 +5,8 @@ from typing import Dict, Any, Generator
 import os
 
 class SenseVoiceModel:
+    uses_torch = True
+
     def __init__(self, model_name: str, model_path: str = ".", device: str = "cpu"):
         """
         Initialize SenseVoice model
@@ -21,6 +23,22 @@ class SenseVoiceModel:
         # Initialize the model
         # This is a placeholder - actual implementation would depend on SenseVoice API
         print(f"Initializing SenseVoice model: {model_name}")
+
+    @classmethod
+    def from_config(cls, model_name: str, model_settings: Dict[str, Any], allocation=None) -> "SenseVoiceModel":
+        """
+        Create the model from its config.yaml settings
+        
+        Args:
+            model_name: Name of the model
+            model_settings: Engine and model settings from the configuration
+            allocation: ThreadAllocation for this replica (unused by the placeholder)
+        """
+        return cls(
+            model_name=model_name,
+            model_path=model_settings.get("path", model_name),
+            device=model_settings.get("device", "cpu")
+        )
     
     def transcribe_file(self, audio_file_path: str, **kwargs) -> Dict[str, Any]:
         """
@@ -0,0 +1,323 @@
+import logging
+import queue
+import threading
+from typing import Dict, Any, Generator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+# Content types of raw PCM bodies, and the sample format each implies
+PCM_CONTENT_TYPES = {
+    "audio/pcm": "s16le",
+    "audio/l16": "s16be",  # RFC 2586: network byte order
+    "audio/x-raw": "s16le",
+}
+PCM_DTYPES = {"s16le": "<i2", "s16be": ">i2", "f32le": "<f4"}
+
+
+def parse_content_type(content_type: str) -> Tuple[str, Dict[str, str]]:
+    """Media type (lower case) and parameters of a Content-Type header"""
+    media_type, *params = [part.strip() for part in (content_type or "").split(";")]
+    parameters = {}
+    for param in params:
+        if "=" in param:
+            name, value = param.split("=", 1)
+            parameters[name.strip().lower()] = value.strip().strip('"')
+    return media_type.lower(), parameters
+
+
+def is_audio_body(content_type: str) -> bool:
+    """Whether a request body is audio itself rather than a form"""
+    media_type, _ = parse_content_type(content_type)
+    return media_type.startswith("audio/") or media_type in ("video/webm", "application/ogg", "application/octet-stream")
+
+
+class BytePipe:
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024):
+        """
+        Blocking file-like pipe from the request body to the decoder thread
+
+        Writers block while max_bytes are buffered, so a slow decoder slows down the upload
+        instead of the body piling up in memory.
+        """
+        self.max_bytes = max_bytes
+        self._chunks: List[bytes] = []
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def write(self, data: bytes):
+        with self._condition:
+            while self._size >= self.max_bytes and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                raise ValueError("write to a closed pipe")
+            self._chunks.append(data)
+            self._size += len(data)
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def read(self, size: int = -1) -> bytes:
+        """Block until data or the end of the body; b"" only at the end"""
+        with self._condition:
+            while not self._chunks and not self._closed:
+                self._condition.wait()
+            if not self._chunks:
+                return b""
+            data = b"".join(self._chunks)
+            if 0 <= size < len(data):
+                self._chunks = [data[size:]]
+                data = data[:size]
+            else:
+                self._chunks = []
+            self._size -= len(data)
+            self._condition.notify_all()
+            return data
+
+
+class StreamDecoder:
+    def __init__(self, max_queued_seconds: float = 120.0):
+        """
+        Turns request body bytes, written as they arrive, into 16 kHz mono float32 sample blocks
+
+        Args:
+            max_queued_seconds: Decoded audio held for the model before writes block
+        """
+        self._samples: queue.Queue = queue.Queue()
+        self._queued = threading.BoundedSemaphore(max(1, int(max_queued_seconds)))
+        self.received_bytes = 0
+        self.decoded_seconds = 0.0
+        self.error: Optional[BaseException] = None
+        self.aborted = threading.Event()
+
+    def write(self, data: bytes):
+        raise NotImplementedError
+
+    def close(self):
+        """The body ended"""
+        raise NotImplementedError
+
+    def abort(self):
+        """The consumer is gone: make writes fail rather than block"""
+        self.aborted.set()
+
+    def _put(self, samples: np.ndarray):
+        # blocks of at most one second, so the semaphore counts seconds
+        for start in range(0, len(samples), SAMPLING_RATE):
+            while not self._queued.acquire(timeout=0.5):
+                if self.aborted.is_set():
+                    raise RuntimeError("Transcription of the upload stopped")
+            block = samples[start:start + SAMPLING_RATE]
+            self.decoded_seconds += len(block) / SAMPLING_RATE
+            self._samples.put(block)
+
+    def _end(self, error: Optional[BaseException] = None):
+        self.error = error
+        self._samples.put(None)
+
+    def samples(self) -> Generator[np.ndarray, None, None]:
+        """Sample blocks as they are decoded, until the body ends; raises decoding errors"""
+        while True:
+            block = self._samples.get()
+            if block is None:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._queued.release()
+            yield block
+
+
+class PCMDecoder(StreamDecoder):
+    def __init__(self, sample_format: str = "s16le", rate: int = SAMPLING_RATE, channels: int = 1, **kwargs):
+        """
+        Raw interleaved PCM
+
+        Args:
+            sample_format: "s16le", "s16be" or "f32le"
+            rate: Sample rate of the body
+            channels: Channels of the body, mixed down to mono
+        """
+        super().__init__(**kwargs)
+        if sample_format not in PCM_DTYPES:
+            raise ValueError(f"Unsupported PCM format {sample_format}, expected one of {', '.join(PCM_DTYPES)}")
+        self.dtype = np.dtype(PCM_DTYPES[sample_format])
+        self.rate = rate
+        self.channels = channels
+        self._frame_bytes = self.dtype.itemsize * channels
+        self._rest = b""
+        self._position = 0.0  # position in source samples of the next resampled output sample
+        self._tail = np.zeros(0, dtype=np.float32)  # last source sample of the previous block
+
+    def write(self, data: bytes):
+        self.received_bytes += len(data)
+        data = self._rest + data
+        usable = len(data) - len(data) % self._frame_bytes
+        self._rest = data[usable:]
+        if not usable:
+            return
+        samples = np.frombuffer(data[:usable], dtype=self.dtype).astype(np.float32)
+        if self.dtype.kind == "i":
+            samples /= 32768.0
+        samples = samples.reshape(-1, self.channels).mean(axis=1)
+        if self.rate != SAMPLING_RATE:
+            samples = self._resample(samples)
+        self._put(samples)
+
+    def _resample(self, samples: np.ndarray) -> np.ndarray:
+        # linear interpolation, continuous across blocks: each block starts with the last sample of the
+        # previous one, so the output samples between two blocks are interpolated between them
+        samples = np.concatenate([self._tail, samples])
+        self._tail = samples[-1:]
+        step = self.rate / SAMPLING_RATE
+        positions = np.arange(self._position, len(samples) - 1, step)
+        # positions from here on are relative to the next block, whose first sample is this one's last
+        last = len(samples) - 1
+        self._position = (positions[-1] + step - last) if len(positions) else self._position - last
+        if not len(positions):
+            return np.zeros(0, dtype=np.float32)
+        return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+    def close(self):
+        self._end()
+
+
+class ContainerDecoder(StreamDecoder):
+    def __init__(self, **kwargs):
+        """
+        A streamable container (Ogg/Opus, WebM, MP3, ADTS AAC, FLAC, WAV...), decoded with PyAV in
+        a thread as the bytes arrive. MP4/M4A files with the index at the end can't be decoded
+        before they are complete.
+        """
+        super().__init__(**kwargs)
+        self.pipe = BytePipe()
+        self._thread = threading.Thread(target=self._decode, name="upload-decoder", daemon=True)
+        self._thread.start()
+
+    def write(self, data: bytes):
+        self.received_bytes += len(data)
+        self.pipe.write(data)
+
+    def close(self):
+        self.pipe.close()
+
+    def abort(self):
+        super().abort()
+        self.pipe.close()
+
+    def _decode(self):
+        import av
+        try:
+            resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=SAMPLING_RATE)
+            with av.open(self.pipe, mode="r") as container:
+                for frame in container.decode(audio=0):
+                    for resampled in resampler.resample(frame):
+                        self._put(resampled.to_ndarray().reshape(-1).astype(np.float32) / 32768.0)
+                for resampled in resampler.resample(None):
+                    self._put(resampled.to_ndarray().reshape(-1).astype(np.float32) / 32768.0)
+        except Exception as e:
+            logger.warning(f"Failed to decode uploaded audio: {e}")
+            self.pipe.close()
+            self._end(e)
+            return
+        # drain whatever follows the audio, so the uploader doesn't block on a full pipe
+        while self.pipe.read(64 * 1024):
+            pass
+        self._end()
+
+
+def decoder_for(content_type: str, **kwargs) -> StreamDecoder:
+    """
+    Decoder of a request body by its Content-Type: audio/pcm (rate, channels, format parameters),
+    audio/L16 (rate, channels), anything else is probed as a container
+    """
+    media_type, params = parse_content_type(content_type)
+    if media_type in PCM_CONTENT_TYPES:
+        return PCMDecoder(
+            sample_format=params.get("format", PCM_CONTENT_TYPES[media_type]).lower(),
+            rate=int(params.get("rate", SAMPLING_RATE)),
+            channels=int(params.get("channels", 1)),
+            **kwargs,
+        )
+    return ContainerDecoder(**kwargs)
+
+
+class WindowedTranscriber:
+    def __init__(self, model, window: float = 30.0, prompt_chars: int = 200, **kwargs):
+        """
+        Transcribes audio arriving block by block in windows, committing text as it goes
+
+        Each full window is transcribed; all its segments but the last are committed and the audio
+        from the end of the last committed one is carried into the next window, so no sentence is cut
+        at a window boundary. The committed text is the prompt of the next window, and the language
+        found in the first window is kept for the rest.
+
+        Args:
+            model: ReplicaPool of a model that transcribes sample arrays (faster-whisper)
+            window: Seconds of audio per decode
+            prompt_chars: Characters of committed text passed as the prompt of the next window
+            **kwargs: Transcription arguments; initial_prompt is used for the first window only
+        """
+        self.model = model
+        self.window = window
+        self.prompt_chars = prompt_chars
+        self.kwargs = kwargs
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.offset = 0.0  # position of the buffer in the whole audio
+        self.committed: List[str] = []
+        self.language = kwargs.get("language")
+        self.windows = 0
+
+    def feed(self, samples: np.ndarray) -> Generator[Dict[str, Any], None, None]:
+        """Add audio, yielding "transcript.text.delta" events of the text it completes"""
+        self.buffer = np.concatenate([self.buffer, samples])
+        while len(self.buffer) >= self.window * SAMPLING_RATE:
+            yield from self._decode(final=False)
+
+    def finish(self) -> Generator[Dict[str, Any], None, None]:
+        """Transcribe the rest, then yield "transcript.text.done" """
+        if len(self.buffer) >= 0.1 * SAMPLING_RATE:
+            yield from self._decode(final=True)
+        yield {
+            "type": "transcript.text.done",
+            "language": self.language,
+            "duration": round(self.offset + len(self.buffer) / SAMPLING_RATE, 3),
+            "text": "".join(self.committed).strip(),
+        }
+
+    def _decode(self, final: bool) -> Generator[Dict[str, Any], None, None]:
+        kwargs = dict(self.kwargs, timestamp_granularities=["segments"])
+        if self.language:
+            kwargs["language"] = self.language
+        if self.committed:
+            kwargs["initial_prompt"] = "".join(self.committed)[-self.prompt_chars:]
+        result = self.model.transcribe_file(self.buffer, **kwargs)
+        self.windows += 1
+        self.language = self.language or result.get("language")
+
+        segments = result.get("segments", [])
+        if final:
+            commit, cut = segments, len(self.buffer) / SAMPLING_RATE
+        elif len(segments) > 1 and segments[-2]["end"] > 0:
+            commit, cut = segments[:-1], segments[-2]["end"]
+        else:
+            # nothing to carry over safely: commit the whole window rather than let the buffer grow
+            commit, cut = segments, len(self.buffer) / SAMPLING_RATE
+
+        for segment in commit:
+            self.committed.append(segment["text"])
+            yield {
+                "type": "transcript.text.delta",
+                "delta": segment["text"],
+                "start": round(self.offset + segment["start"], 3),
+                "end": round(self.offset + segment["end"], 3),
+            }
+        cut_samples = min(len(self.buffer), int(cut * SAMPLING_RATE))
+        self.buffer = self.buffer[cut_samples:]
+        self.offset += cut_samples / SAMPLING_RATE
@@ -0,0 +1,264 @@
+import contextlib
+import glob
+import logging
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Built-in engines whose inference runs on torch's intra-op pool rather than CTranslate2 workers
+TORCH_ENGINES = {"funasr", "sensevoice"}
+
+
+def _parse_cpulist(cpulist: str) -> List[int]:
+    """Parse a Linux cpulist string such as "0-3,8-11" into a list of CPU ids"""
+    cpus = []
+    for part in cpulist.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+class CpuTopology:
+    def __init__(self, nodes: Dict[int, List[int]]):
+        """
+        CPU layout of the machine, restricted to the CPUs this process may run on
+
+        Args:
+            nodes: Mapping of NUMA node id to the CPU ids it contains
+        """
+        self.nodes = {node: sorted(cpus) for node, cpus in nodes.items() if cpus}
+
+    @classmethod
+    def detect(cls) -> "CpuTopology":
+        """Read the NUMA layout from sysfs, falling back to a single node"""
+        if hasattr(os, "sched_getaffinity"):
+            allowed = set(os.sched_getaffinity(0))
+        else:
+            allowed = set(range(os.cpu_count() or 1))
+
+        nodes = {}
+        for node_dir in sorted(glob.glob("/sys/devices/system/node/node[0-9]*")):
+            try:
+                with open(os.path.join(node_dir, "cpulist"), "r") as file:
+                    cpus = _parse_cpulist(file.read())
+            except OSError:
+                continue
+            node_id = int(os.path.basename(node_dir)[len("node"):])
+            nodes[node_id] = [cpu for cpu in cpus if cpu in allowed]
+
+        if not any(nodes.values()):
+            nodes = {0: sorted(allowed)}
+        return cls(nodes)
+
+    @property
+    def cpus(self) -> List[int]:
+        """All usable CPUs, ordered node by node so that slices stay NUMA-local"""
+        return [cpu for node in sorted(self.nodes) for cpu in self.nodes[node]]
+
+    def node_of(self, cpu: int) -> Optional[int]:
+        for node, cpus in self.nodes.items():
+            if cpu in cpus:
+                return node
+        return None
+
+
+class ThreadAllocation:
+    def __init__(self, cores: List[int], numa_node: Optional[int], num_workers: int = 1, pin: bool = False):
+        """
+        Share of the machine's cores given to one model replica
+
+        Args:
+            cores: CPU ids reserved for this replica
+            numa_node: NUMA node the cores belong to, None if they span several nodes
+            num_workers: Number of CTranslate2 workers (parallel transcriptions) for this replica
+            pin: Whether threads created for this replica are pinned to its cores
+        """
+        self.cores = cores
+        self.numa_node = numa_node
+        self.num_workers = max(1, num_workers)
+        self.pin = pin
+
+    @property
+    def cpu_threads(self) -> int:
+        """CTranslate2 intra-op threads per worker, so that all workers together fill the cores"""
+        return max(1, len(self.cores) // self.num_workers)
+
+    @contextlib.contextmanager
+    def pinned(self):
+        """
+        Restrict the calling thread to this replica's cores for the duration of the block.
+
+        Threads spawned inside the block (CTranslate2 workers when the model is constructed,
+        OpenMP teams on the first torch call) inherit the affinity and keep it afterwards.
+        """
+        if not self.pin or not self.cores or not hasattr(os, "sched_setaffinity"):
+            yield
+            return
+        previous = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, self.cores)
+        try:
+            yield
+        finally:
+            os.sched_setaffinity(0, previous)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "cores": self.cores,
+            "numa_node": self.numa_node,
+            "cpu_threads": self.cpu_threads,
+            "num_workers": self.num_workers,
+            "pinned": self.pin,
+        }
+
+
+class ThreadBudget:
+    def __init__(self, config, topology: Optional[CpuTopology] = None):
+        """
+        Divide the machine's cores across every configured model replica
+
+        Args:
+            config: Config instance holding the "threads" and "model" sections
+            topology: CPU layout to divide, detected from the machine when omitted
+        """
+        self.config = config
+        self.topology = topology or CpuTopology.detect()
+        self.settings = config.get_threads_config()
+        self.allocations = self._plan()
+        self.torch_engines = set(TORCH_ENGINES)
+        self._torch_configured = False
+
+    def _replicas(self) -> List[Tuple[str, int, Dict[str, Any]]]:
+        """List (model_identifier, replica_index, model_settings) for every configured replica"""
+        replicas = []
+        for engine, models in self.config.get_model_configs().items():
+            for model_name, model_settings in (models or {}).items():
+                model_settings = model_settings or {}
+                for index in range(int(model_settings.get("replicas", 1))):
+                    replicas.append((f"{engine}/{model_name}", index, model_settings))
+        return replicas
+
+    def _plan(self) -> Dict[Tuple[str, int], ThreadAllocation]:
+        cpus = self.topology.cpus
+        reserve = int(self.settings.get("reserve", 0))
+        if 0 < reserve < len(cpus):
+            cpus = cpus[:-reserve]
+
+        pin = bool(self.settings.get("pin", False))
+        replicas = self._replicas()
+        if not replicas or not cpus:
+            return {}
+
+        allocations = {}
+        if len(replicas) >= len(cpus):
+            # More replicas than cores: every replica gets one core, shared round-robin
+            for i, (identifier, index, model_settings) in enumerate(replicas):
+                cpu = cpus[i % len(cpus)]
+                allocations[(identifier, index)] = ThreadAllocation(
+                    [cpu], self.topology.node_of(cpu),
+                    num_workers=1, pin=pin
+                )
+            return allocations
+
+        # Weighted split, contiguous in node order so each replica stays on as few nodes as possible
+        weights = [float(model_settings.get("thread_weight", 1.0)) for _, _, model_settings in replicas]
+        total_weight = sum(weights)
+        shares = [max(1, int(len(cpus) * weight / total_weight)) for weight in weights]
+        leftover = len(cpus) - sum(shares)
+        i = 0
+        while leftover > 0:
+            shares[i % len(shares)] += 1
+            leftover -= 1
+            i += 1
+        while leftover < 0:
+            j = shares.index(max(shares))
+            shares[j] -= 1
+            leftover += 1
+
+        start = 0
+        for (identifier, index, model_settings), share in zip(replicas, shares):
+            cores = cpus[start:start + share]
+            start += share
+            nodes = {self.topology.node_of(cpu) for cpu in cores}
+            allocations[(identifier, index)] = ThreadAllocation(
+                cores,
+                nodes.pop() if len(nodes) == 1 else None,
+                num_workers=int(model_settings.get("num_workers", self.settings.get("num_workers", 1))),
+                pin=pin
+            )
+        return allocations
+
+    def for_config(self, config) -> "ThreadBudget":
+        """
+        Budget of another configuration on the same machine, e.g. a reloaded one
+
+        torch's thread pools can only be sized once per process, so the new budget keeps them as they are.
+        """
+        budget = ThreadBudget(config, self.topology)
+        budget.torch_engines |= self.torch_engines
+        budget._torch_configured = self._torch_configured
+        return budget
+
+    def allocation_for(self, model_identifier: str, replica: int = 0) -> Optional[ThreadAllocation]:
+        """
+        Get the allocation for a replica, None if the model is not in the config
+
+        Args:
+            model_identifier: Model identifier in the format "engine/model_name"
+            replica: Replica index
+        """
+        return self.allocations.get((model_identifier, replica))
+
+    @property
+    def torch_intra_op(self) -> int:
+        """
+        Intra-op threads for torch-based engines.
+
+        torch's pools are process wide and every calling thread gets its own OpenMP team,
+        so this is the largest single torch replica share, not the sum of them.
+        """
+        shares = [
+            len(allocation.cores)
+            for (identifier, _), allocation in self.allocations.items()
+            if identifier.split("/", 1)[0] in self.torch_engines
+        ]
+        return int(self.settings.get("torch_intra_op", max(shares) if shares else 1))
+
+    def configure_torch(self, engine: Optional[str] = None):
+        """
+        Size torch's thread pools once, before the first torch-based engine loads
+
+        Args:
+            engine: Name of the torch-based engine about to load, counted in the torch share
+        """
+        if engine:
+            self.torch_engines.add(engine)
+        if self._torch_configured:
+            return
+        self._torch_configured = True
+
+        intra_op = self.torch_intra_op
+        inter_op = int(self.settings.get("torch_inter_op", 1))
+
+        import torch
+        torch.set_num_threads(intra_op)
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # Can only be set before the first inter-op parallel work has started
+            logger.warning("torch inter-op threads already initialised, keeping %d", torch.get_num_interop_threads())
+        logger.info("torch threads: intra-op %d, inter-op %d", intra_op, inter_op)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "numa_nodes": self.topology.nodes,
+            "allocations": [
+                dict(model=identifier, replica=index, **allocation.to_dict())
+                for (identifier, index), allocation in self.allocations.items()
+            ],
+        }
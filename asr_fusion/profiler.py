@@ -0,0 +1,162 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+# Innermost Python frames of threads blocked waiting, left out with idle=False
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class ProfilerBusy(Exception):
+    """Another profile is being taken"""
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_qualname if hasattr(code, 'co_qualname') else code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, max_depth: int = 128):
+        """
+        Statistical profiler of all Python threads, sampled from a thread of its own
+
+        Nothing is installed into the interpreter: while no profile is being taken it costs nothing,
+        and while one is, only the sampling thread runs (sys._current_frames every interval).
+        Threads in C code without the GIL (CTranslate2 decoding, numpy) show with their calling frame.
+
+        Args:
+            interval: Seconds between samples
+            max_depth: Frames kept per stack, from the outermost
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+
+    def sample(self, seconds: float, idle: bool = True) -> Dict[str, Any]:
+        """
+        Sample every thread for seconds, blocking the caller
+
+        Args:
+            seconds: Length of the profile
+            idle: Keep the samples of threads waiting on a lock, queue or selector
+
+        Returns:
+            {"stacks": Counter of (thread name, frame names outermost first), "samples": int, ...}
+
+        Raises:
+            ProfilerBusy: A profile is already being taken
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already being taken")
+        try:
+            own = threading.get_ident()
+            stacks: Counter = Counter()
+            samples = 0
+            names: Dict[int, str] = {}
+            labels: Dict[Any, str] = {}  # code object -> frame name, formatted once
+            started = time.perf_counter()
+            cpu = time.process_time()
+            deadline = started + seconds
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                frames = sys._current_frames()
+                if len(frames) != len(names) + 1:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    code = frame.f_code
+                    if not idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        label = labels.get(code)
+                        if label is None:
+                            label = labels[code] = _frame_name(code)
+                        stack.append(label)
+                        frame = frame.f_back
+                    stack.reverse()
+                    stacks[(names.get(ident, f"thread-{ident}"), tuple(stack[:self.max_depth]))] += 1
+                del frames
+                samples += 1
+                time.sleep(max(0.0, self.interval - (time.perf_counter() - now)))
+            return {
+                "stacks": stacks,
+                "samples": samples,
+                "seconds": time.perf_counter() - started,
+                # CPU of the whole process while sampling, the profiler's own included
+                "process_cpu_seconds": time.process_time() - cpu,
+                "interval": self.interval,
+            }
+        finally:
+            self._lock.release()
+
+
+def collapsed(profile: Dict[str, Any]) -> str:
+    """Brendan Gregg's collapsed stacks, "thread;outer;...;inner count" per line, for flamegraph.pl or speedscope"""
+    lines = []
+    for (thread, stack), count in sorted(profile["stacks"].items()):
+        lines.append(";".join((thread,) + stack).replace(" ", "_") + f" {count}")
+    return "\n".join(lines) + "\n"
+
+
+def speedscope(profile: Dict[str, Any], name: str = "asr-fusion") -> Dict[str, Any]:
+    """speedscope file format, a sampled profile per thread weighted in seconds"""
+    frames: List[Dict[str, str]] = []
+    index: Dict[str, int] = {}
+    by_thread: Dict[str, List[Tuple[List[int], int]]] = {}
+    for (thread, stack), count in profile["stacks"].items():
+        ids = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                function, _, location = frame.partition(" (")
+                filename, _, line = location.rstrip(")").rpartition(":")
+                frames.append({"name": function, "file": filename, "line": int(line) if line.isdigit() else None})
+            ids.append(index[frame])
+        by_thread.setdefault(thread, []).append((ids, count))
+
+    interval = profile["interval"]
+    profiles = []
+    for thread, samples in sorted(by_thread.items()):
+        profiles.append({
+            "type": "sampled",
+            "name": thread,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(count for _, count in samples) * interval,
+            "samples": [ids for ids, _ in samples],
+            "weights": [count * interval for _, count in samples],
+        })
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "asr-fusion",
+        "shared": {"frames": frames},
+        "profiles": profiles,
+    }
+
+
+def profile_summary(profile: Dict[str, Any], top: Optional[int] = 20) -> List[Dict[str, Any]]:
+    """Functions by the samples they were on top of the stack, over all threads"""
+    self_samples: Counter = Counter()
+    for (_, stack), count in profile["stacks"].items():
+        if stack:
+            self_samples[stack[-1]] += count
+    total = sum(self_samples.values()) or 1
+    return [{"frame": frame, "samples": count, "share": round(count / total, 4)}
+            for frame, count in self_samples.most_common(top)]
+
+
+profiler = SamplingProfiler()
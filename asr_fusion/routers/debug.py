@@ -0,0 +1,202 @@
+import hmac
+import tracemalloc
+from typing import Dict, Any, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from asr_fusion.memory import process_rss, tracemalloc_top, upload_spool_usage
+from asr_fusion.metrics import registry
+from asr_fusion.models.model_manager import ReloadInProgress
+from asr_fusion.profiler import ProfilerBusy, collapsed, profile_summary, profiler, speedscope
+from asr_fusion.routers.realtime.ws import sessions
+from asr_fusion.routers.transcription import model_manager
+from asr_fusion.whisper_streaming.whisper_online import load_audio
+
+LOOPBACK = {"127.0.0.1", "::1", "localhost"}
+MAX_PROFILE_SECONDS = 120
+
+
+def require_debug_access(request: Request, authorization: Optional[str] = Header(None),
+                         x_debug_token: Optional[str] = Header(None)):
+    """
+    The debug endpoints expose internals, cost CPU or reload the configuration: with `debug.token` set they need it as a
+    bearer token or X-Debug-Token header. Without one they are off, unless `debug.allow_loopback` serves them to the
+    local host, which a reverse proxy on the same host would open to everyone
+    """
+    debug_config = model_manager.config.get_debug_config()
+    token = debug_config.get("token")
+    if token:
+        given = x_debug_token
+        if given is None and authorization and authorization.lower().startswith("bearer "):
+            given = authorization[7:].strip()
+        if given is None or not hmac.compare_digest(given.encode(), str(token).encode()):
+            raise HTTPException(status_code=401, detail="Debug endpoints need the debug token")
+    elif not debug_config.get("allow_loopback", False):
+        raise HTTPException(status_code=403, detail="Debug endpoints are disabled, set debug.token to use them")
+    elif request.client is None or request.client.host not in LOOPBACK:
+        raise HTTPException(status_code=403, detail="Debug endpoints are only served to localhost without debug.token")
+
+
+router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(require_debug_access)])
+
+process_rss_gauge = registry.gauge("asr_process_resident_bytes", "Resident set size of the server process")
+model_rss_gauge = registry.gauge(
+    "asr_model_resident_bytes", "Growth of the process RSS while the model loaded", ("model",)
+)
+session_count_gauge = registry.gauge("asr_realtime_sessions", "Open realtime sessions")
+session_bytes_gauge = registry.gauge(
+    "asr_realtime_buffer_bytes", "Bytes held by all realtime sessions, by buffer", ("buffer",)
+)
+spool_bytes_gauge = registry.gauge(
+    "asr_spool_bytes", "Transcripts of realtime sessions and uploaded files spooled, by where they are", ("spool",)
+)
+cache_entries_gauge = registry.gauge("asr_cache_entries", "Entries of the in-process caches", ("cache",))
+
+# per session memory key -> buffer label of asr_realtime_buffer_bytes
+SESSION_BUFFERS = {
+    "pending_bytes": "pending",
+    "audio_buffer_bytes": "audio",
+    "features_bytes": "features",
+    "vac_buffer_bytes": "vac",
+}
+
+
+def cache_usage() -> Dict[str, Dict[str, Any]]:
+    """Occupancy of the decoded audio and result caches"""
+    info = load_audio.cache_info()
+    caches = {
+        # decoded files of the whisper_online simulation, each a whole float32 signal
+        "load_audio": {"entries": info.currsize, "max_entries": info.maxsize, "hits": info.hits, "misses": info.misses},
+    }
+    for model_identifier, pool in list(model_manager.models.items()):
+        cache = getattr(pool.model, "cache", None)
+        if cache is not None and hasattr(cache, "stats"):
+            caches[f"language:{model_identifier}"] = cache.stats()
+    return caches
+
+
+def memory_report(include_sessions: bool = True) -> Dict[str, Any]:
+    session_memory = [session.memory() for session in list(sessions.values())]
+    totals = {label: 0 for label in SESSION_BUFFERS.values()}
+    spools = {"realtime_memory": 0, "realtime_disk": 0}
+    for memory in session_memory:
+        for key, label in SESSION_BUFFERS.items():
+            totals[label] += memory.get(key, memory["processor"].get(key, 0))
+        spools["realtime_disk" if memory["spool"]["on_disk"] else "realtime_memory"] += memory["spool"]["bytes"]
+    uploads = upload_spool_usage()
+    spools["uploads"] = uploads["bytes"]
+
+    report = {
+        "process_rss": process_rss(),
+        "models": dict(model_manager.model_rss),
+        "realtime": {"sessions": len(session_memory), "buffer_bytes": totals},
+        "caches": cache_usage(),
+        "spool": {**spools, "upload_files": uploads["files"], "directory": uploads["directory"]},
+    }
+    if include_sessions:
+        report["realtime"]["per_session"] = session_memory
+    return report
+
+
+def collect():
+    report = memory_report(include_sessions=False)
+    process_rss_gauge.set(report["process_rss"])
+    model_rss_gauge.clear()
+    for model_identifier, size in report["models"].items():
+        model_rss_gauge.set(size, model=model_identifier)
+    session_count_gauge.set(report["realtime"]["sessions"])
+    for label, size in report["realtime"]["buffer_bytes"].items():
+        session_bytes_gauge.set(size, buffer=label)
+    for spool in ("realtime_memory", "realtime_disk", "uploads"):
+        spool_bytes_gauge.set(report["spool"][spool], spool=spool)
+    cache_entries_gauge.clear()
+    for cache, stats in report["caches"].items():
+        cache_entries_gauge.set(stats.get("entries", stats.get("size", 0)), cache=cache)
+
+
+registry.add_collector(collect)
+
+
+@router.get("/memory")
+async def memory(per_session: bool = True, top: int = 0, trace: Optional[str] = None, frames: int = 1):
+    """
+    Where the process memory is: RSS, RSS growth of each model load, buffers of every realtime
+    session, cache occupancy and spooled files.
+
+    trace=start turns on tracemalloc (with `frames` frames per allocation), trace=stop turns it off;
+    while it runs, top=N adds the N largest Python allocation sites. Tracing slows allocations
+    down, so it is only meant to be on while looking for a leak.
+    """
+    if trace == "start":
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, frames))
+    elif trace == "stop":
+        tracemalloc.stop()
+    elif trace is not None:
+        raise HTTPException(status_code=400, detail="trace must be start or stop")
+
+    report = memory_report(include_sessions=per_session)
+    report["tracemalloc"] = {"tracing": tracemalloc.is_tracing()}
+    if top > 0:
+        # grouping a snapshot walks every traced block, keep it off the event loop
+        report["tracemalloc"] = await run_in_threadpool(
+            tracemalloc_top, top, "traceback" if tracemalloc.get_traceback_limit() > 1 else "lineno"
+        )
+    return report
+
+
+@router.get("/profile")
+async def profile(seconds: float = 10.0, format: str = "collapsed", idle: bool = False):
+    """
+    Sample the stacks of every Python thread (event loop, request handlers, inference workers)
+    for `seconds` and return where they were.
+
+    format=collapsed gives one "thread;outer;...;inner count" line per stack, for flamegraph.pl or
+    speedscope.app; format=speedscope gives speedscope's JSON with a profile per thread; format=summary
+    the functions most often on top of a stack. With idle=false (default) threads waiting on a lock,
+    queue or selector are left out. One profile is taken at a time; nothing is sampled in between.
+    """
+    if format not in ("collapsed", "speedscope", "summary"):
+        raise HTTPException(status_code=400, detail="format must be collapsed, speedscope or summary")
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be within (0, {MAX_PROFILE_SECONDS}]")
+    try:
+        result = await run_in_threadpool(profiler.sample, seconds, idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if format == "collapsed":
+        return PlainTextResponse(collapsed(result))
+    if format == "speedscope":
+        return speedscope(result)
+    return {
+        "samples": result["samples"],
+        "seconds": round(result["seconds"], 3),
+        "process_cpu_seconds": round(result["process_cpu_seconds"], 3),
+        "top": profile_summary(result),
+    }
+
+
+@router.post("/reload")
+async def reload(wait: bool = True):
+    """
+    Re-read config.yaml and switch to it without a restart, like SIGHUP.
+
+    Models whose settings changed are loaded and warmed next to the running ones, swapped in
+    together once all are ready, and the replaced ones unloaded when their requests finished
+    (see GET /v1/models, "reload"). With wait=true (default) the answer is the outcome: the changed
+    sections and the models swapped, rebuilt and unchanged. wait=false returns 202 at once.
+    If the file can't be read or a model fails to load, the running configuration stays (500).
+    """
+    if not wait:
+        if not model_manager.reload_in_background():
+            raise HTTPException(status_code=409, detail="A configuration reload is already running")
+        return JSONResponse(status_code=202, content={"status": "started", "version": model_manager.version})
+    try:
+        return await run_in_threadpool(model_manager.reload)
+    except ReloadInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed, the running configuration stays: {e}")
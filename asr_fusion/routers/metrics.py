@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from asr_fusion.metrics import registry, CONTENT_TYPE
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics")
+async def metrics():
+    """Metrics in the Prometheus text format"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
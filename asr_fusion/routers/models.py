@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from asr_fusion.routers.transcription import model_manager
+
+router = APIRouter(prefix="/v1", tags=["models"])
+
+@router.get("/models")
+async def list_models():
+    """
+    Loaded models with the health, outstanding work and utilization of each replica,
+    and the CPU thread budget they were given.
+    """
+    return model_manager.stats()
+
+
+@router.get("/scheduler")
+async def scheduler_stats():
+    """
+    Per model: requests running and waiting, and per tenant the admitted audio seconds, wait times
+    and the yields of batch requests to higher priority work.
+    """
+    return {
+        model_identifier: pool.scheduler.stats()
+        for model_identifier, pool in list(model_manager.models.items())
+        if pool.scheduler is not None
+    }
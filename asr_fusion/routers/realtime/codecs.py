@@ -0,0 +1,97 @@
+from typing import Dict, Any
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+
+
+class PCMDecoder:
+    def __init__(self, dtype: str = "<f4"):
+        """16 kHz mono PCM frames, passed through (float32) or scaled to float32 (int16)"""
+        self.dtype = np.dtype(dtype)
+        self.received_bytes = 0
+        self._rest = b""
+
+    def decode(self, data: bytes) -> np.ndarray:
+        self.received_bytes += len(data)
+        data = self._rest + data
+        usable = len(data) - len(data) % self.dtype.itemsize
+        self._rest = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype=self.dtype)
+        if self.dtype.kind == "i":
+            return samples.astype(np.float32) / 32768.0
+        return samples
+
+    def info(self) -> Dict[str, Any]:
+        return {"received_bytes": self.received_bytes}
+
+    def state(self) -> Dict[str, Any]:
+        """Counters and the bytes of an incomplete sample, for a snapshot of the session"""
+        return {"received_bytes": self.received_bytes, "rest": self._rest.hex()}
+
+    def load_state(self, state: Dict[str, Any]):
+        self.received_bytes = state["received_bytes"]
+        self._rest = bytes.fromhex(state["rest"])
+
+
+class OpusDecoder:
+    def __init__(self, sample_rate: int = 48000, channels: int = 1):
+        """
+        Raw Opus packets, one per message (as produced by libopus or WebRTC, without a container),
+        decoded with the session's own codec state and resampled to 16 kHz mono float32
+
+        Args:
+            sample_rate: Rate the stream was encoded at, 48000 for Opus unless told otherwise
+            channels: Channels of the stream, mixed down to mono
+        """
+        import av
+        self._av = av
+        self.codec = av.CodecContext.create("opus", "r")
+        self.codec.sample_rate = sample_rate
+        self.codec.layout = "mono" if channels == 1 else "stereo"
+        self.resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLING_RATE)
+        self.received_bytes = 0
+        self.packets = 0
+
+    def decode(self, data: bytes) -> np.ndarray:
+        self.received_bytes += len(data)
+        self.packets += 1
+        chunks = []
+        for frame in self.codec.decode(self._av.Packet(data)):
+            for resampled in self.resampler.resample(frame):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+        if not chunks:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(chunks)
+
+    def info(self) -> Dict[str, Any]:
+        return {"received_bytes": self.received_bytes, "packets": self.packets}
+
+    def state(self) -> Dict[str, Any]:
+        """Counters only: the codec state isn't exported by libopus, a restored session starts a new
+        decoder, which recovers within the first packet or two like after packet loss"""
+        return {"received_bytes": self.received_bytes, "packets": self.packets}
+
+    def load_state(self, state: Dict[str, Any]):
+        self.received_bytes = state["received_bytes"]
+        self.packets = state["packets"]
+
+
+# codec name of the realtime query string -> decoder factory
+CODECS = {
+    "pcm_f32le": lambda **kwargs: PCMDecoder("<f4"),
+    "pcm_s16le": lambda **kwargs: PCMDecoder("<i2"),
+    "opus": lambda sample_rate=48000, channels=1: OpusDecoder(sample_rate, channels),
+}
+
+
+def create_decoder(codec: str, **kwargs):
+    """
+    Decoder of one session's binary frames
+
+    Raises:
+        ValueError: Unknown codec
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported codec {codec}, expected one of {', '.join(CODECS)}")
+    return CODECS[codec](**kwargs)
@@ -0,0 +1,368 @@
+import asyncio
+import json
+import logging
+import struct
+from typing import Dict, Any, Optional
+
+from fastapi import (
+    APIRouter,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.concurrency import run_in_threadpool
+
+from asr_fusion.routers.realtime.codecs import CODECS
+from asr_fusion.routers.realtime.session import RealtimeSession
+from asr_fusion.routers.realtime.ws import recording_dir, sessions
+from asr_fusion.routers.transcription import model_manager, request_tenant
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["realtime"])
+
+# Binary frames start with the stream id, a big-endian uint32, followed by the stream's codec payload
+FRAME_HEADER = struct.Struct(">I")
+# Bytes a stream may send before the server grants more, unless stream.open asks for another window
+DEFAULT_WINDOW = 256 * 1024
+MAX_WINDOW = 16 * 1024 * 1024
+
+
+class MuxStream:
+    def __init__(self, stream_id: int, session: RealtimeSession, window: int, partials: bool):
+        """
+        One stream of a multiplexed connection, with its own session and send window
+
+        Args:
+            stream_id: Id chosen by the client in stream.open
+            session: Realtime session transcribing the stream
+            window: Bytes the client may send ahead of what the session has consumed
+            partials: Send the draft model's partial text
+        """
+        self.id = stream_id
+        self.session = session
+        self.window = window
+        self.credit = window
+        self.partials = partials
+        self.last_partial = ""
+        self.received_bytes = 0
+        self.granted_bytes = 0  # received bytes consumed by the session and given back as credit
+        self.largest_frame = 0
+        self.processing: Optional[asyncio.Task] = None
+        self.closing = False
+
+
+class MuxConnection:
+    def __init__(self, ws: WebSocket, tenant: str, max_streams: int):
+        """
+        Streams of one multiplexed WebSocket
+
+        Every outgoing event goes through a single writer task, so the events of concurrently
+        decoded streams never interleave on the socket.
+        """
+        self.ws = ws
+        self.tenant = tenant
+        self.max_streams = max_streams
+        self.streams: Dict[int, MuxStream] = {}
+        # Streams whose session is being created -> frames received meanwhile, and whether
+        # stream.close came before stream.opened
+        self.opening: Dict[int, Dict[str, Any]] = {}
+        self.tasks = set()
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+        self.connected = True
+
+    def send(self, event: Dict[str, Any]):
+        self.outgoing.put_nowait(event)
+
+    async def writer(self):
+        while True:
+            event = await self.outgoing.get()
+            if event is None:
+                return
+            if self.connected:
+                try:
+                    await self.ws.send_json(event)
+                except Exception:
+                    self.connected = False
+
+    def spawn(self, coroutine) -> asyncio.Task:
+        """Run a stream's open, decode or close without holding up the other streams"""
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def error(self, message: str, stream_id: Optional[int] = None):
+        event = {"type": "error", "error": message}
+        if stream_id is not None:
+            event["stream"] = stream_id
+        self.send(event)
+
+    def open(self, event: Dict[str, Any]):
+        stream_id = event.get("stream")
+        if not isinstance(stream_id, int) or not 0 <= stream_id < 2 ** 32:
+            self.error("stream.open needs a stream id between 0 and 2^32-1")
+            return
+        if stream_id in self.streams or stream_id in self.opening:
+            self.error(f"Stream {stream_id} is already open", stream_id)
+            return
+        if len(self.streams) + len(self.opening) >= self.max_streams:
+            self.error(f"Too many open streams, at most {self.max_streams}", stream_id)
+            return
+        model = event.get("model", "faster-whisper/small")
+        draft_model = event.get("draft_model")
+        codec = event.get("codec", "pcm_f32le")
+        for m in (model, draft_model or model):
+            if not isinstance(m, str) or not m.startswith("faster-whisper/"):
+                self.error(f"Streaming is not supported for model {m}", stream_id)
+                return
+        if not isinstance(codec, str) or codec not in CODECS:
+            self.error(f"Unsupported codec {codec}, expected one of {', '.join(CODECS)}", stream_id)
+            return
+        try:
+            directory = recording_dir(bool(event.get("record", False)))
+        except ValueError as e:
+            self.error(str(e), stream_id)
+            return
+        try:
+            window = int(event.get("window", DEFAULT_WINDOW))
+            min_chunk_size = float(event.get("min_chunk_size", 1.0))
+            max_chunk_size = float(event.get("max_chunk_size", 5.0))
+            options = {
+                "language": event.get("language", "auto"),
+                "vac": bool(event.get("vac", False)),
+                "min_chunk_size": min_chunk_size,
+                "max_buffer_sec": float(event.get("max_buffer_sec", 25.0)),
+                "target_latency": None if event.get("target_latency") is None else float(event["target_latency"]),
+                "chunk_size_bounds": (min(min_chunk_size, 0.3), max(min_chunk_size, max_chunk_size)),
+                "commit_interval": float(event.get("commit_interval", 3.0)),
+            }
+            if codec == "opus":
+                options["codec_options"] = {
+                    "sample_rate": int(event.get("sample_rate", 48000)), "channels": int(event.get("channels", 1))
+                }
+        except (TypeError, ValueError) as e:
+            self.error(f"Invalid stream.open option: {e}", stream_id)
+            return
+        if window <= 0:
+            self.error("window must be a positive number of bytes", stream_id)
+            return
+        window = min(window, MAX_WINDOW)
+        self.opening[stream_id] = {"frames": [], "bytes": 0, "window": window, "close": False}
+        self.spawn(self._open(stream_id, model, draft_model, codec, options, window, directory))
+
+    async def _open(self, stream_id: int, model: str, draft_model: Optional[str], codec: str,
+                    options: Dict[str, Any], window: int, directory: Optional[str]):
+        try:
+            session = await run_in_threadpool(
+                RealtimeSession, model_manager, model, draft_model=draft_model, tenant=self.tenant,
+                codec=codec, recording_dir=directory, **options,
+            )
+        except Exception as e:
+            logger.exception(f"Failed to create realtime session for stream {stream_id}")
+            self.opening.pop(stream_id, None)
+            self.error(str(e), stream_id)
+            return
+
+        opening = self.opening.pop(stream_id)
+        stream = MuxStream(stream_id, session, window, partials=draft_model is not None)
+        self.streams[stream_id] = stream
+        sessions[session.id] = session
+        self.send({"type": "stream.opened", "stream": stream_id, "window": window, "session": session.info()})
+        for payload in opening["frames"]:
+            self.feed_stream(stream, payload)
+        if opening["close"] or not self.connected:
+            self.close(stream, flush=self.connected)
+
+    def feed(self, data: bytes):
+        if len(data) < FRAME_HEADER.size:
+            self.error("Binary frames must start with a 4-byte stream id")
+            return
+        (stream_id,) = FRAME_HEADER.unpack_from(data)
+        payload = data[FRAME_HEADER.size:]
+        if stream_id in self.opening:
+            # held until the session exists, within the window the stream asked for
+            opening = self.opening[stream_id]
+            if opening["bytes"] + len(payload) > opening["window"]:
+                self.error(f"Stream {stream_id} sent more than its window of {opening['window']} bytes while opening",
+                           stream_id)
+                return
+            opening["frames"].append(payload)
+            opening["bytes"] += len(payload)
+            return
+        if stream_id not in self.streams:
+            self.error(f"Unknown stream {stream_id}", stream_id)
+            return
+        self.feed_stream(self.streams[stream_id], payload)
+
+    def feed_stream(self, stream: MuxStream, payload: bytes):
+        if stream.closing:
+            # closed by the server on an error, the client may not know yet
+            return
+        stream_id = stream.id
+        if len(payload) > stream.credit:
+            self.error(f"Stream {stream_id} sent {len(payload)} bytes with {stream.credit} bytes of credit", stream_id)
+            self.close(stream, flush=False)
+            return
+        stream.credit -= len(payload)
+        stream.received_bytes += len(payload)
+        stream.largest_frame = max(stream.largest_frame, len(payload))
+        try:
+            stream.session.insert_encoded(payload)
+        except Exception as e:
+            self.error(f"Failed to decode a frame of stream {stream_id}: {e}", stream_id)
+            self.close(stream, flush=False)
+            return
+        self.schedule(stream)
+
+    def schedule(self, stream: MuxStream):
+        """Start a decode of the stream, one in flight per stream"""
+        if stream.closing or (stream.processing is not None and not stream.processing.done()):
+            return
+        # A client short of credit for its next frame sends nothing more, so the queued audio is decoded
+        # even when it's less than a chunk, or the stream would stall. Frames vary in size (Opus, the
+        # last one), so a quarter of the window counts as short too.
+        starved = stream.credit < max(stream.largest_frame, stream.window // 4)
+        if stream.session.ready() or (starved and stream.received_bytes > stream.granted_bytes):
+            stream.processing = self.spawn(self.process(stream))
+
+    async def process(self, stream: MuxStream):
+        received = stream.received_bytes
+        try:
+            outputs = await run_in_threadpool(stream.session.process)
+        except Exception as e:
+            logger.exception(f"Decoding stream {stream.id} failed")
+            self.error(str(e), stream.id)
+            self.close(stream, flush=False)
+            return
+        for beg, end, text in outputs:
+            self.send({"type": "transcript.text.delta", "stream": stream.id, "start": beg, "end": end, "delta": text})
+        if stream.partials:
+            beg, end, text = stream.session.partial()
+            if text != stream.last_partial:
+                stream.last_partial = text
+                self.send({"type": "transcript.text.partial", "stream": stream.id, "start": beg, "end": end, "text": text})
+        # The bytes received before this decode started are consumed: give them back to the client
+        granted = received - stream.granted_bytes
+        if granted > 0 and not stream.closing:
+            stream.granted_bytes = received
+            stream.credit += granted
+            self.send({"type": "stream.credit", "stream": stream.id, "bytes": granted, "credit": stream.credit})
+        # audio that arrived during the decode is picked up right away, not on the next frame
+        stream.processing = None
+        self.schedule(stream)
+
+    def close(self, stream: MuxStream, flush: bool = True):
+        """
+        Finish a stream: send the rest of its transcript when flush, then release its session
+
+        The stream takes no more frames from here on, while it finishes in the background.
+        """
+        if stream.closing:
+            return
+        stream.closing = True
+        self.spawn(self._close(stream, flush))
+
+    async def _close(self, stream: MuxStream, flush: bool):
+        try:
+            if stream.processing is not None:
+                await asyncio.gather(stream.processing, return_exceptions=True)
+            if flush:
+                outputs = await run_in_threadpool(stream.session.finish)
+                for beg, end, text in outputs:
+                    self.send({"type": "transcript.text.delta", "stream": stream.id, "start": beg, "end": end, "delta": text})
+                self.send({"type": "transcript.text.done", "stream": stream.id, "text": stream.session.text})
+        except Exception as e:
+            logger.exception(f"Finishing stream {stream.id} failed")
+            self.error(str(e), stream.id)
+        finally:
+            self.streams.pop(stream.id, None)
+            sessions.pop(stream.session.id, None)
+            await run_in_threadpool(stream.session.close)
+        self.send({"type": "stream.closed", "stream": stream.id})
+
+    def handle(self, event: Dict[str, Any]):
+        kind = event.get("type")
+        stream_id = event.get("stream")
+        if kind == "stream.open":
+            self.open(event)
+        elif kind == "stream.close":
+            if stream_id in self.opening:
+                self.opening[stream_id]["close"] = True
+            elif stream_id in self.streams:
+                self.close(self.streams[stream_id])
+            else:
+                self.error(f"Unknown stream {stream_id}", stream_id)
+        else:
+            self.error(f"Unknown event type {kind}")
+
+    async def shutdown(self):
+        """Close every stream, flushed while the client listens, then stop the writer"""
+        for stream in list(self.streams.values()):
+            self.close(stream, flush=self.connected)
+        # streams still opening close themselves once open; decodes and closes spawn no new work after
+        for opening in self.opening.values():
+            opening["close"] = True
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+        self.send(None)
+
+
+@router.websocket("/v1/realtime/mux")
+async def realtime_mux(
+    ws: WebSocket,
+    tenant: Optional[str] = None,
+    max_streams: int = 256,
+) -> None:
+    """
+    Many live transcriptions over one WebSocket.
+
+    Each stream is an independent session of /v1/realtime, opened with a text message
+    {"type": "stream.open", "stream": <uint32 id>, "model": ..., "codec": ..., "window": <bytes>}
+    taking the query parameters of /v1/realtime as fields, and closed with
+    {"type": "stream.close", "stream": <id>}. Audio goes in binary frames made of the stream id
+    (4 bytes, big-endian) followed by one frame of the stream's codec. Every event the server sends
+    carries the "stream" it belongs to: stream.opened, transcript.text.delta / partial / done,
+    stream.closed and error.
+
+    Flow control is per stream, by credit: a stream may send `window` bytes (256 KiB by default),
+    and each decode that consumes them answers with {"type": "stream.credit", "bytes": n, "credit": total}.
+    A stream whose decodes fall behind gets no credit back, so it stops while the other streams of the
+    connection go on; a frame beyond the credit resets the stream with an error.
+    Frames may follow stream.open right away: they are held, within the window, until the session
+    exists. Opening, decoding and closing a stream never hold up the frames of the others.
+    """
+    await ws.accept()
+    connection = MuxConnection(
+        ws, request_tenant(ws.headers.get("authorization"), ws.headers.get("x-tenant") or tenant), max_streams
+    )
+    writer = asyncio.create_task(connection.writer())
+    logger.info("Accepted multiplexed realtime connection")
+    try:
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                connection.connected = False
+                break
+            if message.get("bytes") is not None:
+                connection.feed(message["bytes"])
+            elif message.get("text"):
+                try:
+                    event = json.loads(message["text"])
+                except json.JSONDecodeError:
+                    connection.error("Text messages must be JSON events")
+                    continue
+                if not isinstance(event, dict):
+                    connection.error("Text messages must be JSON objects")
+                    continue
+                if event.get("type") == "session.close":
+                    break
+                connection.handle(event)
+    except WebSocketDisconnect:
+        connection.connected = False
+    finally:
+        streams = len(connection.streams) + len(connection.opening)
+        await connection.shutdown()
+        await writer
+        if connection.connected:
+            await ws.close()
+    logger.info(f"Finished multiplexed realtime connection ({streams} streams open at the end)")
@@ -0,0 +1,105 @@
+import json
+import os
+import struct
+import threading
+import time
+from typing import Dict, Any, Generator, Tuple
+
+# A recording is the header, then records until the end of the file:
+#   MAGIC, uint32 length, JSON session parameters
+#   per record: uint8 kind, uint32 microseconds since the previous record, uint32 length, payload
+# Payloads are the frames exactly as the client sent them, in the session's codec, so a replay
+# decodes them again and Opus recordings stay about as small as the call itself.
+MAGIC = b"ASRREC\x01\n"
+LENGTH = struct.Struct(">I")
+RECORD = struct.Struct(">BII")
+FRAME = 1
+END = 2
+EXTENSION = ".asrrec"
+
+
+class SessionRecorder:
+    def __init__(self, path: str, params: Dict[str, Any]):
+        """
+        Writes the frames of a realtime session with their arrival times
+
+        Args:
+            path: File to create
+            params: Session parameters, stored in the header for the replay
+        """
+        self.path = path
+        self.file = open(path, "wb")
+        header = json.dumps({**params, "recorded_at": time.time()}).encode()
+        self.file.write(MAGIC + LENGTH.pack(len(header)) + header)
+        self.frames = 0
+        self.bytes = 0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _record(self, kind: int, payload: bytes = b""):
+        with self._lock:
+            if self.file.closed:
+                return
+            now = time.monotonic()
+            # a gap beyond uint32 microseconds (71 minutes) is recorded as the longest one
+            delta = min(int((now - self._last) * 1e6), 2 ** 32 - 1)
+            self._last = now
+            self.file.write(RECORD.pack(kind, delta, len(payload)))
+            self.file.write(payload)
+
+    def frame(self, data: bytes):
+        """A frame arrived; buffered writes, so recording doesn't block the receiving coroutine on the disk"""
+        self._record(FRAME, data)
+        self.frames += 1
+        self.bytes += len(data)
+
+    def close(self):
+        """The client ended the session"""
+        self._record(END)
+        with self._lock:
+            self.file.close()
+
+    def info(self) -> Dict[str, Any]:
+        return {"path": self.path, "frames": self.frames, "bytes": self.bytes}
+
+
+def recording_path(directory: str, session_id: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, session_id + EXTENSION)
+
+
+def read_recording(path: str) -> Tuple[Dict[str, Any], Generator[Tuple[float, bytes], None, None]]:
+    """
+    Session parameters of a recording, and its frames
+
+    Returns:
+        (params, frames): frames yields (seconds since the session started, frame) in order; a
+        recording cut short (the server died) ends at its last complete record
+
+    Raises:
+        ValueError: Not a session recording
+    """
+    file = open(path, "rb")
+    if file.read(len(MAGIC)) != MAGIC:
+        file.close()
+        raise ValueError(f"{path} is not a realtime session recording")
+    (length,) = LENGTH.unpack(file.read(LENGTH.size))
+    params = json.loads(file.read(length))
+
+    def frames() -> Generator[Tuple[float, bytes], None, None]:
+        offset = 0.0
+        with file:
+            while True:
+                head = file.read(RECORD.size)
+                if len(head) < RECORD.size:
+                    return
+                kind, delta, size = RECORD.unpack(head)
+                payload = file.read(size)
+                if len(payload) < size:
+                    return
+                offset += delta / 1e6
+                if kind == END:
+                    return
+                yield offset, payload
+
+    return params, frames()
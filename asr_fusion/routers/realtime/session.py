@@ -0,0 +1,282 @@
+import tempfile
+import threading
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from asr_fusion.memory import spooled_usage
+from asr_fusion.models.scheduler import DEFAULT_TENANT, run_as
+from asr_fusion.routers.realtime.codecs import create_decoder
+from asr_fusion.routers.realtime.recording import SessionRecorder, recording_path
+from asr_fusion.routers.realtime.snapshot import pack, unpack
+from asr_fusion.whisper_streaming.adaptive_chunk import AdaptiveChunkController
+from asr_fusion.whisper_streaming.whisper_online import (
+    FasterWhisperASR,
+    OnlineASRProcessor,
+    TranscriptFileSink,
+    VACOnlineASRProcessor,
+)
+
+SAMPLING_RATE = 16000
+# Committed transcript of a session is spooled to disk beyond this size
+TRANSCRIPT_SPOOL_BYTES = 64 * 1024
+# Silero v5 takes exactly 512 samples per call at 16 kHz
+VAC_WINDOW = 512
+
+
+class RealtimeSession:
+    def __init__(self, model_manager, model: str, language: str = "auto", vac: bool = False,
+                 min_chunk_size: float = 1.0, vac_chunk_size: float = 0.04, buffer_trimming: Tuple[str, float] = ("segment", 15),
+                 max_buffer_sec: float = 25.0, target_latency: Optional[float] = None,
+                 chunk_size_bounds: Tuple[float, float] = (0.3, 5.0), draft_model: Optional[str] = None,
+                 commit_interval: float = 3.0, tenant: str = DEFAULT_TENANT, codec: str = "pcm_f32le",
+                 codec_options: Optional[Dict[str, Any]] = None, recording_dir: Optional[str] = None):
+        """
+        One live transcription session on a model shared through ModelManager
+
+        Args:
+            model_manager: ModelManager holding the model, shared with file transcription
+            model: Model identifier in the format "faster-whisper/model_name"
+            language: Language code, or "auto" for detection
+            vac: Use the voice activity controller to end utterances on silence
+            min_chunk_size: Seconds of new audio to collect before re-decoding the buffer
+            vac_chunk_size: Seconds of new audio between VAD updates when vac is on
+            buffer_trimming: (option, seconds) passed to OnlineASRProcessor
+            max_buffer_sec: Hard limit of the re-decoded audio buffer, bounds the cost of each step
+            target_latency: Adapt the interval between re-decodes to the measured decode time to hold
+                this latency in seconds; min_chunk_size is then only the initial interval. None keeps it fixed.
+            chunk_size_bounds: (min, max) seconds of the adapted interval
+            draft_model: Identifier of a fast model that decodes every step for partial text, while
+                model decodes every commit_interval seconds of audio and decides the committed text
+            commit_interval: Seconds of new audio between decodes of model when draft_model is used
+            tenant: Scheduling tenant; decodes of the session run in the realtime priority class
+            codec: Encoding of the frames passed to insert_encoded, see codecs.CODECS
+            codec_options: Arguments of the codec's decoder, e.g. sample_rate and channels for opus
+            recording_dir: Record the session's frames with their arrival times and the arguments above
+                into this directory, for benchmarks/replay_session.py
+        """
+        self.id = f"sess_{uuid.uuid4().hex}"
+        self.model = model
+        self.language = language
+        self.vac = vac
+        self.draft_model = draft_model
+        self.tenant = tenant
+        self.codec = codec
+        # Decoder state of the session's compressed stream, fed in arrival order
+        self.decoder = create_decoder(codec, **(codec_options or {}))
+        # The arguments that shape the transcript, for recordings and snapshots
+        self.params = {
+            "model": model, "language": language, "vac": vac, "min_chunk_size": min_chunk_size,
+            "vac_chunk_size": vac_chunk_size, "buffer_trimming": list(buffer_trimming),
+            "max_buffer_sec": max_buffer_sec, "target_latency": target_latency,
+            "chunk_size_bounds": list(chunk_size_bounds), "draft_model": draft_model,
+            "commit_interval": commit_interval, "codec": codec, "codec_options": codec_options,
+        }
+        self.recorder = None
+        if recording_dir is not None:
+            self.recorder = SessionRecorder(recording_path(recording_dir, self.id), self.params)
+
+        self.asr = FasterWhisperASR(language, model_manager=model_manager, model_identifier=model)
+        draft_asr = None
+        if draft_model is not None:
+            draft_asr = FasterWhisperASR(language, model_manager=model_manager, model_identifier=draft_model)
+        # Words the processor no longer needs for its prompt; read back only for the final text
+        self.transcript = TranscriptFileSink(
+            tempfile.SpooledTemporaryFile(max_size=TRANSCRIPT_SPOOL_BYTES, mode="w+", encoding="utf-8")
+        )
+        self.chunk_controller = None
+        if target_latency is not None:
+            self.chunk_controller = AdaptiveChunkController(min_chunk_size, *chunk_size_bounds, target_latency=target_latency)
+        if vac:
+            self.online = VACOnlineASRProcessor(min_chunk_size, self.asr, None, buffer_trimming=buffer_trimming,
+                                                max_buffer_sec=max_buffer_sec, transcript_sink=self.transcript,
+                                                chunk_controller=self.chunk_controller, draft_asr=draft_asr,
+                                                commit_interval=commit_interval)
+        else:
+            self.online = OnlineASRProcessor(self.asr, None, buffer_trimming=buffer_trimming,
+                                             max_buffer_sec=max_buffer_sec, transcript_sink=self.transcript,
+                                             chunk_controller=self.chunk_controller, draft_asr=draft_asr,
+                                             commit_interval=commit_interval)
+        self.vac_chunk_size = vac_chunk_size
+        self.min_chunk_size = min_chunk_size
+
+        # Audio is queued here by the receiving coroutine and handed to the processor by
+        # process(), so the processor itself is only ever touched by one thread at a time
+        self._pending: List[np.ndarray] = []
+        self._pending_samples = 0
+        self._lock = threading.Lock()
+
+        self.received_seconds = 0.0
+
+    def insert_audio(self, audio: np.ndarray):
+        with self._lock:
+            self._pending.append(audio)
+            self._pending_samples += len(audio)
+            self.received_seconds += len(audio) / SAMPLING_RATE
+
+    def insert_encoded(self, data: bytes):
+        """Decode one frame of the session's codec and queue its audio"""
+        if self.recorder is not None:
+            self.recorder.frame(data)
+        audio = self.decoder.decode(data)
+        if len(audio):
+            self.insert_audio(audio)
+
+    @property
+    def chunk_size(self) -> float:
+        """Seconds of audio to collect before each processing step"""
+        if self.vac:
+            return self.vac_chunk_size
+        if self.chunk_controller is not None:
+            return self.chunk_controller.chunk_size
+        return self.min_chunk_size
+
+    def ready(self) -> bool:
+        """Whether enough new audio arrived for another processing step"""
+        return self._pending_samples >= self.chunk_size * SAMPLING_RATE
+
+    def _take_pending(self, multiple_of: int = 1) -> np.ndarray:
+        with self._lock:
+            if not self._pending:
+                return np.array([], dtype=np.float32)
+            audio = np.concatenate(self._pending)
+            usable = len(audio) - len(audio) % multiple_of
+            rest = audio[usable:]
+            self._pending = [rest] if len(rest) else []
+            self._pending_samples = len(rest)
+            return audio[:usable]
+
+    def _emit(self, output: Tuple, outputs: List[Tuple]):
+        if output[0] is not None:
+            outputs.append(output)
+
+    def process(self) -> List[Tuple]:
+        """
+        Feed the queued audio to the processor and re-decode.
+
+        Returns: newly committed (beg_timestamp, end_timestamp, "text") tuples, possibly empty.
+        """
+        return run_as(self.tenant, "realtime", self._process)
+
+    def _process(self) -> List[Tuple]:
+        outputs = []
+        if self.vac:
+            audio = self._take_pending(VAC_WINDOW)
+            for i in range(0, len(audio), VAC_WINDOW):
+                self.online.insert_audio_chunk(audio[i:i + VAC_WINDOW])
+                if self.online.is_currently_final:
+                    # end of an utterance: flush it before a new one can reset the processor
+                    self._emit(self.online.process_iter(), outputs)
+        else:
+            self.online.insert_audio_chunk(self._take_pending())
+        self._emit(self.online.process_iter(), outputs)
+        return outputs
+
+    def finish(self) -> List[Tuple]:
+        """Process the remaining audio and flush the uncommitted tail"""
+        outputs = self.process() if self._pending_samples else []
+        self._emit(run_as(self.tenant, "realtime", self.online.finish), outputs)
+        return outputs
+
+    def partial(self) -> Tuple:
+        """The current uncommitted hypothesis, (beg_timestamp, end_timestamp, "text")"""
+        return self.online.partial()
+
+    @property
+    def text(self) -> str:
+        """The whole committed transcript. Complete only after finish()."""
+        return self.asr.sep.join(w for _, _, w in self.transcript.read_words())
+
+    def snapshot(self) -> bytes:
+        """
+        The whole state of the session, to continue it with restore() in another process or on
+        another host: its arguments, queued audio, stream decoder, processor (audio buffer,
+        hypothesis, committed words, VAD) and the transcript committed so far.
+        Take it between processing steps, with no decode in flight.
+        """
+        with self._lock:
+            pending = np.concatenate(self._pending) if self._pending else np.array([], dtype=np.float32)
+            received_seconds = self.received_seconds
+        return pack({
+            "id": self.id,
+            "params": self.params,
+            "tenant": self.tenant,
+            "received_seconds": received_seconds,
+            "pending": pending,
+            "decoder": self.decoder.state(),
+            "processor": self.online.state(),
+            "transcript": self.transcript.read_words(),
+        })
+
+    @classmethod
+    def restore(cls, model_manager, data: bytes, tenant: Optional[str] = None) -> "RealtimeSession":
+        """
+        A session continuing from snapshot(), under the same id, on this process's models.
+        A restored session isn't recorded: a replay of its frames would miss the state before them.
+
+        Args:
+            model_manager: ModelManager to load the session's models from
+            data: Output of snapshot()
+            tenant: Scheduling tenant, the snapshot's one if None
+
+        Raises:
+            ValueError: data is not a valid snapshot
+        """
+        state = unpack(data)
+        try:
+            params = dict(state["params"])
+            params["buffer_trimming"] = tuple(params["buffer_trimming"])
+            params["chunk_size_bounds"] = tuple(params["chunk_size_bounds"])
+            model = params.pop("model")
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid realtime session snapshot: {e!r}")
+        session = cls(model_manager, model, tenant=tenant or state.get("tenant", DEFAULT_TENANT), **params)
+        try:
+            session.id = state["id"]
+            session.transcript(state["transcript"])
+            session.decoder.load_state(state["decoder"])
+            session.online.load_state(state["processor"])
+            if len(state["pending"]):
+                session._pending = [state["pending"]]
+                session._pending_samples = len(state["pending"])
+            session.received_seconds = state["received_seconds"]
+        except (KeyError, TypeError, ValueError) as e:
+            session.close()
+            raise ValueError(f"Invalid realtime session snapshot: {e!r}")
+        return session
+
+    def close(self):
+        self.transcript.file.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def memory(self) -> Dict[str, Any]:
+        """Bytes held by the session: queued audio, the processor's buffers and the transcript spool"""
+        with self._lock:
+            pending = sum(chunk.nbytes for chunk in self._pending)
+        return {
+            "id": self.id,
+            "model": self.model,
+            "received_seconds": round(self.received_seconds, 3),
+            "pending_bytes": pending,
+            "processor": self.online.memory(),
+            "spool": spooled_usage(self.transcript.file),
+        }
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "model": self.model,
+            "tenant": self.tenant,
+            "codec": self.codec,
+            "decoder": self.decoder.info(),
+            "language": self.language,
+            "vac": self.vac,
+            "draft_model": self.draft_model,
+            "chunk_size": self.chunk_size,
+            "received_seconds": round(self.received_seconds, 3),
+            "chunk_controller": self.chunk_controller.stats() if self.chunk_controller is not None else None,
+            "vad": self.online.vac.stats() if self.vac else None,
+            "recording": self.recorder.info() if self.recorder is not None else None,
+        }
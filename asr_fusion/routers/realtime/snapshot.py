@@ -0,0 +1,67 @@
+import json
+import struct
+from typing import Dict, Any, List
+
+import numpy as np
+
+# A snapshot is MAGIC, uint32 length, the JSON state, then the raw bytes of its arrays in order.
+# Arrays in the state are replaced in the JSON by {"__array__": index, "dtype": ..., "length": ...},
+# so the audio buffers (the bulk of a session) travel as float32 rather than as JSON numbers.
+MAGIC = b"ASRSNAP\x01"
+LENGTH = struct.Struct(">I")
+ARRAY_KEY = "__array__"
+
+
+def pack(state: Dict[str, Any]) -> bytes:
+    """Serialize a session state of JSON values and numpy arrays"""
+    arrays: List[np.ndarray] = []
+
+    def encode(value):
+        if isinstance(value, np.ndarray):
+            arrays.append(np.ascontiguousarray(value))
+            return {ARRAY_KEY: len(arrays) - 1, "dtype": value.dtype.str, "length": int(value.size)}
+        if isinstance(value, dict):
+            return {key: encode(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [encode(item) for item in value]
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    header = json.dumps(encode(state), ensure_ascii=False).encode()
+    return b"".join([MAGIC, LENGTH.pack(len(header)), header] + [array.tobytes() for array in arrays])
+
+
+def unpack(data: bytes) -> Dict[str, Any]:
+    """
+    The state packed into data
+
+    Raises:
+        ValueError: Not a session snapshot, or a truncated one
+    """
+    if not data.startswith(MAGIC) or len(data) < len(MAGIC) + LENGTH.size:
+        raise ValueError("Not a realtime session snapshot")
+    (length,) = LENGTH.unpack_from(data, len(MAGIC))
+    start = len(MAGIC) + LENGTH.size
+    header = json.loads(data[start:start + length])
+    position = start + length
+    arrays: List[np.ndarray] = []
+
+    def decode(value):
+        nonlocal position
+        if isinstance(value, dict):
+            if ARRAY_KEY in value:
+                # arrays were numbered in the order they were appended, which is this walk's order
+                dtype = np.dtype(value["dtype"])
+                size = value["length"] * dtype.itemsize
+                if position + size > len(data):
+                    raise ValueError("Truncated realtime session snapshot")
+                arrays.append(np.frombuffer(data, dtype=dtype, count=value["length"], offset=position).copy())
+                position += size
+                return arrays[value[ARRAY_KEY]]
+            return {key: decode(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [decode(item) for item in value]
+        return value
+
+    return decode(header)
@@ -1,42 +1,244 @@
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
 
 from fastapi import (
     APIRouter,
     WebSocket,
+    WebSocketDisconnect,
 )
-from openai import AsyncOpenAI
+from fastapi.concurrency import run_in_threadpool
+
+from asr_fusion.routers.realtime.codecs import CODECS
+from asr_fusion.routers.realtime.session import RealtimeSession
+from asr_fusion.routers.transcription import model_manager, request_tenant
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["realtime"])
-event_router = EventRouter()
+
+# Open sessions by id, for monitoring
+sessions: Dict[str, RealtimeSession] = {}
+
+
+def recording_dir(record: bool) -> Optional[str]:
+    """
+    Directory to record a session into, or None
+
+    Raises:
+        ValueError: The client asked for a recording and the server has no recording.dir
+    """
+    recording = model_manager.config.get_recording_config()
+    if not (record or recording.get("all")):
+        return None
+    if not recording.get("dir"):
+        raise ValueError("Recording is not enabled on this server (recording.dir)")
+    return recording["dir"]
+
+
+async def send_outputs(ws: WebSocket, outputs: List[Tuple]):
+    for beg, end, text in outputs:
+        await ws.send_json({
+            "type": "transcript.text.delta",
+            "start": beg,
+            "end": end,
+            "delta": text,
+        })
+
+
+@router.get("/v1/realtime/sessions")
+async def list_sessions():
+    """Open realtime sessions, including the decisions of their adaptive chunk controllers"""
+    return {"sessions": [session.info() for session in list(sessions.values())]}
+
 
 @router.websocket("/v1/realtime")
 async def realtime(
     ws: WebSocket,
-    model: str,
-    config: ConfigDependency,
-    transcription_client: TranscriptionClientDependency,
+    model: str = "faster-whisper/small",
+    language: str = "auto",
+    vac: bool = False,
+    min_chunk_size: float = 1.0,
+    max_buffer_sec: float = 25.0,
+    target_latency: Optional[float] = None,
+    max_chunk_size: float = 5.0,
+    draft_model: Optional[str] = None,
+    commit_interval: float = 3.0,
+    tenant: Optional[str] = None,
+    codec: str = "pcm_f32le",
+    sample_rate: int = 48000,
+    channels: int = 1,
+    record: bool = False,
+    restore: bool = False,
 ) -> None:
+    """
+    Live transcription over a WebSocket.
+
+    The client sends binary frames of 16 kHz mono float32 little-endian PCM, and a
+    {"type": "session.close"} text message (or simply closes) when done. The codec chosen at
+    connection time changes the frames: pcm_s16le, or opus with one raw Opus packet per frame
+    (sample_rate and channels of the encoder, 48000 and 1 by default), decoded per session;
+    session.created confirms the codec. The server answers
+    with "transcript.text.delta" events for committed text and a final "transcript.text.done".
+    The model is the same ModelManager instance that serves /v1/audio/transcriptions.
+    With target_latency, the interval between re-decodes adapts to the measured decode time,
+    between min(min_chunk_size, 0.3) and max_chunk_size seconds.
+    With draft_model (e.g. faster-whisper/small), that model decodes every step and its uncommitted
+    hypothesis is sent as "transcript.text.partial" events, while model decodes every commit_interval
+    seconds of audio and alone decides the committed text.
+    Decodes are scheduled in the realtime priority class, ahead of file transcriptions, for the tenant
+    of the bearer API key, the X-Tenant header or the tenant query parameter.
+    With record=true (or recording.all in the configuration), the frames and their arrival times are
+    recorded into recording.dir for benchmarks/replay_session.py.
+
+    Sessions can move between workers: on {"type": "session.snapshot"} the server waits for the decode
+    in flight, answers {"type": "session.snapshot", "bytes": N} followed by one binary message of N bytes
+    holding the session's whole state, and closes without finishing the session. Connecting with
+    restore=true and sending that message as the first frame continues the session, under the same id
+    and with the arguments it was created with (the query's are ignored), on this worker;
+    session.created then has "restored": true.
+    """
     await ws.accept()
-    logger.info("Accepted websocket connection")
-
-    completion_client = AsyncOpenAI(
-        base_url=f"http://{config.host}:{config.port}/v1",
-        api_key=config.api_key.get_secret_value() if config.api_key else "cant-be-empty",
-        max_retries=0,
-    ).chat.completions
-    ctx = SessionContext(
-        transcription_client=transcription_client,
-        completion_client=completion_client,
-        session=create_session_object_configuration(model),
-    )
-    message_manager = WsServerMessageManager(ctx.pubsub)
-    async with asyncio.TaskGroup() as tg:
-        event_listener_task = tg.create_task(event_listener(ctx), name="event_listener")
-        async with asyncio.timeout(OPENAI_REALTIME_SESSION_DURATION_SECONDS):
-            mm_task = asyncio.create_task(message_manager.run(ws))
-            # HACK: a tiny delay to ensure the message_manager.run() task is started. Otherwise, the `SessionCreatedEvent` will not be sent, as it's published before the `sender` task subscribes to the pubsub.
-            await asyncio.sleep(0.001)
-            ctx.pubsub.publish_nowait(SessionCreatedEvent(session=ctx.session))
-            await mm_task
-        event_listener_task.cancel()
-
-    logger.info(f"Finished handling '{ctx.session.id}' session")
+    # a restored session brings its own arguments, checked when it was created
+    if not restore:
+        for m in (model, draft_model or model):
+            if not m.startswith("faster-whisper/"):
+                await ws.send_json({"type": "error", "error": f"Streaming is not supported for model {m}"})
+                await ws.close(code=1003)
+                return
+        if codec not in CODECS:
+            await ws.send_json({"type": "error", "error": f"Unsupported codec {codec}, expected one of {', '.join(CODECS)}"})
+            await ws.close(code=1003)
+            return
+    try:
+        directory = None if restore else recording_dir(record)
+    except ValueError as e:
+        await ws.send_json({"type": "error", "error": str(e)})
+        await ws.close(code=1003)
+        return
+
+    tenant = request_tenant(ws.headers.get("authorization"), ws.headers.get("x-tenant") or tenant)
+    if restore:
+        message = await ws.receive()
+        if message.get("bytes") is None:
+            if message["type"] != "websocket.disconnect":
+                await ws.send_json({"type": "error", "error": "restore=true expects the snapshot as the first binary message"})
+                await ws.close(code=1003)
+            return
+        try:
+            session = await run_in_threadpool(RealtimeSession.restore, model_manager, message["bytes"], tenant)
+        except ValueError as e:
+            await ws.send_json({"type": "error", "error": str(e)})
+            await ws.close(code=1003)
+            return
+        except Exception as e:
+            logger.exception("Failed to restore realtime session")
+            await ws.send_json({"type": "error", "error": str(e)})
+            await ws.close(code=1011)
+            return
+        model, draft_model = session.model, session.draft_model
+    else:
+        try:
+            session = await run_in_threadpool(
+                RealtimeSession, model_manager, model,
+                language=language, vac=vac, min_chunk_size=min_chunk_size, max_buffer_sec=max_buffer_sec,
+                target_latency=target_latency, chunk_size_bounds=(min(min_chunk_size, 0.3), max(min_chunk_size, max_chunk_size)),
+                draft_model=draft_model, commit_interval=commit_interval,
+                tenant=tenant, codec=codec, codec_options={"sample_rate": sample_rate, "channels": channels} if codec == "opus" else None,
+                recording_dir=directory,
+            )
+        except Exception as e:
+            logger.exception("Failed to create realtime session")
+            await ws.send_json({"type": "error", "error": str(e)})
+            await ws.close(code=1011)
+            return
+
+    logger.info(f"{'Restored' if restore else 'Accepted'} realtime session {session.id} for {model}")
+    sessions[session.id] = session
+    try:
+        await ws.send_json({"type": "session.created", "session": session.info(), "restored": restore})
+
+        last_partial = ""
+        failed = False
+
+        async def process():
+            nonlocal last_partial, failed
+            while True:
+                try:
+                    outputs = await run_in_threadpool(session.process)
+                except Exception as e:
+                    # the session can't go on; the receive loop ends once the client answers the close
+                    logger.exception(f"Decoding realtime session {session.id} failed")
+                    failed = True
+                    await ws.send_json({"type": "error", "error": str(e)})
+                    await ws.close(code=1011)
+                    return
+                await send_outputs(ws, outputs)
+                if draft_model is not None:
+                    beg, end, text = session.partial()
+                    if text != last_partial:
+                        last_partial = text
+                        await ws.send_json({"type": "transcript.text.partial", "start": beg, "end": end, "text": text})
+                # audio that arrived during the decode is decoded right away, not on the client's next frame
+                if not session.ready():
+                    return
+
+        processing = None
+        connected = True
+        migrating = False
+        try:
+            while True:
+                message = await ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    connected = False
+                    break
+                if failed:
+                    # the decode failed and closed the socket, only the client's close may still come
+                    break
+                if message.get("bytes") is not None:
+                    session.insert_encoded(message["bytes"])
+                elif message.get("text"):
+                    try:
+                        event = json.loads(message["text"])
+                    except ValueError:
+                        await ws.send_json({"type": "error", "error": "Text messages must be JSON events"})
+                        continue
+                    if not isinstance(event, dict):
+                        await ws.send_json({"type": "error", "error": "Text messages must be JSON objects"})
+                        continue
+                    if event.get("type") == "session.close":
+                        break
+                    if event.get("type") == "session.snapshot":
+                        migrating = True
+                        break
+
+                # Only one decode in flight; audio arriving meanwhile is picked up by the next one
+                if session.ready() and (processing is None or processing.done()):
+                    processing = asyncio.create_task(process())
+        except WebSocketDisconnect:
+            connected = False
+        finally:
+            if processing is not None:
+                await asyncio.gather(processing, return_exceptions=True)
+
+        if failed:
+            return
+        if migrating:
+            # the state after the last decode; the session goes on wherever it's restored
+            data = await run_in_threadpool(session.snapshot)
+            await ws.send_json({"type": "session.snapshot", "session": session.id, "bytes": len(data)})
+            await ws.send_bytes(data)
+            await ws.close()
+            logger.info(f"Handed off '{session.id}' session in a {len(data)} byte snapshot")
+            return
+
+        outputs = await run_in_threadpool(session.finish)
+        if connected:
+            await send_outputs(ws, outputs)
+            await ws.send_json({"type": "transcript.text.done", "text": session.text})
+            await ws.close()
+    finally:
+        sessions.pop(session.id, None)
+        session.close()
+    logger.info(f"Finished handling '{session.id}' session")
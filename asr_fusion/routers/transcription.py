@@ -1,18 +1,56 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, BackgroundTasks, Request
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import logging
+import math
 import tempfile
+import time
 import os
 import json
 from typing import Optional, List, Generator
+from asr_fusion.memory import UPLOAD_PREFIX
+from asr_fusion.metrics import registry
 from asr_fusion.models.model_manager import ModelManager
+from asr_fusion.models.overload import OverloadController, Overloaded
+from asr_fusion.models.replica_pool import audio_duration
+from asr_fusion.models.scheduler import PRIORITIES, run_as, tenant_of
+from asr_fusion.models.stream_ingest import WindowedTranscriber, decoder_for, is_audio_body
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/v1/audio", tags=["audio"])
 
 # Initialize model manager
 model_manager = ModelManager()
+overload_controller = OverloadController(model_manager)
+
+requests_total = registry.counter("asr_requests_total", "Transcription requests", ("model", "status"))
+request_duration = registry.histogram("asr_request_duration_seconds", "Transcription request latency", ("model",))
+audio_seconds_total = registry.counter("asr_audio_seconds_total", "Audio seconds transcribed", ("model",))
+
+
+def request_tenant(authorization: Optional[str], tenant: Optional[str]) -> str:
+    """Scheduling tenant of a request, from its bearer API key or X-Tenant header"""
+    api_key = None
+    if authorization and authorization.lower().startswith("bearer "):
+        api_key = authorization[7:].strip()
+    return tenant_of(model_manager.config.get_scheduling_config(), api_key, tenant)
+
+
+class UploadStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse sent while the request body is still being received: receive() belongs to
+    the body reader, so unlike StreamingResponse it doesn't also listen on it for a disconnect
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
 
 @router.post("/transcriptions")
 async def transcribe_file(
+    request: Request,
     file: Optional[UploadFile] = File(None),
     file_url: Optional[str] = Form(None),
     model: str = Form("faster-whisper/large-v3"),
@@ -23,7 +61,11 @@ async def transcribe_file(
     response_format: str = Form("json"),
     stream: Optional[bool] = Form(False),
     temperature: float = Form(0.0),
-    timestamp_granularities: Optional[List[str]] = Form(None)
+    timestamp_granularities: Optional[List[str]] = Form(None),
+    priority: str = Header("interactive", alias="X-Priority"),
+    tenant: Optional[str] = Header(None, alias="X-Tenant"),
+    authorization: Optional[str] = Header(None),
+    session_id: Optional[str] = Header(None, alias="X-Session-Id"),
 ):
     """
     Transcribes audio into the input language.
@@ -40,10 +82,25 @@ async def transcribe_file(
         stream: If set to true, the model response data will be streamed
         temperature: The sampling temperature
         timestamp_granularities: The timestamp granularities to populate
+        priority: X-Priority header, "realtime", "interactive" or "batch"; the classes listed under `shed` in
+            the model's SLO configuration (batch by default) are rejected with 503 under overload, and
+            batch requests give way to the others between segments
+        tenant: X-Tenant header, the tenant whose weighted share of the model the request is scheduled in;
+            a bearer API key mapped in `scheduling.api_keys` takes precedence
+        session_id: X-Session-Id header; requests of one session to a remote model go to the same node
         
     Returns:
         Transcription result in the specified format
+
+    A request whose body is the audio itself (Content-Type audio/..., see transcribe_upload_stream)
+    is transcribed while it is uploaded, with the parameters in the query string.
     """
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"X-Priority must be one of {', '.join(PRIORITIES)}")
+    tenant = request_tenant(authorization, tenant)
+    if file is None and file_url is None and is_audio_body(request.headers.get("content-type", "")):
+        return await transcribe_upload_stream(request, tenant, priority)
+
     # Validate that either file or localfile_path is provided
     if file is None and file_url is None:
         raise HTTPException(status_code=400, detail="Either 'file' or 'file_url' must be provided")
@@ -52,7 +109,7 @@ async def transcribe_file(
         # Determine the audio file path to use
         if file is not None:
             # Save uploaded file to a temporary location
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
+            with tempfile.NamedTemporaryFile(delete=False, prefix=UPLOAD_PREFIX, suffix=os.path.splitext(file.filename)[1]) as temp_file:
                 temp_file.write(await file.read())
                 audio_file_url = temp_file.name
             # Schedule cleanup of temporary file
@@ -73,16 +130,41 @@ async def transcribe_file(
         kwargs["temperature"] = temperature
         if timestamp_granularities:
             kwargs["timestamp_granularities"] = timestamp_granularities
+
+        # Degrade or shed the request if its model can't serve it within the SLO
+        audio_seconds = await run_in_threadpool(audio_duration, audio_file_url)
+        try:
+            requested_model = model
+            model, degradation = overload_controller.admit(model, audio_seconds, priority, kwargs)
+        except Overloaded as e:
+            requests_total.inc(model=requested_model, status="shed")
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+        if session_id and model.startswith("remote/"):
+            kwargs["session"] = session_id
         
         # Perform transcription
         if stream:
             # Handle streaming response
             return StreamingResponse(
-                transcribe_file_to_streaming(model, audio_file_url, **kwargs),
+                transcribe_file_to_streaming(model, audio_file_url, degradation=degradation, tenant=tenant,
+                                             priority=priority, **kwargs),
                 media_type="text/event-stream"
             )
         else:
-            result = model_manager.transcribe_file(model, audio_file_url, **kwargs)
+            # Run off the event loop so concurrent requests can spread over the model's replicas
+            start = time.time()
+            try:
+                result = await run_in_threadpool(
+                    run_as, tenant, priority, model_manager.transcribe_file, model, audio_file_url, **kwargs
+                )
+            except Exception:
+                requests_total.inc(model=model, status="error")
+                raise
+            requests_total.inc(model=model, status="ok")
+            request_duration.observe(time.time() - start, model=model)
+            audio_seconds_total.inc(audio_seconds, model=model)
+            if degradation is not None:
+                result["degradation"] = degradation
             
             # Clean up temporary files if any
             # for file_path in cleanup_files:
@@ -104,21 +186,219 @@ async def transcribe_file(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def transcribe_file_to_streaming(model: str, audio_file_url: str, **kwargs) -> Generator[str, None, None]:
+async def transcribe_upload_stream(request: Request, tenant: str, priority: str) -> StreamingResponse:
+    """
+    Transcribe a request body of audio while it arrives, answering with SSE deltas right away
+
+    The body, chunked or not, is raw PCM (audio/pcm with rate, channels and format=s16le|s16be|f32le
+    parameters, or audio/L16) or a streamable container (Ogg/Opus, WebM, MP3, ADTS, FLAC, WAV) that is
+    decoded as the bytes come in. Every `window` seconds of decoded audio are transcribed while the
+    rest is still uploading, so the response ends shortly after the upload instead of a full decode
+    later. Query parameters: model (faster-whisper), language, prompt, temperature, window.
+
+    Args:
+        request: The request, its body not read yet
+        tenant: Scheduling tenant
+        priority: Priority class
+    """
+    params = request.query_params
+    model = params.get("model", "faster-whisper/large-v3")
+    if not model.startswith("faster-whisper/"):
+        raise HTTPException(status_code=400, detail=f"Transcribing while uploading is not supported for model {model}")
+    try:
+        temperature = float(params.get("temperature", 0.0))
+        window = float(params.get("window", 30.0))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="temperature and window must be numbers")
+    if window <= 0:
+        raise HTTPException(status_code=400, detail="window must be positive")
+    kwargs = {"temperature": temperature}
+    if params.get("language"):
+        kwargs["language"] = params["language"]
+    if params.get("prompt"):
+        kwargs["initial_prompt"] = params["prompt"]
+    try:
+        decoder = decoder_for(request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        requested_model = model
+        model, degradation = overload_controller.admit(model, 0.0, priority, kwargs)
+    except Overloaded as e:
+        decoder.abort()
+        decoder.close()
+        requests_total.inc(model=requested_model, status="shed")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    try:
+        pool = await run_in_threadpool(model_manager.load_model, model)
+    except Exception as e:
+        decoder.abort()
+        decoder.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    transcriber = WindowedTranscriber(pool, window=window, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    start = time.time()
+    upload = {}
+
+    async def receive_body():
+        try:
+            async for chunk in request.stream():
+                if chunk:
+                    # may block while the model is behind, which slows the upload down
+                    await run_in_threadpool(decoder.write, chunk)
+            upload["upload_seconds"] = round(time.time() - start, 3)
+        finally:
+            decoder.close()
+
+    def transcribe():
+        try:
+            for samples in decoder.samples():
+                for event in transcriber.feed(samples):
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            for event in transcriber.finish():
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        except Exception as e:
+            logger.warning(f"Failed to transcribe upload stream: {e}")
+            loop.call_soon_threadsafe(events.put_nowait, {"type": "error", "error": str(e)})
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, None)
+
+    async def stream_events():
+        receiver = asyncio.ensure_future(receive_body())
+        worker = asyncio.ensure_future(run_in_threadpool(run_as, tenant, priority, transcribe))
+        status = "error"
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                if event["type"] == "transcript.text.done":
+                    status = "ok"
+                    event["upload"] = {
+                        "received_bytes": decoder.received_bytes,
+                        "upload_seconds": upload.get("upload_seconds"),
+                        "windows": transcriber.windows,
+                    }
+                    if degradation is not None:
+                        event["degradation"] = degradation
+                    audio_seconds_total.inc(event["duration"], model=model)
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            decoder.abort()
+            receiver.cancel()
+            requests_total.inc(model=model, status=status)
+            if status == "ok":
+                request_duration.observe(time.time() - start, model=model)
+            await asyncio.gather(receiver, worker, return_exceptions=True)
+
+    return UploadStreamingResponse(stream_events(), media_type="text/event-stream")
+
+
+@router.post("/language")
+async def detect_language(
+    files: Optional[List[UploadFile]] = File(None),
+    file_urls: Optional[List[str]] = Form(None),
+    model: str = Form("auto"),
+    tenant: Optional[str] = Header(None, alias="X-Tenant"),
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Detects the spoken language of a batch of audio files without transcribing them.
+
+    Args:
+        files: Audio file objects
+        file_urls: Local file paths (alternative to file upload)
+        model: Language routing model identifier, whose detector, cache and routes are used
+        tenant: X-Tenant header, the tenant the detections are scheduled for
+
+    Returns:
+        Language, probability and the model "auto" would route to, per file in request order
+    """
+    if not files and not file_urls:
+        raise HTTPException(status_code=400, detail="Either 'files' or 'file_urls' must be provided")
+    for file_url in file_urls or []:
+        if not os.path.exists(file_url):
+            raise HTTPException(status_code=400, detail=f"Local file not found: {file_url}")
+
+    try:
+        language_router = (await run_in_threadpool(model_manager.load_model, model)).model
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not hasattr(language_router, "detect"):
+        raise HTTPException(status_code=400, detail=f"Model {model} does not route by language")
+
+    tenant = request_tenant(authorization, tenant)
+    names = []
+    paths = []
+    cleanup_files = []
+    try:
+        for file in files or []:
+            with tempfile.NamedTemporaryFile(delete=False, prefix=UPLOAD_PREFIX, suffix=os.path.splitext(file.filename)[1]) as temp_file:
+                temp_file.write(await file.read())
+            names.append(file.filename)
+            paths.append(temp_file.name)
+            cleanup_files.append(temp_file.name)
+        names += file_urls or []
+        paths += file_urls or []
+
+        # Detections run side by side on the detector's replicas
+        results = await asyncio.gather(
+            *(run_in_threadpool(run_as, tenant, "interactive", language_router.detect, path) for path in paths),
+            return_exceptions=True
+        )
+    finally:
+        for file_path in cleanup_files:
+            try:
+                os.unlink(file_path)
+            except OSError:
+                pass
+
+    return {
+        "results": [
+            {"file": name, "error": str(result)} if isinstance(result, Exception) else {"file": name, **result}
+            for name, result in zip(names, results)
+        ]
+    }
+
+
+def transcribe_file_to_streaming(model: str, audio_file_url: str, degradation=None, tenant: str = "default",
+                                 priority: str = "interactive", **kwargs) -> Generator[str, None, None]:
     """
     Stream transcription results in OpenAI format
     
     Args:
         model: Model identifier
         audio_file_url: Path to the audio file
+        degradation: Degradation applied by the overload controller, reported with the final event
+        tenant: Scheduling tenant of the request
+        priority: Priority class of the request
         **kwargs: Additional arguments for transcription
         
     Yields:
         Formatted JSON strings in OpenAI streaming format
     """
     # Get streaming results from model manager
+    start = time.time()
     stream_results = model_manager.transcribe_file_to_streaming(model, audio_file_url, **kwargs)
     
-    for result in stream_results:
-        # Format as data: JSON\n\n
-        yield f"data: {json.dumps(result, ensure_ascii=False)}\n\n"
+    status = "error"
+    try:
+        while True:
+            # Each pull may run on another worker thread with a fresh copy of the context, so the
+            # scheduling context is set for every one of them
+            result = run_as(tenant, priority, next, stream_results, None)
+            if result is None:
+                break
+            if result.get("type") == "transcript.text.done":
+                status = "ok"
+                if degradation is not None:
+                    result["degradation"] = degradation
+            # Format as data: JSON\n\n
+            yield f"data: {json.dumps(result, ensure_ascii=False)}\n\n"
+    finally:
+        requests_total.inc(model=model, status=status)
+        if status == "ok":
+            request_duration.observe(time.time() - start, model=model)
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveChunkController:
+    """Chooses how much new audio to collect before each re-decode of a streaming session.
+
+    A step that decodes `interval` seconds of new audio in `decode` seconds keeps up with the audio
+    only while decode < interval, and the oldest sample of the step is emitted after roughly
+    interval + decode seconds. The controller keeps moving averages of both per session and picks
+    the largest interval that still holds target_latency (fewer, cheaper decodes on a shared node),
+    but never one the decoder can't keep up with: decode may use at most max_load of the interval,
+    even when the latency target is then out of reach. The result is clamped to
+    [min_chunk_size, max_chunk_size].
+
+    Overload is answered at once, while the interval shrinks back by shrink_rate of the
+    difference per step, so a single fast decode doesn't bring the backlog back.
+    """
+
+    def __init__(self, chunk_size=1.0, min_chunk_size=0.3, max_chunk_size=5.0, target_latency=2.0,
+                 max_load=0.8, smoothing=0.3, shrink_rate=0.25, history=20):
+        """
+        chunk_size: initial interval in seconds of audio
+        min_chunk_size, max_chunk_size: bounds of the interval
+        target_latency: seconds from receiving audio to emitting its transcript to aim for
+        max_load: highest accepted ratio of decode time to the audio it covers
+        smoothing: weight of the newest step in the moving averages
+        shrink_rate: fraction of the way to a smaller interval taken per step
+        history: number of recent decisions kept for stats()
+        """
+        if not 0 < min_chunk_size <= max_chunk_size:
+            raise ValueError(f"Invalid chunk size bounds: {min_chunk_size}, {max_chunk_size}")
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_latency = target_latency
+        self.max_load = max_load
+        self.smoothing = smoothing
+        self.shrink_rate = shrink_rate
+        self.chunk_size = self._clamp(chunk_size)
+
+        self.decode_seconds = None  # moving averages, None until the first step
+        self.audio_seconds = None
+        self.steps = 0
+        self.decisions = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def _clamp(self, value):
+        return min(self.max_chunk_size, max(self.min_chunk_size, value))
+
+    def _average(self, current, value):
+        return value if current is None else current + self.smoothing * (value - current)
+
+    def observe(self, decode_seconds, audio_seconds):
+        """Records one decode step: decode_seconds of wall time after audio_seconds of new audio.
+        Returns the interval to use for the next step.
+        """
+        with self._lock:
+            self.steps += 1
+            self.decode_seconds = self._average(self.decode_seconds, decode_seconds)
+            self.audio_seconds = self._average(self.audio_seconds, audio_seconds)
+
+            # a slow step counts at once, the average would only catch up after the backlog built
+            stable = max(self.decode_seconds, decode_seconds) / self.max_load
+            desired = max(stable, self.target_latency - self.decode_seconds)
+            if desired >= self.chunk_size:
+                reason = "overload" if stable > self.target_latency - self.decode_seconds else "latency headroom"
+                new = self._clamp(desired)
+            else:
+                reason = "latency"
+                new = self._clamp(self.chunk_size + self.shrink_rate * (desired - self.chunk_size))
+
+            if abs(new - self.chunk_size) >= 0.05 * self.chunk_size:
+                self.decisions.append({
+                    "time": time.time(),
+                    "from": round(self.chunk_size, 3),
+                    "to": round(new, 3),
+                    "reason": reason,
+                    "decode_seconds": round(self.decode_seconds, 3),
+                })
+                logger.debug(f"chunk size {self.chunk_size:.2f} -> {new:.2f} s ({reason}, decode {self.decode_seconds:.2f} s)")
+            self.chunk_size = new
+            return new
+
+    def state(self):
+        """The adapted interval and moving averages, to carry a session over to another worker"""
+        with self._lock:
+            return {"chunk_size": self.chunk_size, "decode_seconds": self.decode_seconds,
+                    "audio_seconds": self.audio_seconds, "steps": self.steps}
+
+    def load_state(self, state):
+        with self._lock:
+            self.chunk_size = self._clamp(state["chunk_size"])
+            self.decode_seconds = state["decode_seconds"]
+            self.audio_seconds = state["audio_seconds"]
+            self.steps = state["steps"]
+
+    def stats(self):
+        with self._lock:
+            load = (self.decode_seconds / self.audio_seconds) if self.audio_seconds else None
+            return {
+                "chunk_size": round(self.chunk_size, 3),
+                "min_chunk_size": self.min_chunk_size,
+                "max_chunk_size": self.max_chunk_size,
+                "target_latency": self.target_latency,
+                "steps": self.steps,
+                "decode_seconds": None if self.decode_seconds is None else round(self.decode_seconds, 3),
+                "audio_seconds": None if self.audio_seconds is None else round(self.audio_seconds, 3),
+                "load": None if load is None else round(load, 3),
+                "estimated_latency": None if self.decode_seconds is None else round(self.audio_seconds + self.decode_seconds, 3),
+                "decisions": list(self.decisions),
+            }
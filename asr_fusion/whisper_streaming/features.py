@@ -0,0 +1,140 @@
+import contextlib
+import threading
+
+import numpy as np
+
+# Samples faster-whisper's FeatureExtractor appends to the waveform before the STFT
+PADDING = 160
+
+
+class IncrementalLogMel:
+    """Log-mel spectrogram of a growing audio buffer, computed only for newly appended audio.
+
+    Produces the same features as faster-whisper's FeatureExtractor(audio) for the whole buffer:
+    a centered (reflect padded) STFT of the buffer followed by 160 zero samples, last frame dropped.
+    A frame depends only on samples within n_fft/2 of its center, so every frame whose window ends
+    inside the audio received so far is final and cached; only the last few frames next to the
+    zero padding are recomputed on each update. The global dynamic range clamp is applied to the
+    cached log10 values on every call, which is elementwise and cheap.
+
+    The buffer may be trimmed from the front by a multiple of hop_length (see trim); the two frames
+    at the new start, which reflect around it, are then recomputed.
+    """
+
+    def __init__(self, feature_extractor):
+        """feature_extractor: faster_whisper FeatureExtractor of the model that decodes the features
+        """
+        self.n_fft = feature_extractor.n_fft
+        self.hop_length = feature_extractor.hop_length
+        self.mel_filters = feature_extractor.mel_filters
+        self.window = np.hanning(self.n_fft + 1)[:-1].astype(np.float32)
+        # frames at the buffer start whose windows reach before sample 0 and reflect around it
+        self.head_frames = -(-(self.n_fft // 2) // self.hop_length)
+        self.reset()
+
+    def reset(self):
+        self.frames = np.zeros((self.mel_filters.shape[0], 0), dtype=np.float32)  # final log10 mel frames
+        self.head_dirty = False
+        self.computed_frames = 0  # frames computed by the last update, for monitoring
+
+    def _log_mel(self, audio, first, last):
+        """log10 mel of frames [first, last) of the padded buffer"""
+        if last <= first:
+            return np.zeros((self.mel_filters.shape[0], 0), dtype=np.float32)
+        n = len(audio)
+        half = self.n_fft // 2
+        # sample indices of the windows in the zero padded buffer, reflected at both ends
+        idx = np.arange(first * self.hop_length - half, (last - 1) * self.hop_length + half)
+        length = n + PADDING
+        idx = np.abs(idx)
+        idx = np.where(idx >= length, 2 * (length - 1) - idx, idx)
+        signal = np.where(idx < n, audio[np.minimum(idx, n - 1)], 0.0).astype(np.float32)
+
+        windows = np.lib.stride_tricks.sliding_window_view(signal, self.n_fft)[::self.hop_length]
+        spectrum = np.fft.rfft(windows * self.window, axis=-1).astype(np.complex64)
+        magnitudes = np.abs(spectrum) ** 2
+        mel_spec = self.mel_filters @ magnitudes.T
+        return np.log10(np.clip(mel_spec, a_min=1e-10, a_max=None)).astype(np.float32)
+
+    def update(self, audio):
+        """Returns normalized log-mel features (n_mels, n_frames) for the whole audio buffer,
+        or None if the buffer is shorter than one STFT window (let the model compute those).
+        """
+        n = len(audio)
+        if n < self.n_fft:
+            return None
+        total = n // self.hop_length + 1
+        # frames whose window lies entirely inside the received audio won't change any more
+        final = min(total, max(0, (n - self.n_fft // 2) // self.hop_length + 1))
+
+        if self.head_dirty:
+            head = min(self.head_frames, self.frames.shape[1], final)
+            self.frames[:, :head] = self._log_mel(audio, 0, head)
+            self.head_dirty = False
+
+        cached = min(self.frames.shape[1], final)
+        new_final = self._log_mel(audio, cached, final)
+        self.frames = np.concatenate([self.frames[:, :cached], new_final], axis=1)
+        tail = self._log_mel(audio, final, total)
+        self.computed_frames = new_final.shape[1] + tail.shape[1]
+
+        log_spec = np.concatenate([self.frames, tail], axis=1)
+        log_spec = np.maximum(log_spec, log_spec.max() - 8.0)
+        return (log_spec + 4.0) / 4.0
+
+    def trim(self, samples):
+        """The audio buffer lost its first `samples` samples. Drops their frames.
+
+        samples must be a multiple of hop_length to keep the cached frames aligned,
+        otherwise the cache is discarded and rebuilt on the next update.
+        """
+        if samples <= 0:
+            return
+        if samples % self.hop_length:
+            self.reset()
+            return
+        self.frames = self.frames[:, samples // self.hop_length:]
+        self.head_dirty = True
+
+
+class _PrecomputedFeatureExtractor:
+    """Stands in for a WhisperModel's feature_extractor. Returns the features registered for the
+    current thread when called on the very audio array they were computed from, otherwise computes
+    them as usual (e.g. when faster-whisper's own VAD filter has replaced the audio)."""
+
+    def __init__(self, feature_extractor):
+        self._feature_extractor = feature_extractor
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self._feature_extractor, name)
+
+    def __call__(self, waveform, padding=PADDING, chunk_length=None):
+        audio, features = getattr(self._local, "override", (None, None))
+        if features is not None and waveform is audio and padding == PADDING and chunk_length in (None, self._feature_extractor.chunk_length):
+            return features
+        return self._feature_extractor(waveform, padding=padding, chunk_length=chunk_length)
+
+
+_install_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def precomputed_features(whisper_model, audio, features):
+    """Make whisper_model.transcribe(audio) in this thread use the given features for audio.
+
+    The model stays shareable: the override is thread-local and only matches this audio array.
+    Without features (None) the model computes them as usual.
+    """
+    if features is None:
+        yield
+        return
+    with _install_lock:
+        if not isinstance(whisper_model.feature_extractor, _PrecomputedFeatureExtractor):
+            whisper_model.feature_extractor = _PrecomputedFeatureExtractor(whisper_model.feature_extractor)
+    extractor = whisper_model.feature_extractor
+    extractor._local.override = (audio, features)
+    try:
+        yield
+    finally:
+        extractor._local.override = (None, None)
@@ -72,7 +72,12 @@ class VADIterator:
         self.current_sample += window_size_samples
 
         speech_prob = self.model(x, self.sampling_rate).item()
+        return self.decide(speech_prob, return_seconds)
 
+    def decide(self, speech_prob, return_seconds=False):
+        """
+        Update the speech state with the probability of the window that ended at current_sample
+        """
         if (speech_prob >= self.threshold) and self.temp_end:
             self.temp_end = 0
 
@@ -99,20 +104,148 @@ class VADIterator:
 # (see https://github.com/ufal/whisper_streaming/issues/116 )
 
 import numpy as np
+
+
+class EnergyGate:
+    def __init__(self, margin_db: float = 3.0, silence_db: float = -65.0, zcr_margin: float = 0.1,
+                 floor_rise_db: float = 3.0, warmup_windows: int = 16, sampling_rate: int = 16000):
+        """
+        Cheap energy / zero-crossing pre-gate of the neural VAD, with an adaptive noise floor
+
+        The floor follows the energy of the windows that aren't speech: down at once, up by at most
+        floor_rise_db per second, so it settles on the background (line noise, hold music) and
+        isn't dragged up by speech; the zero-crossing rate of the background is tracked alongside.
+        Windows not clearly above the floor, and crossing zero about as often as the background
+        (unlike unvoiced consonants over a hum), are silence without asking the model.
+
+        Args:
+            margin_db: Windows up to this much above the noise floor are silence
+            silence_db: Windows below this level (dBFS) are silence even before the floor is known
+            zcr_margin: Zero-crossing rate (per sample) above the background's at which a quiet window
+                still goes to the model
+            floor_rise_db: How fast the floor may rise, in dB per second
+            warmup_windows: Non-speech windows seen by the model before the floor is used
+            sampling_rate: Sample rate of the audio
+        """
+        self.margin_db = margin_db
+        self.silence_db = silence_db
+        self.zcr_margin = zcr_margin
+        self.floor_rise_db = floor_rise_db
+        self.warmup_windows = warmup_windows
+        self.sampling_rate = sampling_rate
+        self.reset()
+
+    def reset(self):
+        self.floor_db = None
+        self.floor_zcr = None
+        self.observed = 0
+
+    @staticmethod
+    def features(x: np.ndarray):
+        """Energy (dBFS) and zero-crossing rate of a window, or of each row of a (windows, samples) array"""
+        x = np.asarray(x, dtype=np.float32)
+        energy_db = 10 * np.log10(np.mean(np.square(x), axis=-1) + 1e-10)
+        signs = np.signbit(x)
+        zcr = np.mean(signs[..., 1:] != signs[..., :-1], axis=-1)
+        return energy_db, zcr
+
+    def silent(self, energy_db: float, zcr: float) -> bool:
+        """Whether a window can skip the model"""
+        if energy_db < self.silence_db:
+            return True
+        if self.floor_db is None or self.observed < self.warmup_windows:
+            return False
+        return energy_db < self.floor_db + self.margin_db and zcr <= self.floor_zcr + self.zcr_margin
+
+    def update(self, energy_db: float, zcr: float, window_samples: int, speech: bool):
+        """Track the floor with a window the model (or the gate) found not to be speech"""
+        if speech:
+            return
+        self.observed += 1
+        if self.floor_db is None:
+            self.floor_db, self.floor_zcr = energy_db, zcr
+            return
+        rise = self.floor_rise_db * window_samples / self.sampling_rate
+        self.floor_db = min(energy_db, self.floor_db + rise)
+        self.floor_zcr += 0.05 * (zcr - self.floor_zcr)
+
+
 class FixedVADIterator(VADIterator):
 
+    def __init__(self, model, gate: EnergyGate = None, **kwargs):
+        """
+        gate: EnergyGate deciding the windows that are silence without running the model. It is only
+        consulted outside speech, so the end of an utterance is still timed by the model alone.
+        """
+        self.gate = gate
+        self.model_calls = 0
+        self.gated_windows = 0
+        super().__init__(model, **kwargs)
+
     def reset_states(self):
         super().reset_states()
         self.buffer = np.array([],dtype=np.float32)
+        if self.gate is not None:
+            self.gate.reset()
 
     def __call__(self, x, return_seconds=False):
         self.buffer = np.append(self.buffer, x) 
         if len(self.buffer) >= 512:
-            ret = super().__call__(self.buffer, return_seconds=return_seconds)
-            self.buffer = np.array([],dtype=np.float32)
+            window, self.buffer = self.buffer, np.array([],dtype=np.float32)
+            if self.gate is None:
+                self.model_calls += 1
+                return super().__call__(window, return_seconds=return_seconds)
+            energy_db, zcr = self.gate.features(window)
+            if not self.triggered and self.gate.silent(energy_db, zcr):
+                # the window is counted as if the model had returned 0: the sample clock moves on and
+                # the model's recurrent state stays at the last (silent) window it saw
+                self.gated_windows += 1
+                self.current_sample += len(window)
+                ret = self.decide(0.0, return_seconds)
+                self.gate.update(energy_db, zcr, len(window), speech=False)
+                return ret
+            self.model_calls += 1
+            ret = super().__call__(window, return_seconds=return_seconds)
+            self.gate.update(energy_db, zcr, len(window), speech=self.triggered)
             return ret
         return None
 
+    def state(self):
+        """Position and speech state of the iterator; the model's recurrent state isn't part of it"""
+        gate = self.gate
+        return {
+            "triggered": self.triggered,
+            "temp_end": self.temp_end,
+            "current_sample": self.current_sample,
+            "buffer": self.buffer,
+            "model_calls": self.model_calls,
+            "gated_windows": self.gated_windows,
+            "gate": None if gate is None else {"floor_db": gate.floor_db, "floor_zcr": gate.floor_zcr, "observed": gate.observed},
+        }
+
+    def load_state(self, state):
+        """Continue from state(); the model starts over from its initial (silence) state"""
+        self.reset_states()
+        self.triggered = state["triggered"]
+        self.temp_end = state["temp_end"]
+        self.current_sample = state["current_sample"]
+        self.buffer = np.asarray(state["buffer"], dtype=np.float32)
+        self.model_calls = state["model_calls"]
+        self.gated_windows = state["gated_windows"]
+        if self.gate is not None and state.get("gate"):
+            self.gate.floor_db = state["gate"]["floor_db"]
+            self.gate.floor_zcr = state["gate"]["floor_zcr"]
+            self.gate.observed = state["gate"]["observed"]
+
+    def stats(self):
+        windows = self.model_calls + self.gated_windows
+        return {
+            "windows": windows,
+            "model_calls": self.model_calls,
+            "gated_fraction": round(self.gated_windows / windows, 3) if windows else 0.0,
+            "noise_floor_db": round(float(self.gate.floor_db), 1) if self.gate is not None and self.gate.floor_db is not None else None,
+        }
+
 if __name__ == "__main__":
     # test/demonstrate the need for FixedVADIterator:
 
@@ -7,8 +7,13 @@ import time
 import logging
 
 import io
+import json
 import soundfile as sf
 import math
+from collections import deque
+
+from asr_fusion.whisper_streaming.adaptive_chunk import AdaptiveChunkController
+from asr_fusion.whisper_streaming.features import IncrementalLogMel, precomputed_features
 
 logger = logging.getLogger(__name__)
 
@@ -31,7 +36,12 @@ class ASRBase:
     sep = " "   # join transcribe words with this character (" " for whisper_timestamped,
                 # "" for faster-whisper because it emits the spaces when neeeded)
 
-    def __init__(self, lan, modelsize=None, cache_dir=None, model_dir=None, logfile=sys.stderr):
+    def __init__(self, lan, modelsize=None, cache_dir=None, model_dir=None, logfile=sys.stderr,
+                 model_manager=None, model_identifier=None, device="cpu", compute_type="int8"):
+        """model_manager, model_identifier: take the model from ModelManager (e.g. "faster-whisper/large-v3"),
+        sharing the loaded weights, replicas and config.yaml settings with file transcription.
+        Otherwise a model is loaded for this object only, from modelsize or model_dir, on device with compute_type.
+        """
         self.logfile = logfile
 
         self.transcribe_kargs = {}
@@ -40,7 +50,12 @@ class ASRBase:
         else:
             self.original_language = lan
 
-        self.model = self.load_model(modelsize, cache_dir, model_dir)
+        self.device = device
+        self.compute_type = compute_type
+        if model_manager is not None:
+            self.model = model_manager.load_model(model_identifier)
+        else:
+            self.model = self.load_model(modelsize, cache_dir, model_dir)
 
 
     def load_model(self, modelsize, cache_dir):
@@ -52,16 +67,23 @@ class ASRBase:
     def use_vad(self):
         raise NotImplemented("must be implemented in the child class")
 
+    def feature_extractor(self):
+        """The feature extractor of the model, if transcribe accepts precomputed features from it. None otherwise."""
+        return None
+
 
 
 class FasterWhisperASR(ASRBase):
     """Uses faster-whisper library as the backend. Works much faster, appx 4-times (in offline mode). For GPU, it requires installation with a specific CUDNN version.
+
+    self.model is a ReplicaPool of FasterWhisperModel, the same type ModelManager serves file transcription from.
     """
 
     sep = ""
 
     def load_model(self, modelsize=None, cache_dir=None, model_dir=None):
-        from faster_whisper import WhisperModel
+        from asr_fusion.models.faster_whisper_model import FasterWhisperModel
+        from asr_fusion.models.replica_pool import Replica, ReplicaPool
 #        logging.getLogger("faster_whisper").setLevel(logger.level)
         if model_dir is not None:
             logger.debug(f"Loading whisper model from model_dir {model_dir}. modelsize and cache_dir parameters are not used.")
@@ -72,25 +94,28 @@ class FasterWhisperASR(ASRBase):
             raise ValueError("modelsize or model_dir parameter must be set")
 
 
-        # this worked fast and reliably on NVIDIA L40
-        model = WhisperModel(model_size_or_path, device="cuda", compute_type="float16", download_root=cache_dir)
+        # tested: cuda with float16 worked fast and reliably on NVIDIA L40
+        # int8_float16 on GPU: the transcripts were different, probably worse than with FP16, and it was slightly (appx 20%) slower
+        # cpu with int8: works, but slow, appx 10-times than cuda FP16
+        model = FasterWhisperModel(model_size_or_path, model_size_or_path, device=self.device,
+                                   compute_type=self.compute_type, download_root=cache_dir)
+        return ReplicaPool(f"faster-whisper/{model_size_or_path}", [Replica(0, model)])
 
-        # or run on GPU with INT8
-        # tested: the transcripts were different, probably worse than with FP16, and it was slightly (appx 20%) slower
-        #model = WhisperModel(model_size, device="cuda", compute_type="int8_float16")
+    def feature_extractor(self):
+        if self.transcribe_kargs.get("vad_filter"):
+            return None  # faster-whisper's VAD filter decodes different audio than the buffer
+        return self.model.model.model.feature_extractor
 
-        # or run on CPU with INT8
-        # tested: works, but slow, appx 10-times than cuda FP16
-#        model = WhisperModel(modelsize, device="cpu", compute_type="int8") #, download_root="faster-disk-cache-dir/")
-        return model
-
-    def transcribe(self, audio, init_prompt=""):
+    def transcribe(self, audio, init_prompt="", features=None):
+        """features: log-mel spectrogram of audio from feature_extractor(), skips recomputing it"""
 
         # tested: beam_size=5 is faster and better than 1 (on one 200 second document from En ESIC, min chunk 0.01)
-        segments, info = self.model.transcribe(audio, language=self.original_language, initial_prompt=init_prompt, beam_size=5, word_timestamps=True, condition_on_previous_text=True, **self.transcribe_kargs)
-        #print(info)  # info contains language detection result
+        with self.model.acquire(len(audio)/16000) as replica, \
+                precomputed_features(replica.model.model, audio, features):
+            segments, info = replica.model.model.transcribe(audio, language=self.original_language, initial_prompt=init_prompt, beam_size=replica.model.beam_size, word_timestamps=True, condition_on_previous_text=True, **self.transcribe_kargs)
+            #print(info)  # info contains language detection result
 
-        return list(segments)
+            return list(segments)
 
     def ts_words(self, segments):
         o = []
@@ -214,6 +239,20 @@ class HypothesisBuffer:
 
         self.logfile = logfile
 
+    def state(self):
+        """JSON-serializable state, for moving a session to another worker"""
+        return {
+            "commited_in_buffer": self.commited_in_buffer, "buffer": self.buffer, "new": self.new,
+            "last_commited_time": self.last_commited_time, "last_commited_word": self.last_commited_word,
+        }
+
+    def load_state(self, state):
+        self.commited_in_buffer = [tuple(w) for w in state["commited_in_buffer"]]
+        self.buffer = [tuple(w) for w in state["buffer"]]
+        self.new = [tuple(w) for w in state["new"]]
+        self.last_commited_time = state["last_commited_time"]
+        self.last_commited_word = state["last_commited_word"]
+
     def insert(self, new, offset):
         # compare self.commited_in_buffer and new. It inserts only the words in new that extend the commited_in_buffer, it means they are roughly behind last_commited_time and new in content
         # the new tail is added to self.new
@@ -262,6 +301,20 @@ class HypothesisBuffer:
         self.commited_in_buffer.extend(commit)
         return commit
 
+    def commit_until(self, time):
+        # commits the unconfirmed words of the last hypothesis, up to and including the first one that ends at or after "time".
+        # used when the audio buffer must be cut and there is no confirmed word boundary late enough
+        commit = []
+        while self.buffer:
+            na, nb, nt = self.buffer.pop(0)
+            commit.append((na,nb,nt))
+            self.last_commited_word = nt
+            self.last_commited_time = nb
+            if nb >= time:
+                break
+        self.commited_in_buffer.extend(commit)
+        return commit
+
     def pop_commited(self, time):
         while self.commited_in_buffer and self.commited_in_buffer[0][1] <= time:
             self.commited_in_buffer.pop(0)
@@ -269,24 +322,153 @@ class HypothesisBuffer:
     def complete(self):
         return self.buffer
 
+
+class TranscriptFileSink:
+    """Appends committed words to a file, one JSON [beg, end, "word"] per line.
+    file: path, or an open text file object (e.g. a tempfile.SpooledTemporaryFile)
+    """
+
+    def __init__(self, file):
+        self.file = open(file, "a", encoding="utf-8") if isinstance(file, (str, bytes)) else file
+
+    def __call__(self, words):
+        for b, e, t in words:
+            self.file.write(json.dumps([b, e, t], ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def read_words(self):
+        self.file.seek(0)
+        words = [tuple(json.loads(line)) for line in self.file if line.strip()]
+        self.file.seek(0, io.SEEK_END)
+        return words
+
+
+class CommittedHistory:
+    """Committed words of a processor, kept with constant memory over the session length.
+
+    In memory are only the words still inside the audio buffer and a rolling window of the last
+    prompt_chars characters scrolled out of it, from which the prompt is built. Words falling out of
+    the window are passed to sink (a callable taking a list of (beg, end, "word"), e.g.
+    TranscriptFileSink) if given, otherwise dropped.
+    Iterating, indexing and len() see the words in memory, in order.
+    """
+
+    def __init__(self, prompt_chars=200, sink=None):
+        self.prompt_chars = prompt_chars
+        self.sink = sink
+        self.in_buffer = deque()  # committed words not yet scrolled out of the audio buffer
+        self.prompt_window = deque()  # scrolled out words, newest last
+        self.prompt_window_chars = 0  # sum of len(word)+1, as counted by the prompt
+        self.total_words = 0
+
+    def extend(self, words):
+        self.in_buffer.extend(words)
+        self.total_words += len(words)
+
+    def advance(self, buffer_time_offset):
+        """The audio buffer now starts at buffer_time_offset: words ending before it become prompt."""
+        spilled = []
+        # the last committed word always stays in the context, as the original prompt() did
+        while len(self.in_buffer) > 1 and self.in_buffer[0][1] <= buffer_time_offset:
+            w = self.in_buffer.popleft()
+            self.prompt_window.append(w)
+            self.prompt_window_chars += len(w[2])+1
+            # keep the shortest suffix that still reaches prompt_chars
+            while self.prompt_window and self.prompt_window_chars - (len(self.prompt_window[0][2])+1) >= self.prompt_chars:
+                old = self.prompt_window.popleft()
+                self.prompt_window_chars -= len(old[2])+1
+                spilled.append(old)
+        if spilled and self.sink is not None:
+            self.sink(spilled)
+
+    def flush(self, tail=()):
+        """Passes all words in memory, then tail, to the sink and forgets them. Call when the processing ends."""
+        words = list(self.prompt_window) + list(self.in_buffer) + list(tail)
+        self.prompt_window.clear()
+        self.prompt_window_chars = 0
+        self.in_buffer.clear()
+        if words and self.sink is not None:
+            self.sink(words)
+
+    def state(self):
+        return {
+            "in_buffer": list(self.in_buffer), "prompt_window": list(self.prompt_window),
+            "prompt_window_chars": self.prompt_window_chars, "total_words": self.total_words,
+        }
+
+    def load_state(self, state):
+        self.in_buffer = deque(tuple(w) for w in state["in_buffer"])
+        self.prompt_window = deque(tuple(w) for w in state["prompt_window"])
+        self.prompt_window_chars = state["prompt_window_chars"]
+        self.total_words = state["total_words"]
+
+    def prompt_words(self):
+        return [t for _,_,t in self.prompt_window]
+
+    def context_words(self):
+        return [t for _,_,t in self.in_buffer]
+
+    def __len__(self):
+        return len(self.prompt_window) + len(self.in_buffer)
+
+    def __iter__(self):
+        yield from self.prompt_window
+        yield from self.in_buffer
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        if i < 0:
+            i += len(self)
+        if i < len(self.prompt_window):
+            return self.prompt_window[i]
+        return self.in_buffer[i - len(self.prompt_window)]
+
+    def __repr__(self):
+        return f"CommittedHistory({list(self)!r})"
+
+
 class OnlineASRProcessor:
 
     SAMPLING_RATE = 16000
 
-    def __init__(self, asr, tokenizer=None, buffer_trimming=("segment", 15), logfile=sys.stderr):
+    def __init__(self, asr, tokenizer=None, buffer_trimming=("segment", 15), logfile=sys.stderr, incremental_features=True,
+                 max_buffer_sec=None, buffer_overlap_sec=1.0, transcript_sink=None, chunk_controller=None,
+                 draft_asr=None, commit_interval=3.0):
         """asr: WhisperASR object
         tokenizer: sentence tokenizer object for the target language. Must have a method *split* that behaves like the one of MosesTokenizer. It can be None, if "segment" buffer trimming option is used, then tokenizer is not used at all.
         ("segment", 15)
         buffer_trimming: a pair of (option, seconds), where option is either "sentence" or "segment", and seconds is a number. Buffer is trimmed if it is longer than "seconds" threshold. Default is the most recommended option.
         logfile: where to store the log. 
+        incremental_features: keep the log-mel spectrogram of the audio buffer between iterations and compute it only for the newly inserted audio, if the asr backend supports it.
+        max_buffer_sec: hard limit of the audio buffer after each iteration. When the sentence/segment trimming leaves it longer, it is cut at a committed word boundary,
+            committing the current hypothesis up to the cut if no confirmed boundary is late enough. None for no limit.
+        buffer_overlap_sec: committed audio kept at the start of the buffer after such a cut, so the next decode has acoustic context.
+        transcript_sink: receives committed words once they're no longer needed for the prompt, and everything left on finish()
+            (a callable taking a list of (beg, end, "word"), e.g. TranscriptFileSink). Committed history is not kept in memory beyond that.
+        chunk_controller: AdaptiveChunkController told the duration of every decode and the new audio it covered.
+            Its chunk_size is the interval the caller should collect audio for before calling process_iter again.
+        draft_asr: optional fast ASR object (e.g. a small model) for two-pass processing. It then decodes the buffer on each
+            process_iter and only updates partial(), while asr decodes once at least commit_interval seconds of new audio
+            arrived (and on finish()) and alone decides what's committed.
+        commit_interval: seconds of new audio between decodes of asr when draft_asr is used.
         """
         self.asr = asr
         self.tokenizer = tokenizer
         self.logfile = logfile
+        self.feature_extractor = asr.feature_extractor() if incremental_features else None
+        self.draft_asr = draft_asr
+        self.draft_feature_extractor = draft_asr.feature_extractor() if draft_asr is not None and incremental_features else None
+        self.commit_interval = commit_interval
+        self.transcript_sink = transcript_sink
+        self.chunk_controller = chunk_controller
+        self.commited = None
 
         self.init()
 
         self.buffer_trimming_way, self.buffer_trimming_sec = buffer_trimming
+        self.max_buffer_sec = max_buffer_sec
+        self.buffer_overlap_sec = buffer_overlap_sec
 
     def init(self, offset=None):
         """run this when starting or restarting processing"""
@@ -296,41 +478,69 @@ class OnlineASRProcessor:
         if offset is not None:
             self.buffer_time_offset = offset
         self.transcript_buffer.last_commited_time = self.buffer_time_offset
-        self.commited = []
+        if self.commited is not None:
+            self.commited.flush()
+        self.commited = CommittedHistory(sink=self.transcript_sink)
+        self.new_audio_samples = 0  # inserted since the last decode
+        self.features = IncrementalLogMel(self.feature_extractor) if self.feature_extractor is not None else None
+        self.draft_features = IncrementalLogMel(self.draft_feature_extractor) if self.draft_feature_extractor is not None else None
+        self.commit_audio_samples = 0  # inserted since the last decode of asr
+        self.partial_words = []  # latest hypothesis after the committed text
 
     def insert_audio_chunk(self, audio):
         self.audio_buffer = np.append(self.audio_buffer, audio)
+        self.new_audio_samples += len(audio)
+        self.commit_audio_samples += len(audio)
 
     def prompt(self):
         """Returns a tuple: (prompt, context), where "prompt" is a 200-character suffix of commited text that is inside of the scrolled away part of audio buffer. 
         "context" is the commited text that is inside the audio buffer. It is transcribed again and skipped. It is returned only for debugging and logging reasons.
         """
-        k = max(0,len(self.commited)-1)
-        while k > 0 and self.commited[k-1][1] > self.buffer_time_offset:
-            k -= 1
-
-        p = self.commited[:k]
-        p = [t for _,_,t in p]
-        prompt = []
-        l = 0
-        while p and l < 200:  # 200 characters prompt size
-            x = p.pop(-1)
-            l += len(x)+1
-            prompt.append(x)
-        non_prompt = self.commited[k:]
-        return self.asr.sep.join(prompt[::-1]), self.asr.sep.join(t for _,_,t in non_prompt)
+        self.commited.advance(self.buffer_time_offset)
+        return self.asr.sep.join(self.commited.prompt_words()), self.asr.sep.join(self.commited.context_words())
+
+    def decode(self, asr, features, prompt):
+        """Transcribes the audio buffer with asr, using and updating its incremental features"""
+        logger.debug(f"transcribing {len(self.audio_buffer)/self.SAMPLING_RATE:2.2f} seconds from {self.buffer_time_offset:2.2f}")
+        decode_start = time.time()
+        features = features.update(self.audio_buffer) if features is not None else None
+        if features is not None:
+            res = asr.transcribe(self.audio_buffer, init_prompt=prompt, features=features)
+        else:
+            res = asr.transcribe(self.audio_buffer, init_prompt=prompt)
+        if self.chunk_controller is not None:
+            self.chunk_controller.observe(time.time() - decode_start, self.new_audio_samples/self.SAMPLING_RATE)
+        self.new_audio_samples = 0
+        return res
 
     def process_iter(self):
         """Runs on the current audio buffer.
         Returns: a tuple (beg_timestamp, end_timestamp, "text"), or (None, None, ""). 
         The non-emty text is confirmed (committed) partial transcript.
         """
-
+        if self.draft_asr is not None and self.commit_audio_samples < self.commit_interval*self.SAMPLING_RATE:
+            self.draft_iter()
+            return (None, None, "")
+        return self.to_flush(self.commit_iter())
+
+    def draft_iter(self):
+        """Updates partial_words with the draft model only. Nothing gets committed."""
+        prompt, _ = self.prompt()
+        res = self.decode(self.draft_asr, self.draft_features, prompt)
+        tsw = [(b+self.buffer_time_offset, e+self.buffer_time_offset, t) for b,e,t in self.draft_asr.ts_words(res)]
+        self.partial_words = tsw
+        self.trim_partial()
+        logger.debug(f"DRAFT: {self.to_flush(self.partial_words)}")
+
+    def commit_iter(self):
+        """Decodes the buffer with asr, commits the confirmed words and trims the buffer.
+        Returns: the newly committed words, [(beg,end,"word"), ...]
+        """
         prompt, non_prompt = self.prompt()
         logger.debug(f"PROMPT: {prompt}")
         logger.debug(f"CONTEXT: {non_prompt}")
-        logger.debug(f"transcribing {len(self.audio_buffer)/self.SAMPLING_RATE:2.2f} seconds from {self.buffer_time_offset:2.2f}")
-        res = self.asr.transcribe(self.audio_buffer, init_prompt=prompt)
+        res = self.decode(self.asr, self.features, prompt)
+        self.commit_audio_samples = 0
 
         # transform to [(beg,end,"word1"), ...]
         tsw = self.asr.ts_words(res)
@@ -340,7 +550,8 @@ class OnlineASRProcessor:
         self.commited.extend(o)
         completed = self.to_flush(o)
         logger.debug(f">>>>COMPLETE NOW: {completed}")
-        the_rest = self.to_flush(self.transcript_buffer.complete())
+        self.partial_words = list(self.transcript_buffer.complete())
+        the_rest = self.to_flush(self.partial_words)
         logger.debug(f"INCOMPLETE: {the_rest}")
 
         # there is a newly confirmed text
@@ -368,13 +579,70 @@ class OnlineASRProcessor:
             logger.debug("chunking segment")
             #self.chunk_at(t)
 
+        if self.max_buffer_sec is not None and len(self.audio_buffer)/self.SAMPLING_RATE > self.max_buffer_sec:
+            o = o + self.chunk_bounded()
+
         logger.debug(f"len of buffer now: {len(self.audio_buffer)/self.SAMPLING_RATE:2.2f}")
-        return self.to_flush(o)
+        return o
+
+    def trim_partial(self):
+        """Drops the words of partial_words that the last commit covered"""
+        last = self.transcript_buffer.last_commited_time
+        self.partial_words = [w for w in self.partial_words if w[0] > last-0.1]
+
+    def partial(self):
+        """The uncommitted hypothesis after the committed text: from the draft model if it decoded last.
+        Returns: the same format as self.process_iter()
+        """
+        return self.to_flush(self.partial_words)
+
+    def state(self):
+        """Everything the processor needs to go on where it is, e.g. in another process: the audio buffer
+        (a numpy array), the hypothesis and committed words and the counters. The spectrogram cache is left
+        out and rebuilt from the audio on the next decode. Not thread safe: take it between steps.
+        """
+        return {
+            "audio_buffer": self.audio_buffer,
+            "buffer_time_offset": self.buffer_time_offset,
+            "transcript_buffer": self.transcript_buffer.state(),
+            "commited": self.commited.state(),
+            "new_audio_samples": self.new_audio_samples,
+            "commit_audio_samples": self.commit_audio_samples,
+            "partial_words": self.partial_words,
+            "chunk_controller": self.chunk_controller.state() if self.chunk_controller is not None else None,
+        }
+
+    def load_state(self, state):
+        """Continue from state() of a processor with the same arguments"""
+        self.init(offset=state["buffer_time_offset"])
+        self.audio_buffer = np.asarray(state["audio_buffer"], dtype=np.float32)
+        self.transcript_buffer.load_state(state["transcript_buffer"])
+        self.commited.load_state(state["commited"])
+        self.new_audio_samples = state["new_audio_samples"]
+        self.commit_audio_samples = state["commit_audio_samples"]
+        self.partial_words = [tuple(w) for w in state["partial_words"]]
+        if self.chunk_controller is not None and state.get("chunk_controller"):
+            self.chunk_controller.load_state(state["chunk_controller"])
+
+    def memory(self):
+        """Sizes of what the processor holds: audio and spectrogram bytes, hypothesis and committed words.
+        Read from another thread while decoding, so the numbers may be one step apart.
+        """
+        features = sum(f.frames.nbytes for f in (self.features, self.draft_features) if f is not None)
+        hypothesis = self.transcript_buffer
+        return {
+            "audio_buffer_bytes": self.audio_buffer.nbytes,
+            "audio_buffer_seconds": round(len(self.audio_buffer) / self.SAMPLING_RATE, 3),
+            "features_bytes": features,
+            "hypothesis_words": len(hypothesis.buffer) + len(hypothesis.new) + len(hypothesis.commited_in_buffer),
+            "partial_words": len(self.partial_words),
+            "committed_words_in_memory": len(self.commited.in_buffer) + len(self.commited.prompt_window),
+        }
 
     def chunk_completed_sentence(self):
-        if self.commited == []: return
+        if not self.commited: return
         logger.debug(self.commited)
-        sents = self.words_to_sentences(self.commited)
+        sents = self.words_to_sentences(list(self.commited))
         for s in sents:
             logger.debug(f"\t\tSENT: {s}")
         if len(sents) < 2:
@@ -388,7 +656,7 @@ class OnlineASRProcessor:
         self.chunk_at(chunk_at)
 
     def chunk_completed_segment(self, res):
-        if self.commited == []: return
+        if not self.commited: return
 
         ends = self.asr.segments_end_ts(res)
 
@@ -412,13 +680,53 @@ class OnlineASRProcessor:
 
 
 
+    def chunk_bounded(self):
+        """Cuts the buffer down to max_buffer_sec at a word boundary, even when Whisper gave no usable segment ends.
+        Keeps buffer_overlap_sec of committed audio if possible.
+        Returns: the words that had to be committed from the hypothesis to make the cut, [] usually.
+        """
+        buffer_end = self.buffer_time_offset + len(self.audio_buffer)/self.SAMPLING_RATE
+        min_cut = buffer_end - self.max_buffer_sec
+
+        ends = [e for _,e,_ in self.transcript_buffer.commited_in_buffer if e > self.buffer_time_offset]
+        forced = []
+        if not ends or ends[-1] < min_cut:
+            # nothing confirmed late enough: commit the hypothesis up to the cut
+            forced = self.transcript_buffer.commit_until(min_cut)
+            self.commited.extend(forced)
+            self.trim_partial()
+            ends += [e for _,e,_ in forced]
+            logger.debug(f"--- force committed {len(forced)} words")
+
+        late_enough = [e for e in ends if e >= min_cut]
+        if late_enough:
+            with_overlap = [e for e in late_enough if e <= ends[-1] - self.buffer_overlap_sec]
+            t = with_overlap[-1] if with_overlap else late_enough[0]
+        else:
+            t = min_cut  # no words at all in the audio that must go
+        logger.debug(f"--- buffer bounded at {t:2.2f}")
+        self.chunk_at(t)
+        return forced
+
     def chunk_at(self, time):
         """trims the hypothesis and audio buffer at "time"
         """
-        self.transcript_buffer.pop_commited(time)
         cut_seconds = time - self.buffer_time_offset
-        self.audio_buffer = self.audio_buffer[int(cut_seconds*self.SAMPLING_RATE):]
+        cut = int(cut_seconds*self.SAMPLING_RATE)
+        features = self.features if self.features is not None else self.draft_features
+        if features is not None:
+            # cut on a spectrogram frame boundary so the cached frames stay valid
+            cut -= cut % features.hop_length
+            time = self.buffer_time_offset + cut/self.SAMPLING_RATE
+        # the hypothesis is cut where the audio is
+        self.transcript_buffer.pop_commited(time)
+        if self.features is not None:
+            self.features.trim(cut)
+        if self.draft_features is not None:
+            self.draft_features.trim(cut)
+        self.audio_buffer = self.audio_buffer[cut:]
         self.buffer_time_offset = time
+        self.commited.advance(time)
 
     def words_to_sentences(self, words):
         """Uses self.tokenizer for sentence segmentation of words.
@@ -450,9 +758,15 @@ class OnlineASRProcessor:
         """Flush the incomplete text when the whole processing ends.
         Returns: the same format as self.process_iter()
         """
+        commited = []
+        if self.draft_asr is not None and self.commit_audio_samples and len(self.audio_buffer):
+            # the end of the audio was only seen by the draft model
+            commited = self.commit_iter()
         o = self.transcript_buffer.complete()
-        f = self.to_flush(o)
-        logger.debug(f"last, noncommited: {f}")
+        f = self.to_flush(commited + o)
+        logger.debug(f"last, noncommited: {self.to_flush(o)}")
+        self.commited.flush(o)
+        self.partial_words = []
         self.buffer_time_offset += len(self.audio_buffer)/16000
         return f
 
@@ -478,12 +792,15 @@ class VACOnlineASRProcessor(OnlineASRProcessor):
     It works the same way as OnlineASRProcessor: it receives chunks of audio (e.g. 0.04 seconds), 
     it runs VAD and continuously detects whether there is speech or not. 
     When it detects end of speech (non-voice for 500ms), it makes OnlineASRProcessor to end the utterance immediately.
+    With vad_gate, windows of silence near the tracked noise floor are decided by an energy/zero-crossing
+    gate without running Silero (see silero_vad.EnergyGate).
     '''
 
-    def __init__(self, online_chunk_size, *a, **kw):
+    def __init__(self, online_chunk_size, *a, vad_gate=True, **kw):
         self.online_chunk_size = online_chunk_size
 
         self.online = OnlineASRProcessor(*a, **kw)
+        self.chunk_controller = self.online.chunk_controller
 
         # VAC:
         import torch
@@ -491,8 +808,9 @@ class VACOnlineASRProcessor(OnlineASRProcessor):
             repo_or_dir='snakers4/silero-vad',
             model='silero_vad'
         )
-        from silero_vad import FixedVADIterator
-        self.vac = FixedVADIterator(model)  # we use all the default options: 500ms silence, etc.  
+        from asr_fusion.whisper_streaming.silero_vad import EnergyGate, FixedVADIterator
+        # we use all the default options: 500ms silence, etc.
+        self.vac = FixedVADIterator(model, gate=EnergyGate() if vad_gate else None)
 
         self.logfile = self.online.logfile
         self.init()
@@ -551,7 +869,7 @@ class VACOnlineASRProcessor(OnlineASRProcessor):
     def process_iter(self):
         if self.is_currently_final:
             return self.finish()
-        elif self.current_online_chunk_buffer_size > self.SAMPLING_RATE*self.online_chunk_size:
+        elif self.current_online_chunk_buffer_size > self.SAMPLING_RATE*self.chunk_size():
             self.current_online_chunk_buffer_size = 0
             ret = self.online.process_iter()
             return ret
@@ -559,6 +877,46 @@ class VACOnlineASRProcessor(OnlineASRProcessor):
             print("no online update, only VAD", self.status, file=self.logfile)
             return (None, None, "")
 
+    def partial(self):
+        return self.online.partial()
+
+    def state(self):
+        """The wrapped processor's state, the VAC buffer and the VAD iterator's position.
+        Silero's recurrent state isn't included: it restarts from silence on load_state(),
+        which costs at most a window or two of onset accuracy.
+        """
+        return {
+            "online": self.online.state(),
+            "status": self.status,
+            "audio_buffer": self.audio_buffer,
+            "buffer_offset": self.buffer_offset,
+            "current_online_chunk_buffer_size": self.current_online_chunk_buffer_size,
+            "is_currently_final": self.is_currently_final,
+            "vad": self.vac.state(),
+        }
+
+    def load_state(self, state):
+        self.init()
+        self.online.load_state(state["online"])
+        self.status = state["status"]
+        self.audio_buffer = np.asarray(state["audio_buffer"], dtype=np.float32)
+        self.buffer_offset = state["buffer_offset"]
+        self.current_online_chunk_buffer_size = state["current_online_chunk_buffer_size"]
+        self.is_currently_final = state["is_currently_final"]
+        self.vac.load_state(state["vad"])
+
+    def memory(self):
+        memory = self.online.memory()
+        # audio kept before an utterance starts, and the VAD's window in progress
+        memory["vac_buffer_bytes"] = self.audio_buffer.nbytes + self.vac.buffer.nbytes
+        return memory
+
+    def chunk_size(self):
+        """Seconds of voiced audio to collect between decodes"""
+        if self.chunk_controller is not None:
+            return self.chunk_controller.chunk_size
+        return self.online_chunk_size
+
     def finish(self):
         ret = self.online.finish()
         self.current_online_chunk_buffer_size = 0
@@ -575,13 +933,26 @@ def add_shared_args(parser):
     parser.add_argument('--model', type=str, default='large-v2', choices="tiny.en,tiny,base.en,base,small.en,small,medium.en,medium,large-v1,large-v2,large-v3,large".split(","),help="Name size of the Whisper model to use (default: large-v2). The model is automatically downloaded from the model hub if not present in model cache dir.")
     parser.add_argument('--model_cache_dir', type=str, default=None, help="Overriding the default model cache dir where models downloaded from the hub are saved")
     parser.add_argument('--model_dir', type=str, default=None, help="Dir where Whisper model.bin and other files are saved. This option overrides --model and --model_cache_dir parameter.")
+    parser.add_argument('--model-id', dest='model_id', type=str, default=None, help="ModelManager model identifier, e.g. faster-whisper/large-v3. Loads the model with the device, compute type and threads from --config. Overrides --model and --model_dir.")
+    parser.add_argument('--config', type=str, default="config.yaml", help="Configuration file used with --model-id.")
+    parser.add_argument('--device', type=str, default="cpu", help="Device for --model/--model_dir: cpu or cuda.")
+    parser.add_argument('--compute-type', dest='compute_type', type=str, default="int8", help="CTranslate2 compute type for --model/--model_dir, e.g. int8 on cpu, float16 on cuda.")
     parser.add_argument('--lan', '--language', type=str, default='auto', help="Source language code, e.g. en,de,cs, or 'auto' for language detection.")
     parser.add_argument('--task', type=str, default='transcribe', choices=["transcribe","translate"],help="Transcribe or translate.")
     parser.add_argument('--backend', type=str, default="faster-whisper", choices=["faster-whisper", "whisper_timestamped", "openai-api"],help='Load only this backend for Whisper processing.')
     parser.add_argument('--vac', action="store_true", default=False, help='Use VAC = voice activity controller. Recommended. Requires torch.')
     parser.add_argument('--vac-chunk-size', type=float, default=0.04, help='VAC sample size in seconds.')
+    parser.add_argument('--no-vac-gate', dest='vac_gate', action="store_false", default=True, help='Run the Silero VAD on every window, also on the silence the energy pre-gate would skip.')
     parser.add_argument('--vad', action="store_true", default=False, help='Use VAD = voice activity detection, with the default parameters.')
+    parser.add_argument('--buffer_trimming', type=str, default="segment", choices=["sentence", "segment"],help='Buffer trimming strategy -- trim completed sentences marked with punctuation mark and detected by sentence segmenter, or the completed segments returned by Whisper. Sentence segmenter must be installed for "sentence" option.')
     parser.add_argument('--buffer_trimming_sec', type=float, default=15, help='Buffer trimming length threshold in seconds. If buffer length is longer, trimming sentence/segment is triggered.')
+    parser.add_argument('--max_buffer_sec', type=float, default=None, help='Hard limit of the audio buffer in seconds. If sentence/segment trimming leaves it longer, it is cut at the last committed word boundary, which bounds the decode cost of each iteration.')
+    parser.add_argument('--buffer_overlap_sec', type=float, default=1.0, help='Committed audio kept in the buffer after a --max_buffer_sec cut.')
+    parser.add_argument('--draft-model-id', dest='draft_model_id', type=str, default=None, help="Two-pass mode: ModelManager identifier of a fast model (e.g. faster-whisper/small) that decodes every chunk for partial output, while the main model decodes every --commit-interval seconds and decides the committed text. Loaded with --config.")
+    parser.add_argument('--commit-interval', dest='commit_interval', type=float, default=3.0, help='Seconds of new audio between decodes of the main model in two-pass mode.')
+    parser.add_argument('--adaptive-chunk', dest='adaptive_chunk', action="store_true", default=False, help='Adapt --min-chunk-size to the measured decode time, to hold --target-latency without falling behind the audio.')
+    parser.add_argument('--target-latency', dest='target_latency', type=float, default=2.0, help='Latency in seconds aimed at by --adaptive-chunk.')
+    parser.add_argument('--chunk-size-bounds', dest='chunk_size_bounds', type=float, nargs=2, default=(0.3, 5.0), metavar=('MIN', 'MAX'), help='Bounds of the chunk size chosen by --adaptive-chunk, in seconds.')
     parser.add_argument("-l", "--log-level", dest="log_level", choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], help="Set the log level", default='DEBUG')
 
 def asr_factory(args, logfile=sys.stderr):
@@ -589,6 +960,7 @@ def asr_factory(args, logfile=sys.stderr):
     Creates and configures an ASR and ASR Online instance based on the specified backend and arguments.
     """
     backend = args.backend
+    draft_asr = None
     if backend == "openai-api":
         logger.debug("Using OpenAI API.")
         asr = OpenaiApiASR(lan=args.lan)
@@ -597,10 +969,22 @@ def asr_factory(args, logfile=sys.stderr):
         asr_cls = FasterWhisperASR
 
         # Only for FasterWhisperASR and WhisperTimestampedASR
-        size = args.model
         t = time.time()
-        logger.info(f"Loading Whisper {size} model for {args.lan}...")
-        asr = asr_cls(modelsize=size, lan=args.lan, cache_dir=args.model_cache_dir, model_dir=args.model_dir)
+        model_manager = None
+        if getattr(args, 'model_id', None) or getattr(args, 'draft_model_id', None):
+            from asr_fusion.models.model_manager import ModelManager
+            model_manager = ModelManager(args.config)
+        if getattr(args, 'model_id', None):
+            logger.info(f"Loading {args.model_id} from {args.config} for {args.lan}...")
+            asr = asr_cls(lan=args.lan, model_manager=model_manager, model_identifier=args.model_id)
+        else:
+            size = args.model
+            logger.info(f"Loading Whisper {size} model for {args.lan}...")
+            asr = asr_cls(modelsize=size, lan=args.lan, cache_dir=args.model_cache_dir, model_dir=args.model_dir,
+                          device=args.device, compute_type=args.compute_type)
+        if getattr(args, 'draft_model_id', None):
+            logger.info(f"Loading draft model {args.draft_model_id} from {args.config}...")
+            draft_asr = asr_cls(lan=args.lan, model_manager=model_manager, model_identifier=args.draft_model_id)
         e = time.time()
         logger.info(f"done. It took {round(e-t,2)} seconds.")
 
@@ -608,10 +992,14 @@ def asr_factory(args, logfile=sys.stderr):
     if getattr(args, 'vad', False):  # Checks if VAD argument is present and True
         logger.info("Setting VAD filter")
         asr.use_vad()
+        if draft_asr is not None:
+            draft_asr.use_vad()
 
     language = args.lan
     if args.task == "translate":
         asr.set_translate_task()
+        if draft_asr is not None:
+            draft_asr.set_translate_task()
         tgt_language = "en"  # Whisper translates into English
     else:
         tgt_language = language  # Whisper transcribes in this language
@@ -619,12 +1007,22 @@ def asr_factory(args, logfile=sys.stderr):
     # Create the tokenizer
     tokenizer = None
 
+    chunk_controller = None
+    if getattr(args, 'adaptive_chunk', False):
+        min_chunk_size, max_chunk_size = args.chunk_size_bounds
+        chunk_controller = AdaptiveChunkController(args.min_chunk_size, min_chunk_size, max_chunk_size, target_latency=args.target_latency)
+
     # Create the OnlineASRProcessor
     if args.vac:
         
-        online = VACOnlineASRProcessor(args.min_chunk_size, asr,tokenizer,logfile=logfile,buffer_trimming=(args.buffer_trimming, args.buffer_trimming_sec))
+        online = VACOnlineASRProcessor(args.min_chunk_size, asr,tokenizer,logfile=logfile,buffer_trimming=(args.buffer_trimming, args.buffer_trimming_sec),
+                                       max_buffer_sec=args.max_buffer_sec, buffer_overlap_sec=args.buffer_overlap_sec, chunk_controller=chunk_controller,
+                                       draft_asr=draft_asr, commit_interval=getattr(args, 'commit_interval', 3.0),
+                                       vad_gate=getattr(args, 'vac_gate', True))
     else:
-        online = OnlineASRProcessor(asr,tokenizer,logfile=logfile,buffer_trimming=(args.buffer_trimming, args.buffer_trimming_sec))
+        online = OnlineASRProcessor(asr,tokenizer,logfile=logfile,buffer_trimming=(args.buffer_trimming, args.buffer_trimming_sec),
+                                    max_buffer_sec=args.max_buffer_sec, buffer_overlap_sec=args.buffer_overlap_sec, chunk_controller=chunk_controller,
+                                    draft_asr=draft_asr, commit_interval=getattr(args, 'commit_interval', 3.0))
 
     return asr, online
 
@@ -738,6 +1136,8 @@ if __name__ == "__main__":
     else: # online = simultaneous mode
         end = 0
         while True:
+            if online.chunk_controller is not None and not args.vac:
+                min_chunk = online.chunk_controller.chunk_size
             now = time.time() - start
             if now < end+min_chunk:
                 time.sleep(min_chunk+end-now)
@@ -759,6 +1159,8 @@ if __name__ == "__main__":
             if end >= duration:
                 break
         now = None
+        if online.chunk_controller is not None:
+            logger.info(f"adaptive chunk: {online.chunk_controller.stats()}")
 
     o = online.finish()
     output_transcript(o, now=now)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-session decode CPU of Opus realtime ingest against raw float32 PCM.
+
+Encodes audio once into raw Opus packets (as a client would send them, one per WebSocket
+frame), then replays them into --sessions decoders with a state each, interleaved frame by
+frame as a server would receive them, and reports bandwidth per stream next to the CPU spent
+decoding per second of audio. The float32 PCM path is measured the same way for comparison.
+
+    python benchmarks/opus_ingest_benchmark.py --audio speech.wav --bitrate 24000 --sessions 50
+"""
+
+import sys
+import os
+import time
+import argparse
+
+import av
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asr_fusion.routers.realtime.codecs import create_decoder
+
+OPUS_RATE = 48000
+
+
+def load_audio(path: str, seconds: float) -> np.ndarray:
+    """48 kHz mono int16 samples of a file, or a synthetic voiced signal without one"""
+    if path is None:
+        t = np.arange(int(seconds * OPUS_RATE)) / OPUS_RATE
+        # a few harmonics of a gliding pitch, amplitude modulated like syllables
+        pitch = 120 + 40 * np.sin(2 * np.pi * 0.3 * t)
+        phase = 2 * np.pi * np.cumsum(pitch) / OPUS_RATE
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+        envelope = np.clip(np.sin(2 * np.pi * 2.5 * t), 0, None)
+        return (voiced * envelope * 6000).astype(np.int16)
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=OPUS_RATE)
+    chunks = []
+    with av.open(path) as container:
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+    return np.concatenate(chunks)[:int(seconds * OPUS_RATE)]
+
+
+def encode_opus(samples: np.ndarray, bitrate: int, frame_ms: int) -> list:
+    encoder = av.CodecContext.create("libopus", "w")
+    encoder.sample_rate = OPUS_RATE
+    encoder.layout = "mono"
+    encoder.format = "s16"
+    encoder.bit_rate = bitrate
+    encoder.options = {"frame_duration": str(frame_ms), "application": "voip"}
+    encoder.open()
+    frame_size = OPUS_RATE * frame_ms // 1000
+    packets = []
+    for start in range(0, len(samples) - frame_size + 1, frame_size):
+        frame = av.AudioFrame.from_ndarray(samples[None, start:start + frame_size], format="s16", layout="mono")
+        frame.sample_rate = OPUS_RATE
+        frame.pts = start
+        packets.extend(bytes(packet) for packet in encoder.encode(frame))
+    packets.extend(bytes(packet) for packet in encoder.encode(None))
+    return packets
+
+
+def pcm_frames(samples: np.ndarray, frame_ms: int) -> list:
+    """The same audio as 16 kHz float32 frames, as sent without a codec"""
+    audio = samples.astype(np.float32) / 32768.0
+    audio = np.interp(np.arange(0, len(audio), OPUS_RATE / 16000), np.arange(len(audio)), audio).astype(np.float32)
+    frame_size = 16000 * frame_ms // 1000
+    return [audio[start:start + frame_size].tobytes() for start in range(0, len(audio), frame_size)]
+
+
+def replay(codec: str, frames: list, sessions: int) -> dict:
+    decoders = [create_decoder(codec) for _ in range(sessions)]
+    decoded = 0
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    for frame in frames:
+        for decoder in decoders:
+            decoded += len(decoder.decode(frame))
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    return {"cpu": cpu, "wall": wall, "audio_seconds": decoded / 16000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Opus vs PCM realtime ingest cost")
+    parser.add_argument("--audio", default=None, help="Audio file to encode, synthetic speech-like signal by default")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Seconds of audio per session")
+    parser.add_argument("--bitrate", type=int, default=24000, help="Opus bitrate in bit/s")
+    parser.add_argument("--frame-ms", type=int, default=20, help="Opus frame duration")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent sessions decoded")
+    args = parser.parse_args()
+
+    samples = load_audio(args.audio, args.seconds)
+    seconds = len(samples) / OPUS_RATE
+    packets = encode_opus(samples, args.bitrate, args.frame_ms)
+    frames = pcm_frames(samples, args.frame_ms)
+
+    print(f"{seconds:.1f}s of audio, {args.sessions} sessions, {args.frame_ms} ms frames")
+    print(f"{'codec':<10} {'kbit/s':>8} {'cpu ms/audio s':>15} {'core % / stream':>16} {'streams/core':>13}")
+    for codec, payloads in (("pcm_f32le", frames), ("opus", packets)):
+        result = replay(codec, payloads, args.sessions)
+        kbps = sum(len(payload) for payload in payloads) * 8 / seconds / 1000
+        per_second = result["cpu"] / (result["audio_seconds"] or 1)
+        print(f"{codec:<10} {kbps:>8.1f} {per_second * 1000:>15.3f} {per_second * 100:>16.3f} "
+              f"{1 / per_second if per_second else float('inf'):>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
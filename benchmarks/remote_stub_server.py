@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Stub ASR Fusion node for exercising the remote engine without models.
+
+Answers /health and /v1/audio/transcriptions (plain and stream=true) like a real node, with a
+transcription naming the stub, after --real-time-factor seconds per second of assumed audio
+(--audio-seconds, the uploaded body is not decoded). Keep-alive is on, as with uvicorn.
+
+    python benchmarks/remote_stub_server.py --port 8701 --name a &
+    python benchmarks/remote_stub_server.py --port 8702 --name b &
+
+and in config.yaml:
+
+    model:
+      remote:
+        small:
+          model: faster-whisper/small
+          nodes: [http://localhost:8701, http://localhost:8702]
+"""
+
+import argparse
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(args):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, json.dumps({"status": "healthy"}).encode())
+            else:
+                self._send(404, b'{"detail": "Not Found"}')
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path != "/v1/audio/transcriptions":
+                self._send(404, b'{"detail": "Not Found"}')
+                return
+            fields = dict(re.findall(rb'name="([^"]+)"\r\n\r\n([^\r]*)\r\n', body))
+            model = fields.get(b"model", b"").decode()
+            time.sleep(args.audio_seconds * args.real_time_factor)
+            text = f"stub {args.name} transcribed {len(body)} bytes with {model}"
+            tenant = self.headers.get("X-Tenant")
+
+            if fields.get(b"stream") != b"true":
+                result = {"text": text, "language": "en", "duration": args.audio_seconds, "tenant": tenant,
+                          "segments": [{"id": 0, "start": 0.0, "end": args.audio_seconds, "text": text}]}
+                self._send(200, json.dumps(result).encode())
+                return
+
+            events = [{"type": "transcript.text.delta", "delta": word + " "} for word in text.split()]
+            events.append({"type": "transcript.text.done", "text": text, "language": "en",
+                           "duration": args.audio_seconds})
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for event in events:
+                data = f"data: {json.dumps(event)}\n\n".encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub ASR Fusion node")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8701)
+    parser.add_argument("--name", default=None, help="Name reported in transcriptions, the port by default")
+    parser.add_argument("--audio-seconds", type=float, default=10.0, help="Assumed duration of every upload")
+    parser.add_argument("--real-time-factor", type=float, default=0.05, help="Seconds of delay per audio second")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    args.name = args.name or str(args.port)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    print(f"Stub node {args.name} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded realtime session with its original frame timing, and report latency and CPU.
+
+A recording (see `recording` in config.yaml) holds the session parameters and every frame as the
+client sent it, with its arrival time. The replay feeds the frames at the same pace, --speed
+times faster, either into a RealtimeSession in this process (models loaded from --config, decodes
+on a worker thread like the server does), or to a live server with --server.
+
+Commit latency is the time from when the audio at the end of a committed word was fed until the
+word was committed. Locally, CPU time of the process per second of audio and the duration of every
+processing step are reported too.
+
+    python benchmarks/replay_session.py recordings/sess_1234.asrrec --speed 4
+    python benchmarks/replay_session.py recordings/sess_1234.asrrec --server ws://localhost:8603
+"""
+
+import sys
+import os
+import json
+import time
+import bisect
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asr_fusion.routers.realtime.codecs import create_decoder
+from asr_fusion.routers.realtime.recording import read_recording
+
+SAMPLING_RATE = 16000
+
+
+class FeedClock:
+    def __init__(self):
+        """Wall time at which each amount of audio had been fed"""
+        self.seconds = [0.0]
+        self.walls = [time.perf_counter()]
+        self._lock = threading.Lock()
+
+    def fed(self, audio_seconds: float):
+        with self._lock:
+            self.seconds.append(self.seconds[-1] + audio_seconds)
+            self.walls.append(time.perf_counter())
+
+    def latency(self, audio_end: float) -> float:
+        """Seconds since the audio up to audio_end was fed"""
+        with self._lock:
+            index = min(bisect.bisect_left(self.seconds, audio_end), len(self.seconds) - 1)
+            return time.perf_counter() - self.walls[index]
+
+
+def paced(frames, speed: float):
+    """The frames of a recording, each when it's due"""
+    started = time.perf_counter()
+    for offset, frame in frames:
+        delay = started + offset / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield frame
+
+
+def replay_local(params: dict, frames, speed: float, config: str) -> dict:
+    from asr_fusion.models.model_manager import ModelManager
+    from asr_fusion.routers.realtime.session import RealtimeSession
+
+    model_manager = ModelManager(config)
+    model = params.pop("model")
+    params = {key: value for key, value in params.items() if key != "recorded_at"}
+    params["buffer_trimming"] = tuple(params["buffer_trimming"])
+    params["chunk_size_bounds"] = tuple(params["chunk_size_bounds"])
+    session = RealtimeSession(model_manager, model, **params)
+    # load the models before the clock starts
+    model_manager.load_model(model)
+    if params.get("draft_model"):
+        model_manager.load_model(params["draft_model"])
+
+    clock = FeedClock()
+    latencies, steps, words = [], [], []
+    worker = ThreadPoolExecutor(max_workers=1)
+
+    def step(method):
+        started = time.perf_counter()
+        outputs = method()
+        steps.append(time.perf_counter() - started)
+        for beg, end, text in outputs:
+            latencies.append(clock.latency(end))
+            words.append(text)
+
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    processing = None
+    for frame in paced(frames, speed):
+        before = session.received_seconds
+        session.insert_encoded(frame)
+        clock.fed(session.received_seconds - before)
+        # one decode in flight, as the server does; audio arriving meanwhile goes into the next one
+        if session.ready() and (processing is None or processing.done()):
+            processing = worker.submit(step, session.process)
+    if processing is not None:
+        processing.result()
+    finish_started = time.perf_counter()
+    worker.submit(step, session.finish).result()
+    finish_seconds = time.perf_counter() - finish_started
+    result = {
+        "audio_seconds": session.received_seconds,
+        "wall_seconds": time.perf_counter() - wall,
+        "cpu_seconds": time.process_time() - cpu,
+        "steps": steps,
+        "latencies": latencies,
+        "finish_seconds": finish_seconds,
+        "text": session.text,
+        "session": session.info(),
+    }
+    worker.shutdown()
+    session.close()
+    return result
+
+
+def replay_server(params: dict, frames, speed: float, url: str) -> dict:
+    from websockets.sync.client import connect
+
+    query = {
+        "model": params["model"], "language": params["language"], "vac": str(params["vac"]).lower(),
+        "min_chunk_size": params["min_chunk_size"], "max_buffer_sec": params["max_buffer_sec"],
+        "max_chunk_size": params["chunk_size_bounds"][1], "commit_interval": params["commit_interval"],
+        "codec": params["codec"],
+    }
+    for key in ("target_latency", "draft_model"):
+        if params.get(key) is not None:
+            query[key] = params[key]
+    query.update(params.get("codec_options") or {})
+
+    clock = FeedClock()
+    decoder = create_decoder(params["codec"], **(params.get("codec_options") or {}))
+    latencies, texts = [], []
+    done = threading.Event()
+    with connect(f"{url.rstrip('/')}/v1/realtime?{urlencode(query)}", max_size=None) as ws:
+        created = json.loads(ws.recv())
+        if created.get("type") != "session.created":
+            raise RuntimeError(f"Server refused the session: {created}")
+
+        def receive():
+            for message in ws:
+                event = json.loads(message)
+                if event["type"] == "transcript.text.delta":
+                    latencies.append(clock.latency(event["end"]))
+                elif event["type"] == "transcript.text.done":
+                    texts.append(event["text"])
+                    break
+                elif event["type"] == "error":
+                    texts.append(f"error: {event['error']}")
+                    break
+            done.set()
+
+        receiver = threading.Thread(target=receive, daemon=True)
+        receiver.start()
+        wall = time.perf_counter()
+        audio_seconds = 0.0
+        for frame in paced(frames, speed):
+            ws.send(frame)
+            # decoded here only to know how much audio the frame holds
+            seconds = len(decoder.decode(frame)) / SAMPLING_RATE
+            audio_seconds += seconds
+            clock.fed(seconds)
+        finish_started = time.perf_counter()
+        ws.send(json.dumps({"type": "session.close"}))
+        done.wait()
+        finish_seconds = time.perf_counter() - finish_started
+    return {
+        "audio_seconds": audio_seconds,
+        "wall_seconds": time.perf_counter() - wall,
+        "latencies": latencies,
+        "finish_seconds": finish_seconds,
+        "text": texts[0] if texts else "",
+    }
+
+
+def percentiles(values: list) -> str:
+    if not values:
+        return "n/a"
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+    return f"p50 {statistics.median(ordered):.3f}s  p95 {p95:.3f}s  max {ordered[-1]:.3f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded realtime session")
+    parser.add_argument("recording", help="Recording file (.asrrec)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 1 for the original timing")
+    parser.add_argument("--config", default="config.yaml", help="Model configuration for the local replay")
+    parser.add_argument("--server", default=None, help="Replay against a live server instead, e.g. ws://localhost:8603")
+    parser.add_argument("--json", action="store_true", help="Print the whole result as JSON")
+    args = parser.parse_args()
+
+    params, frames = read_recording(args.recording)
+    print(f"{args.recording}: {params['model']} codec={params['codec']} vac={params['vac']} "
+          f"min_chunk_size={params['min_chunk_size']} at {args.speed}x", file=sys.stderr)
+    if args.server:
+        result = replay_server(params, frames, args.speed, args.server)
+    else:
+        result = replay_local(params, frames, args.speed, args.config)
+
+    if args.json:
+        print(json.dumps(result, indent=2, default=str))
+        return
+    audio = result["audio_seconds"] or 1e-9
+    print(f"audio {result['audio_seconds']:.1f}s replayed in {result['wall_seconds']:.1f}s")
+    print(f"commit latency ({len(result['latencies'])} commits): {percentiles(result['latencies'])}")
+    print(f"finish after the last frame: {result['finish_seconds']:.3f}s")
+    if "cpu_seconds" in result:
+        print(f"CPU {result['cpu_seconds']:.1f}s, {result['cpu_seconds'] / audio:.3f}s per audio second")
+        print(f"processing steps ({len(result['steps'])}): {percentiles(result['steps'])}")
+    print(f"text: {result['text'][:200]}")
+
+
+if __name__ == "__main__":
+    main()
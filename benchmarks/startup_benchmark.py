@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark server startup time and idle RSS for a faster-whisper-only configuration.
+
+Each measurement runs in a fresh interpreter: it imports the API server (which builds the
+ModelManager), optionally loads the faster-whisper model, and reports wall time, resident
+memory and whether torch/funasr ended up imported. --eager imports every registered engine
+up front, as the hard-coded dispatch used to, for comparison.
+
+    python benchmarks/startup_benchmark.py --model small --runs 3
+"""
+
+import sys
+import os
+import json
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, ROOT)
+from asr_fusion.models.model_manager import ModelManager
+from asr_fusion.models.registry import engine_registry
+manager = ModelManager(CONFIG)
+if EAGER:
+    for name in engine_registry.names():
+        try:
+            engine_registry.get(name)
+        except ImportError:
+            pass
+import_seconds = time.perf_counter() - start
+if MODEL:
+    manager.load_model(MODEL)
+total_seconds = time.perf_counter() - start
+with open("/proc/self/status") as file:
+    rss_kb = next(int(line.split()[1]) for line in file if line.startswith("VmRSS:"))
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "startup_seconds": total_seconds,
+    "rss_mb": rss_kb / 1024,
+    "torch_imported": "torch" in sys.modules,
+    "funasr_imported": "funasr" in sys.modules,
+}))
+"""
+
+
+def measure(config_path: str, model: str, eager: bool) -> dict:
+    code = (
+        f"ROOT = {ROOT!r}\nCONFIG = {config_path!r}\nMODEL = {model!r}\nEAGER = {eager!r}\n" + PROBE
+    )
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True, cwd=ROOT)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def report(label: str, runs: list):
+    print(f"{label}:")
+    print(f"  import  {statistics.median(r['import_seconds'] for r in runs):7.2f} s")
+    print(f"  startup {statistics.median(r['startup_seconds'] for r in runs):7.2f} s")
+    print(f"  rss     {statistics.median(r['rss_mb'] for r in runs):7.1f} MB")
+    print(f"  torch imported: {runs[0]['torch_imported']}, funasr imported: {runs[0]['funasr_imported']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time and idle RSS benchmark")
+    parser.add_argument("--model", type=str, default="small", help="faster-whisper model to configure")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per measurement")
+    parser.add_argument("--no-load", action="store_true", help="Only import the server, don't load the model")
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as file:
+        file.write(
+            "engine:\n"
+            "  faster-whisper:\n"
+            "    device: cpu\n"
+            "model:\n"
+            "  faster-whisper:\n"
+            f"    {args.model}:\n"
+            "      compute_type: int8\n"
+        )
+        config_path = file.name
+
+    model = None if args.no_load else f"faster-whisper/{args.model}"
+    try:
+        lazy = [measure(config_path, model, eager=False) for _ in range(args.runs)]
+        eager = [measure(config_path, model, eager=True) for _ in range(args.runs)]
+    finally:
+        os.unlink(config_path)
+
+    report("lazy engine registry", lazy)
+    report("all engines imported", eager)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark aggregate transcription throughput with budgeted threads against naive defaults.
+
+Loads the same faster-whisper model several times (one per replica) and runs a fixed
+number of transcriptions with a bounded number in flight, first with every replica on
+CTranslate2's default thread settings, then with threads divided by ThreadBudget.
+
+    python benchmarks/thread_budget_benchmark.py audio.wav --model small --replicas 2 --requests 8
+"""
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faster_whisper import WhisperModel, decode_audio
+from asr_fusion.config.config import Config
+from asr_fusion.models.thread_budget import ThreadBudget
+
+
+def build_budget(model: str, replicas: int, pin: bool) -> ThreadBudget:
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as file:
+        file.write(
+            "model:\n"
+            "  faster-whisper:\n"
+            f"    {model}:\n"
+            f"      replicas: {replicas}\n"
+            "threads:\n"
+            f"  pin: {'true' if pin else 'false'}\n"
+        )
+        config_path = file.name
+    try:
+        return ThreadBudget(Config(config_path))
+    finally:
+        os.unlink(config_path)
+
+
+def run(models, audio, requests: int, concurrency: int) -> float:
+    """Run the requests round-robin over the models, returning audio seconds per wall second"""
+    locks = [threading.Lock() for _ in models]
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            with locks[i % len(models)]:
+                segments, _ = models[i % len(models)].transcribe(audio, beam_size=5)
+                list(segments)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    elapsed = time.time() - start
+    return requests * len(audio) / 16000 / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thread budget throughput benchmark")
+    parser.add_argument("audio", type=str, help="Audio file to transcribe repeatedly")
+    parser.add_argument("--model", type=str, default="small", help="faster-whisper model size or path")
+    parser.add_argument("--compute-type", type=str, default="int8")
+    parser.add_argument("--replicas", type=int, default=2, help="Resident copies of the model")
+    parser.add_argument("--requests", type=int, default=8, help="Transcriptions per run")
+    parser.add_argument("--concurrency", type=int, default=None, help="Requests in flight (default: replicas)")
+    parser.add_argument("--pin", action="store_true", help="Pin budgeted replicas to their cores")
+    args = parser.parse_args()
+
+    audio = decode_audio(args.audio, sampling_rate=16000)
+    concurrency = args.concurrency or args.replicas
+    print(f"Audio: {len(audio) / 16000:.1f}s, {args.replicas} replicas, "
+          f"{args.requests} requests, {concurrency} in flight, {os.cpu_count()} CPUs")
+
+    # Naive: every replica uses CTranslate2's defaults and competes for all cores
+    naive = [WhisperModel(args.model, device="cpu", compute_type=args.compute_type) for _ in range(args.replicas)]
+    run(naive, audio[:16000], 1, 1)  # warm up
+    naive_throughput = run(naive, audio, args.requests, concurrency)
+    del naive
+    print(f"naive defaults:   {naive_throughput:7.2f} audio s/s")
+
+    # Budgeted: cores split across the replicas, optionally pinned
+    budget = build_budget(args.model, args.replicas, args.pin)
+    budgeted = []
+    for index in range(args.replicas):
+        allocation = budget.allocation_for(f"faster-whisper/{args.model}", index)
+        print(f"  replica {index}: {allocation.to_dict()}")
+        with allocation.pinned():
+            budgeted.append(WhisperModel(
+                args.model, device="cpu", compute_type=args.compute_type,
+                cpu_threads=allocation.cpu_threads, num_workers=allocation.num_workers
+            ))
+    run(budgeted, audio[:16000], 1, 1)
+    budgeted_throughput = run(budgeted, audio, args.requests, concurrency)
+    print(f"thread budget:    {budgeted_throughput:7.2f} audio s/s "
+          f"({budgeted_throughput / naive_throughput:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Measure the energy pre-gate of the realtime VAD: Silero calls avoided, and the change in speech onsets.
+
+Each file of the test set is run through two FixedVADIterators window by window, as
+VACOnlineASRProcessor feeds them: one calling Silero on every window, one behind an EnergyGate.
+The onsets ("start" events) of the ungated iterator are the reference; each is matched to the
+nearest gated onset within --tolerance seconds, and the shifts, missed and extra onsets are reported
+next to the fraction of windows the gate decided without the model.
+
+Without --audio-dir, a synthetic test set stands in: speech-like bursts between gaps of digital
+silence, line noise and hold music, at several levels.
+
+    python benchmarks/vad_gate_benchmark.py --audio-dir calls/
+"""
+
+import sys
+import os
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asr_fusion.whisper_streaming.silero_vad import EnergyGate, FixedVADIterator
+
+SAMPLING_RATE = 16000
+WINDOW = 512
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".webm"}
+
+
+def load_audio(path: str) -> np.ndarray:
+    """16 kHz mono float32 samples of a file"""
+    import av
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLING_RATE)
+    chunks = []
+    with av.open(path) as container:
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+
+
+def synthetic_speech(seconds: float, rng: np.random.Generator) -> np.ndarray:
+    """Voiced syllables with a gliding pitch, and unvoiced noise bursts between some of them"""
+    t = np.arange(int(seconds * SAMPLING_RATE)) / SAMPLING_RATE
+    pitch = 110 + 60 * rng.random() + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLING_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 10))
+    envelope = np.clip(np.sin(2 * np.pi * (3 + rng.random()) * t), 0, None) ** 0.5
+    fricatives = rng.normal(0, 0.3, len(t)) * (np.sin(2 * np.pi * 1.1 * t) > 0.8)
+    return (0.15 * voiced * envelope + 0.05 * fricatives).astype(np.float32)
+
+
+def synthetic_gap(kind: str, seconds: float, rng: np.random.Generator) -> np.ndarray:
+    n = int(seconds * SAMPLING_RATE)
+    if kind == "silence":
+        return np.zeros(n, dtype=np.float32)
+    if kind == "noise":
+        return rng.normal(0, 10 ** (-50 / 20), n).astype(np.float32)
+    # hold music: a slow arpeggio of soft tones
+    t = np.arange(n) / SAMPLING_RATE
+    notes = 220 * 2 ** (np.array([0, 4, 7, 12]) / 12)
+    tone = notes[(t * 2).astype(int) % len(notes)]
+    return (0.02 * np.sin(2 * np.pi * np.cumsum(tone) / SAMPLING_RATE)).astype(np.float32)
+
+
+def synthetic_test_set(count: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    files = {}
+    for i in range(count):
+        kind = ("silence", "noise", "music")[i % 3]
+        parts = []
+        for _ in range(6):
+            parts.append(synthetic_gap(kind, rng.uniform(2, 12), rng))
+            parts.append(synthetic_speech(rng.uniform(1, 4), rng) * rng.uniform(0.2, 1.0))
+        parts.append(synthetic_gap(kind, 3, rng))
+        files[f"synthetic_{i:02d}_{kind}"] = np.concatenate(parts)
+    return files
+
+
+def onsets(vad: FixedVADIterator, audio: np.ndarray) -> list:
+    vad.reset_states()
+    found = []
+    for start in range(0, len(audio) - WINDOW + 1, WINDOW):
+        result = vad(audio[start:start + WINDOW])
+        if result is not None and "start" in result:
+            found.append(result["start"] / SAMPLING_RATE)
+    return found
+
+
+def compare(reference: list, gated: list, tolerance: float) -> dict:
+    shifts, unmatched = [], list(gated)
+    for onset in reference:
+        if not unmatched:
+            break
+        nearest = min(unmatched, key=lambda other: abs(other - onset))
+        if abs(nearest - onset) <= tolerance:
+            shifts.append(nearest - onset)
+            unmatched.remove(nearest)
+    return {"matched": len(shifts), "missed": len(reference) - len(shifts), "extra": len(unmatched), "shifts": shifts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Silero calls avoided by the VAD energy pre-gate")
+    parser.add_argument("--audio-dir", default=None, help="Test set directory, synthetic calls by default")
+    parser.add_argument("--synthetic", type=int, default=12, help="Synthetic files without --audio-dir")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Seconds within which onsets match")
+    parser.add_argument("--margin-db", type=float, default=3.0, help="EnergyGate margin above the noise floor")
+    parser.add_argument("--zcr-margin", type=float, default=0.1, help="EnergyGate zero-crossing rate margin")
+    args = parser.parse_args()
+
+    if args.audio_dir:
+        files = {
+            name: load_audio(os.path.join(args.audio_dir, name))
+            for name in sorted(os.listdir(args.audio_dir))
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS
+        }
+    else:
+        files = synthetic_test_set(args.synthetic)
+
+    import torch
+    torch.set_num_threads(1)
+    model, _ = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad')
+    plain = FixedVADIterator(model)
+    gated = FixedVADIterator(model, gate=EnergyGate(margin_db=args.margin_db, zcr_margin=args.zcr_margin))
+
+    print(f"{'file':<28} {'audio s':>8} {'gated %':>8} {'onsets':>7} {'missed':>7} {'extra':>6} "
+          f"{'mean shift ms':>14} {'max |shift| ms':>15}")
+    totals = {"windows": 0, "gated": 0, "onsets": 0, "missed": 0, "extra": 0, "shifts": [],
+              "plain_cpu": 0.0, "gated_cpu": 0.0}
+    for name, audio in files.items():
+        cpu = time.process_time()
+        reference = onsets(plain, audio)
+        totals["plain_cpu"] += time.process_time() - cpu
+        gated.model_calls = gated.gated_windows = 0
+        cpu = time.process_time()
+        found = onsets(gated, audio)
+        totals["gated_cpu"] += time.process_time() - cpu
+        result = compare(reference, found, args.tolerance)
+
+        stats = gated.stats()
+        totals["windows"] += stats["windows"]
+        totals["gated"] += gated.gated_windows
+        totals["onsets"] += len(reference)
+        for key in ("missed", "extra", "shifts"):
+            totals[key] += result[key]
+        shifts = np.array(result["shifts"]) * 1000
+        print(f"{name[:28]:<28} {len(audio) / SAMPLING_RATE:>8.1f} {stats['gated_fraction'] * 100:>8.1f} "
+              f"{len(reference):>7} {result['missed']:>7} {result['extra']:>6} "
+              f"{shifts.mean() if len(shifts) else 0:>14.1f} {np.abs(shifts).max() if len(shifts) else 0:>15.1f}")
+
+    shifts = np.array(totals["shifts"]) * 1000
+    print()
+    print(f"Silero calls avoided: {totals['gated'] / max(totals['windows'], 1) * 100:.1f}% of {totals['windows']} windows, "
+          f"VAD CPU {totals['plain_cpu']:.2f}s -> {totals['gated_cpu']:.2f}s")
+    print(f"Onsets: {totals['onsets']} reference, {totals['missed']} missed, {totals['extra']} extra; shift mean "
+          f"{shifts.mean() if len(shifts) else 0:.1f} ms, p95 |shift| "
+          f"{np.percentile(np.abs(shifts), 95) if len(shifts) else 0:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+import asyncio
+import email.utils
+import json
+import os
+import time
+import uuid
+from typing import Optional, Dict, Any, AsyncGenerator, AsyncIterator, Iterable, List, Tuple, Union
+
+import httpx
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".webm", ".mp4", ".aac", ".wma"}
+UPLOAD_BLOCK = 64 * 1024
+RETRY_STATUSES = {429, 503}
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class SSEParser:
+    def __init__(self):
+        """Incremental parser of a text/event-stream body, fed with chunks as they arrive"""
+        self._buffer = ""
+        self._data: List[str] = []
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Parse a chunk of the stream
+
+        Returns:
+            The events completed by the chunk, decoded JSON or {"raw": data} when the data isn't JSON
+        """
+        self._buffer += chunk
+        events = []
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            line = line.rstrip("\r")
+            if not line:
+                # a blank line ends the event
+                if self._data:
+                    events.append(self._decode("\n".join(self._data)))
+                    self._data = []
+            elif line.startswith("data:"):
+                data = line[5:]
+                self._data.append(data[1:] if data.startswith(" ") else data)
+            # comments (":") and other fields (event, id, retry) aren't used by the server
+        return events
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Events left when the stream ended without a final blank line"""
+        events = self.feed("\n\n") if self._buffer or self._data else []
+        self._buffer = ""
+        return events
+
+    @staticmethod
+    def _decode(data: str) -> Dict[str, Any]:
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError:
+            return {"raw": data}
+
+
+class AsyncASRFusionClient:
+    def __init__(self, base_url: str = "http://localhost:8603", max_connections: int = 16, timeout: float = 600.0,
+                 max_retries: int = 5, max_retry_wait: float = 60.0, api_key: Optional[str] = None,
+                 tenant: Optional[str] = None):
+        """
+        Asynchronous ASR Fusion client over a pool of keep-alive connections
+
+        Args:
+            base_url: Base URL of the ASR Fusion API server
+            max_connections: Connections kept open to the server, and the most requests in flight
+            timeout: Seconds to wait for a response (or the next streamed event)
+            max_retries: Retries of a request answered with 429 or 503
+            max_retry_wait: Longest wait before a retry, whatever Retry-After says
+            api_key: Sent as a bearer token, the server maps it to a scheduling tenant
+            tenant: X-Tenant header, when no API key is used
+        """
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        headers = {}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        if tenant:
+            headers["X-Tenant"] = tenant
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=headers,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=10.0),
+        )
+
+    async def __aenter__(self) -> "AsyncASRFusionClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    @staticmethod
+    def _multipart(fields: List[Tuple[str, str]], file_path: Optional[str]) -> Tuple[Dict[str, str], Any]:
+        """
+        Headers and body of a multipart/form-data request; the file is read block by block while
+        it is sent, never as a whole
+        """
+        boundary = uuid.uuid4().hex
+        head = b"".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            for name, value in fields
+        )
+        size = 0
+        if file_path is not None:
+            filename = os.path.basename(file_path).replace('"', "")
+            head += (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n').encode()
+            size = os.path.getsize(file_path)
+        tail = (b"\r\n" if file_path is not None else b"") + f"--{boundary}--\r\n".encode()
+
+        async def body() -> AsyncIterator[bytes]:
+            yield head
+            if file_path is not None:
+                with open(file_path, "rb") as f:
+                    while True:
+                        block = await asyncio.to_thread(f.read, UPLOAD_BLOCK)
+                        if not block:
+                            break
+                        yield block
+            yield tail
+
+        headers = {
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(len(head) + size + len(tail)),
+        }
+        return headers, body
+
+    async def _post(self, path: str, fields: List[Tuple[str, str]], file_path: Optional[str] = None,
+                    headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        POST a form and return the response with its body not read yet, retrying on 429 and 503
+
+        The caller must close the response (or read it to the end).
+        """
+        for attempt in range(self.max_retries + 1):
+            multipart_headers, body = self._multipart(fields, file_path)
+            request = self._client.build_request("POST", path, headers={**(headers or {}), **multipart_headers},
+                                                 content=body())
+            response = await self._client.send(request, stream=True)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+                return response
+            await response.aclose()
+            wait = retry_after_seconds(response.headers.get("Retry-After"))
+            if wait is None:
+                wait = min(2 ** attempt * 0.5, self.max_retry_wait)
+            await asyncio.sleep(min(wait, self.max_retry_wait))
+
+    @staticmethod
+    def _fields(file_url: Optional[str], model: str, language: Optional[str], prompt: Optional[str],
+                response_format: str, temperature: float, stream: bool,
+                timestamp_granularities: Optional[Union[str, List[str]]]) -> List[Tuple[str, str]]:
+        fields = [
+            ("model", model),
+            ("response_format", response_format),
+            ("temperature", str(temperature)),
+            ("stream", "true" if stream else "false"),
+        ]
+        if file_url:
+            fields.append(("file_url", file_url))
+        if language:
+            fields.append(("language", language))
+        if prompt:
+            fields.append(("prompt", prompt))
+        if isinstance(timestamp_granularities, str):
+            timestamp_granularities = [timestamp_granularities]
+        for granularity in timestamp_granularities or []:
+            fields.append(("timestamp_granularities", granularity))
+        return fields
+
+    async def transcribe_file(
+        self,
+        file_path: Optional[str] = None,
+        file_url: Optional[str] = None,
+        model: str = "faster-whisper/small",
+        language: Optional[str] = None,
+        prompt: Optional[str] = None,
+        response_format: str = "json",
+        temperature: float = 0.0,
+        timestamp_granularities: Optional[Union[str, List[str]]] = None,
+        priority: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Transcribe an audio file using the ASR Fusion API
+
+        Args:
+            file_path: Local audio file to upload
+            file_url: Path of the audio file on the server (alternative to file_path)
+            model: Model identifier in the format "engine/model_name"
+            language: Language code (optional)
+            prompt: Initial prompt for the transcription (optional)
+            response_format: Response format (default: "json")
+            temperature: Temperature for sampling (default: 0.0)
+            timestamp_granularities: Timestamp granularities (optional)
+            priority: X-Priority header, "interactive" or "batch" (optional)
+
+        Returns:
+            Transcription result
+        """
+        fields = self._fields(file_url, model, language, prompt, response_format, temperature, False,
+                              timestamp_granularities)
+        response = await self._post("/v1/audio/transcriptions", fields, file_path,
+                                    {"X-Priority": priority} if priority else None)
+        try:
+            await response.aread()
+            return response.json()
+        finally:
+            await response.aclose()
+
+    async def stream_file(
+        self,
+        file_path: Optional[str] = None,
+        file_url: Optional[str] = None,
+        model: str = "faster-whisper/small",
+        language: Optional[str] = None,
+        prompt: Optional[str] = None,
+        temperature: float = 0.0,
+        priority: Optional[str] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Transcribe an audio file with stream=true, yielding the events as they arrive
+
+        Yields:
+            "transcript.text.delta" events, then "transcript.text.done"
+        """
+        fields = self._fields(file_url, model, language, prompt, "json", temperature, True, None)
+        response = await self._post("/v1/audio/transcriptions", fields, file_path,
+                                    {"X-Priority": priority} if priority else None)
+        parser = SSEParser()
+        try:
+            async for chunk in response.aiter_text():
+                for event in parser.feed(chunk):
+                    yield event
+            for event in parser.close():
+                yield event
+        finally:
+            await response.aclose()
+
+    async def transcribe_many(
+        self,
+        files: Union[str, Iterable[str]],
+        concurrency: int = 4,
+        **kwargs,
+    ) -> AsyncGenerator[Tuple[str, Union[Dict[str, Any], Exception]], None]:
+        """
+        Transcribe many local files, at most concurrency at a time, yielding each result as it finishes
+
+        Files are taken from the iterable only as slots free up, so it may be a long generator.
+
+        Args:
+            files: A directory (its audio files, recursively) or an iterable of file paths
+            concurrency: Requests in flight at once
+            **kwargs: Arguments of transcribe_file
+
+        Yields:
+            (file path, result), or (file path, exception) when that file failed
+        """
+        if isinstance(files, str) and os.path.isdir(files):
+            files = audio_files(files)
+        files = iter(files)
+        pending = {}
+
+        def submit() -> bool:
+            path = next(files, None)
+            if path is None:
+                return False
+            pending[asyncio.ensure_future(self.transcribe_file(file_path=path, **kwargs))] = path
+            return True
+
+        try:
+            while len(pending) < concurrency and submit():
+                pass
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    path = pending.pop(task)
+                    yield path, task.exception() or task.result()
+                    submit()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def audio_files(directory: str) -> Iterable[str]:
+    """Audio files under a directory, in sorted order"""
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                yield os.path.join(root, name)
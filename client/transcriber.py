@@ -1,33 +1,57 @@
-import requests
-import json
-from typing import Optional, Dict, Any, Generator
+import asyncio
+from typing import Optional, Dict, Any, Generator, Iterable, List, Tuple, Union
+
+from client.async_transcriber import AsyncASRFusionClient
 
 class ASRFusionClient:
-    def __init__(self, base_url: str = "http://localhost:8603"):
+    def __init__(self, base_url: str = "http://localhost:8603", **kwargs):
         """
         Initialize ASR Fusion Client
 
+        A blocking wrapper of AsyncASRFusionClient, running it on a private event loop so the
+        connections are kept alive across calls.
+
         Args:
             base_url: Base URL of the ASR Fusion API server
+            **kwargs: Further arguments of AsyncASRFusionClient (max_connections, api_key, ...)
         """
         self.base_url = base_url.rstrip('/')
+        self._loop = asyncio.new_event_loop()
+        self._client = self._loop.run_until_complete(self._create(base_url, kwargs))
+
+    @staticmethod
+    async def _create(base_url: str, kwargs: Dict[str, Any]) -> AsyncASRFusionClient:
+        return AsyncASRFusionClient(base_url, **kwargs)
+
+    def close(self):
+        if not self._loop.is_closed():
+            self._loop.run_until_complete(self._client.aclose())
+            self._loop.close()
+
+    def __enter__(self) -> "ASRFusionClient":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def transcribe_file(
         self,
-        file_url: str,
+        file_url: Optional[str] = None,
         model: str = "faster-whisper/small",
         language: Optional[str] = None,
         prompt: Optional[str] = None,
         response_format: str = "json",
         temperature: float = 0.0,
         stream: bool = False,
-        timestamp_granularities: Optional[str] = None
+        timestamp_granularities: Optional[Union[str, List[str]]] = None,
+        file_path: Optional[str] = None,
+        priority: Optional[str] = None,
     ) -> Dict[str, Any] | Generator[Dict[str, Any], None, None]:
         """
         Transcribe an audio file using the ASR Fusion API
 
         Args:
-            file_url: URL to the audio file
+            file_url: Path of the audio file on the server
             model: Model identifier in the format "engine/model_name"
             language: Language code (optional)
             prompt: Initial prompt for the transcription (optional)
@@ -35,61 +59,47 @@ class ASRFusionClient:
             temperature: Temperature for sampling (default: 0.0)
             stream: If True, stream the response (default: False)
             timestamp_granularities: Timestamp granularities (optional)
+            file_path: Local audio file to upload instead of file_url
+            priority: X-Priority header, "interactive" or "batch" (optional)
 
         Returns:
             Transcription result or generator for streaming
         """
-        url = f"{self.base_url}/v1/audio/transcriptions"
-
-        # Prepare files and data for the request
-        data = {
-            'file_url': file_url,
-            'model': model,
-            'response_format': response_format,
-            'temperature': temperature,
-            'stream': stream
-        }
-
-        # Add optional parameters
-        if language:
-            data['language'] = language
-        if prompt:
-            data['prompt'] = prompt
-        if timestamp_granularities:
-            data['timestamp_granularities'] = timestamp_granularities
-
         if stream:
             # Handle streaming response
-            return self._stream_response(url, data)
-        else:
-            # Make the request
-            response = requests.post(url, data=data)
-            response.raise_for_status()
+            return self._stream_response(self._client.stream_file(
+                file_path=file_path, file_url=file_url, model=model, language=language, prompt=prompt,
+                temperature=temperature, priority=priority,
+            ))
+        return self._loop.run_until_complete(self._client.transcribe_file(
+            file_path=file_path, file_url=file_url, model=model, language=language, prompt=prompt,
+            response_format=response_format, temperature=temperature,
+            timestamp_granularities=timestamp_granularities, priority=priority,
+        ))
 
-            return response.json()
+    def transcribe_many(self, files: Union[str, Iterable[str]], concurrency: int = 4,
+                        **kwargs) -> Generator[Tuple[str, Union[Dict[str, Any], Exception]], None, None]:
+        """
+        Transcribe many local files concurrently, see AsyncASRFusionClient.transcribe_many
 
-    def _stream_response(self, url: str, data: Dict[str, Any]) -> Generator[Dict[str, Any], None, None]:
+        Yields:
+            (file path, result or exception) in order of completion
         """
-        Handle streaming response from the server
+        return self._stream_response(self._client.transcribe_many(files, concurrency, **kwargs))
 
-        Args:
-            url: API endpoint URL
-            data: Request data
+    def _stream_response(self, events) -> Generator[Any, None, None]:
+        """
+        Drive an async generator of the client on the private loop
 
         Yields:
-            Decoded JSON objects from the streaming response
+            The items of the async generator
         """
-        with requests.post(url, data=data, stream=True) as response:
-            response.raise_for_status()
-            for line in response.iter_lines():
-                if line:
-                    decoded_line = line.decode('utf-8')
-                    # Check if it's a data line (starts with "data: ")
-                    if decoded_line.startswith("data: "):
-                        # Extract JSON data after "data: "
-                        json_data = decoded_line[6:]  # Remove "data: " prefix
-                        try:
-                            yield json.loads(json_data)
-                        except json.JSONDecodeError:
-                            # If JSON parsing fails, yield raw data
-                            yield {"raw": json_data}
+        try:
+            while True:
+                try:
+                    yield self._loop.run_until_complete(events.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            if not self._loop.is_closed():
+                self._loop.run_until_complete(events.aclose())
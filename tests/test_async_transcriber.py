@@ -0,0 +1,43 @@
+import email.utils
+import time
+
+import pytest
+
+from client.async_transcriber import SSEParser, retry_after_seconds
+
+
+def test_sse_events_split_across_chunks():
+    parser = SSEParser()
+    assert parser.feed('data: {"type": "transcript.text.delta", ') == []
+    assert parser.feed('"delta": "Hi"}\r\n') == []
+    assert parser.feed("\r\n: keep-alive\n\ndata: [DONE]\n\n") == [
+        {"type": "transcript.text.delta", "delta": "Hi"},
+        {"raw": "[DONE]"},
+    ]
+
+
+def test_sse_multiline_data_and_ignored_fields():
+    parser = SSEParser()
+    events = parser.feed('event: message\nid: 1\ndata: {"a":\ndata:1}\n\n')
+    assert events == [{"a": 1}]
+
+
+def test_sse_close_flushes_an_unterminated_event():
+    parser = SSEParser()
+    assert parser.feed('data: {"type": "transcript.text.done"}') == []
+    assert parser.close() == [{"type": "transcript.text.done"}]
+    assert parser.close() == []
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("") is None
+    assert retry_after_seconds("3") == 3.0
+    assert retry_after_seconds("1.5") == 1.5
+    assert retry_after_seconds("-4") == 0.0
+    assert retry_after_seconds("soon") is None
+
+
+def test_retry_after_http_date():
+    assert retry_after_seconds(email.utils.formatdate(time.time() + 30, usegmt=True)) == pytest.approx(30, abs=2)
+    assert retry_after_seconds(email.utils.formatdate(time.time() - 30, usegmt=True)) == 0.0
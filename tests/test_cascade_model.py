@@ -0,0 +1,46 @@
+from asr_fusion.models.cascade_model import CascadeModel
+
+
+def cascade(**kwargs) -> CascadeModel:
+    return CascadeModel("small->large-v3", None, None, "faster-whisper/small", "faster-whisper/large-v3", **kwargs)
+
+
+def segment(start: float, end: float, text: str = " text", **scores):
+    return {"start": start, "end": end, "text": text, **scores}
+
+
+def test_low_confidence():
+    model = cascade()
+    assert not model.low_confidence(segment(0.0, 1.0, avg_logprob=-0.2, compression_ratio=1.5, no_speech_prob=0.1))
+    assert model.low_confidence(segment(0.0, 1.0, avg_logprob=-1.0))
+    assert model.low_confidence(segment(0.0, 1.0, avg_logprob=-0.2, compression_ratio=3.0))
+    assert model.low_confidence(segment(0.0, 1.0, avg_logprob=-0.2, no_speech_prob=0.9))
+    # no text on likely silence is what the model should say
+    assert not model.low_confidence(segment(0.0, 1.0, text=" ", avg_logprob=-0.2, no_speech_prob=0.9))
+
+
+def test_segment_without_avg_logprob_is_escalated():
+    model = cascade()
+    assert model.low_confidence(segment(0.0, 1.0))
+    assert model.low_confidence(segment(0.0, 1.0, avg_logprob=None, compression_ratio=1.0))
+
+
+def test_funasr_segment_is_escalated():
+    model = cascade()
+    # a segment as FunASRModel reports it, without a score
+    funasr = {"id": 0, "seek": 0, "start": 0.0, "end": 2.5, "text": "你好世界", "tokens": [], "temperature": 0.0,
+              "avg_logprob": 0.0, "compression_ratio": 0.0, "no_speech_prob": 0.0}
+    assert model.low_confidence(funasr)
+    assert model.escalated_ranges([funasr], duration=3.0) == [(0.0, 3.0)]
+
+
+def test_escalated_ranges_are_padded_into_gaps_and_merged():
+    model = cascade(padding=0.5, merge_gap=1.0)
+    segments = [
+        segment(0.0, 2.0, avg_logprob=-0.1),
+        segment(2.2, 4.0),
+        segment(4.5, 6.0, avg_logprob=-2.0),
+        segment(6.0, 8.0, avg_logprob=-0.1),
+        segment(12.0, 14.0, avg_logprob=-2.0),
+    ]
+    assert model.escalated_ranges(segments, duration=14.2) == [(2.0, 6.0), (11.5, 14.2)]
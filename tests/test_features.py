@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from asr_fusion.models.replica_pool import Replica, ReplicaPool
+from asr_fusion.whisper_streaming.features import IncrementalLogMel, precomputed_features
+from asr_fusion.whisper_streaming.whisper_online import FasterWhisperASR, OnlineASRProcessor
+
+
+@pytest.fixture
+def extractor():
+    feature_extraction = pytest.importorskip("faster_whisper.feature_extractor")
+    return feature_extraction.FeatureExtractor()
+
+
+class FakeFeatureExtractor:
+    chunk_length = 30
+    n_fft = 400
+    hop_length = 160
+    mel_filters = np.zeros((80, 201), dtype=np.float32)
+
+    def __call__(self, waveform, padding=160, chunk_length=None):
+        return "computed"
+
+
+class FakeWhisperModel:
+    """Computes features like WhisperModel.transcribe, through its feature_extractor attribute"""
+
+    def __init__(self):
+        self.feature_extractor = FakeFeatureExtractor()
+        self.features = []
+
+    def transcribe(self, audio, **kwargs):
+        self.features.append(self.feature_extractor(audio))
+        return iter([]), None
+
+
+class FakeFasterWhisperModel:
+    beam_size = 5
+
+    def __init__(self):
+        self.model = FakeWhisperModel()
+
+
+class FakeModelManager:
+    def load_model(self, model_identifier):
+        return ReplicaPool(model_identifier, [Replica(0, FakeFasterWhisperModel())])
+
+
+def audio(seconds: float, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).uniform(-0.5, 0.5, int(seconds * 16000)).astype(np.float32)
+
+
+def test_matches_feature_extractor_while_the_buffer_grows(extractor):
+    samples = audio(5.0)
+    mel = IncrementalLogMel(extractor)
+    for end in (300, 4000, 16000, 16000 + 123, 40000, len(samples)):
+        features = mel.update(samples[:end])
+        if end < extractor.n_fft:
+            assert features is None
+            continue
+        np.testing.assert_allclose(features, extractor(samples[:end]), atol=1e-4)
+
+
+def test_computes_only_new_frames(extractor):
+    samples = audio(5.0)
+    mel = IncrementalLogMel(extractor)
+    mel.update(samples[:64000])
+    mel.update(samples[:64000 + 1600])
+    # 10 new frames of hop_length, plus the frames next to the zero padding
+    assert mel.computed_frames < 20
+
+
+def test_matches_feature_extractor_after_trimming(extractor):
+    samples = audio(5.0)
+    mel = IncrementalLogMel(extractor)
+    mel.update(samples[:48000])
+    mel.trim(16000)
+    np.testing.assert_allclose(mel.update(samples[16000:]), extractor(samples[16000:]), atol=1e-4)
+    # a trim off the hop_length grid drops the cache instead of misaligning it
+    mel.trim(1000)
+    np.testing.assert_allclose(mel.update(samples[17000:]), extractor(samples[17000:]), atol=1e-4)
+
+
+def test_precomputed_features_are_used_for_their_audio_only():
+    model = FakeWhisperModel()
+    samples = audio(1.0)
+    with precomputed_features(model, samples, "precomputed"):
+        assert model.feature_extractor(samples) == "precomputed"
+        assert model.feature_extractor(samples.copy()) == "computed"
+    assert model.feature_extractor(samples) == "computed"
+
+
+def test_without_precomputed_features_the_model_computes_them():
+    model = FakeWhisperModel()
+    samples = audio(1.0)
+    with precomputed_features(model, samples, None):
+        assert model.feature_extractor(samples) == "computed"
+    # an override installed before must not hand out None either
+    with precomputed_features(model, samples, "precomputed"):
+        pass
+    with precomputed_features(model, samples, None):
+        assert model.feature_extractor(samples) == "computed"
+
+
+def test_transcribe_without_features():
+    asr = FasterWhisperASR("en", model_manager=FakeModelManager(), model_identifier="faster-whisper/fake")
+    whisper_model = asr.model.model.model
+    samples = audio(1.0)
+    asr.transcribe(samples)
+    asr.transcribe(samples, features="precomputed")
+    asr.transcribe(samples)
+    assert whisper_model.features == ["computed", "precomputed", "computed"]
+
+
+def test_decode_of_a_buffer_shorter_than_n_fft():
+    asr = FasterWhisperASR("en", model_manager=FakeModelManager(), model_identifier="faster-whisper/fake")
+    online = OnlineASRProcessor(asr)
+    online.insert_audio_chunk(audio(0.01))
+    online.process_iter()
+    assert asr.model.model.model.features == ["computed"]
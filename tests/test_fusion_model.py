@@ -0,0 +1,83 @@
+import pytest
+
+from asr_fusion.models.fusion_model import FusionModel, result_confidence
+from asr_fusion.models.model_manager import ModelManager
+from asr_fusion.models.replica_pool import Replica, ReplicaPool
+
+
+class FakePool:
+    def __init__(self, result=None, fail: bool = False):
+        self.result = result
+        self.fail = fail
+        self.calls = 0
+
+    def transcribe_file(self, audio, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("model failed")
+        return dict(self.result)
+
+
+def result(text: str, avg_logprob: float):
+    return {"segments": [{"start": 0.0, "end": 1.0, "text": text, "avg_logprob": avg_logprob}],
+            "language": "en", "duration": 1.0}
+
+
+# FunASR reports an avg_logprob of 0.0, which carries no confidence
+UNSCORED = result("unscored", 0.0)
+CONFIDENT = result("confident", -0.1)
+DOUBTFUL = result("doubtful", -2.0)
+
+
+def fusion(*pools, **kwargs) -> FusionModel:
+    # the next model starts only once the previous one answered
+    return FusionModel("fusion", list(pools), [f"engine/model{i}" for i in range(len(pools))], hedge_delay=60.0,
+                       **kwargs)
+
+
+def test_result_confidence():
+    assert result_confidence(UNSCORED) is None
+    assert result_confidence(CONFIDENT) == pytest.approx(0.905, abs=1e-3)
+    words = {"segments": [{"start": 0.0, "end": 1.0, "words": [{"probability": 0.5}, {"probability": 1.0}]}]}
+    assert result_confidence(words) == pytest.approx(0.75)
+
+
+def test_unscored_result_goes_on_to_the_next_model():
+    unscored, confident = FakePool(UNSCORED), FakePool(CONFIDENT)
+    selected = fusion(unscored, confident).transcribe_file([0.0] * 16000)
+    assert selected["segments"][0]["text"] == "confident"
+    assert selected["fusion"]["accepted"]
+    assert confident.calls == 1
+
+
+def test_scored_result_below_threshold_ranks_above_unscored():
+    selected = fusion(FakePool(UNSCORED), FakePool(DOUBTFUL)).transcribe_file([0.0] * 16000)
+    assert selected["segments"][0]["text"] == "doubtful"
+    assert not selected["fusion"]["accepted"]
+
+
+def test_unscored_result_is_returned_when_every_other_model_fails():
+    selected = fusion(FakePool(UNSCORED), FakePool(fail=True)).transcribe_file([0.0] * 16000)
+    assert selected["segments"][0]["text"] == "unscored"
+    assert selected["fusion"]["confidence"] is None
+    assert not selected["fusion"]["accepted"]
+
+
+def test_accept_unscored():
+    confident = FakePool(CONFIDENT)
+    selected = fusion(FakePool(UNSCORED), confident, accept_unscored=True).transcribe_file([0.0] * 16000)
+    assert selected["segments"][0]["text"] == "unscored"
+    assert selected["fusion"]["accepted"]
+    assert confident.calls == 0
+
+
+def test_unloading_shuts_down_the_hedging_threads():
+    model = fusion(FakePool(CONFIDENT))
+    model.transcribe_file([0.0] * 16000)
+    assert model.executor._threads
+    ModelManager._unload([ReplicaPool("fusion/fusion", [Replica(0, model)])])
+    for thread in list(model.executor._threads):
+        thread.join(5.0)
+        assert not thread.is_alive()
+    with pytest.raises(RuntimeError):
+        model.executor.submit(print)
@@ -0,0 +1,224 @@
+import asyncio
+import struct
+import threading
+
+import pytest
+
+from asr_fusion.routers.realtime import mux
+from asr_fusion.routers.realtime.ws import sessions
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.events = []
+
+    async def send_json(self, event):
+        self.events.append(event)
+
+
+class FakeSession:
+    """Ready once chunk_bytes are queued; each decode turns the queued bytes into one word"""
+    chunk_bytes = 4000
+    opened = None  # set to a threading.Event to hold session creation until it is set
+
+    def __init__(self, model_manager, model, **kwargs):
+        if FakeSession.opened is not None:
+            FakeSession.opened.wait(5)
+        self.id = f"session-{id(self)}"
+        self.pending = 0
+        self.words = []
+        self.closed = False
+
+    def info(self):
+        return {"id": self.id}
+
+    def insert_encoded(self, data: bytes):
+        self.pending += len(data)
+
+    def ready(self) -> bool:
+        return self.pending >= self.chunk_bytes
+
+    def process(self):
+        if not self.pending:
+            return []
+        self.words.append(f" {self.pending}")
+        self.pending = 0
+        return [(0.0, 1.0, self.words[-1])]
+
+    def partial(self):
+        return None, None, ""
+
+    def finish(self):
+        return self.process()
+
+    @property
+    def text(self):
+        return "".join(self.words).strip()
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_session(monkeypatch):
+    created = []
+
+    def session(*args, **kwargs):
+        created.append(FakeSession(*args, **kwargs))
+        return created[-1]
+
+    monkeypatch.setattr(mux, "RealtimeSession", session)
+    FakeSession.opened = None
+    yield created
+    sessions.clear()
+
+
+def frame(stream_id: int, size: int) -> bytes:
+    return struct.pack(">I", stream_id) + bytes(size)
+
+
+async def settle(connection: mux.MuxConnection):
+    """Wait for the spawned opens, decodes and closes, then for the writer to send their events"""
+    while connection.tasks:
+        await asyncio.gather(*list(connection.tasks), return_exceptions=True)
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def run(scenario):
+    """Run scenario(connection, ws) against a connection whose writer sends to a FakeWebSocket"""
+    async def main():
+        ws = FakeWebSocket()
+        connection = mux.MuxConnection(ws, "default", max_streams=4)
+        writer = asyncio.create_task(connection.writer())
+        await scenario(connection, ws)
+        await connection.shutdown()
+        await writer
+        return ws.events
+    return asyncio.run(main())
+
+
+def of_type(events, event_type: str):
+    return [event for event in events if event["type"] == event_type]
+
+
+def test_credit_is_granted_for_consumed_bytes():
+    async def scenario(connection, ws):
+        connection.handle({"type": "stream.open", "stream": 1, "window": 8000})
+        await settle(connection)
+        for _ in range(4):
+            connection.feed(frame(1, 1000))
+        await settle(connection)
+        stream = connection.streams[1]
+        assert (stream.credit, stream.granted_bytes) == (8000, 4000)
+
+    events = run(scenario)
+    assert of_type(events, "stream.opened")[0]["window"] == 8000
+    assert of_type(events, "stream.credit") == [{"type": "stream.credit", "stream": 1, "bytes": 4000, "credit": 8000}]
+    assert of_type(events, "transcript.text.done") == [{"type": "transcript.text.done", "stream": 1, "text": "4000"}]
+
+
+def test_frame_beyond_credit_resets_the_stream(fake_session):
+    async def scenario(connection, ws):
+        connection.handle({"type": "stream.open", "stream": 1, "window": 8000})
+        await settle(connection)
+        connection.feed(frame(1, 9000))
+        await settle(connection)
+        assert connection.streams == {}
+
+    events = run(scenario)
+    assert of_type(events, "error")[0]["stream"] == 1
+    assert of_type(events, "stream.closed") == [{"type": "stream.closed", "stream": 1}]
+    assert fake_session[0].closed
+
+
+def test_stream_short_of_credit_for_a_frame_is_decoded():
+    async def scenario(connection, ws):
+        # 2500 bytes of credit fit two 1000 byte frames, less than a chunk, and leave 500 bytes
+        connection.handle({"type": "stream.open", "stream": 1, "window": 2500})
+        await settle(connection)
+        connection.feed(frame(1, 1000))
+        connection.feed(frame(1, 1000))
+        await settle(connection)
+        assert connection.streams[1].credit == 2500
+
+    events = run(scenario)
+    assert of_type(events, "stream.credit") == [{"type": "stream.credit", "stream": 1, "bytes": 2000, "credit": 2500}]
+
+
+@pytest.mark.parametrize("options", [
+    {"window": "abc"},
+    {"window": 0},
+    {"window": -5},
+    {"min_chunk_size": "x"},
+    {"target_latency": "fast"},
+    {"codec": "opus", "sample_rate": None},
+    {"codec": "mp3"},
+    {"model": 5},
+    {"model": "funasr/paraformer"},
+])
+def test_invalid_stream_open_options(options, fake_session):
+    async def scenario(connection, ws):
+        connection.handle({"type": "stream.open", "stream": 7, **options})
+        await settle(connection)
+        assert connection.opening == {} and connection.streams == {}
+        # the id is free again
+        connection.handle({"type": "stream.open", "stream": 7})
+        await settle(connection)
+        assert 7 in connection.streams
+
+    events = run(scenario)
+    assert [event["type"] for event in events[:2]] == ["error", "stream.opened"]
+    assert events[0]["stream"] == 7
+    assert len(fake_session) == 1
+
+
+def test_stream_ids_and_stream_limit():
+    async def scenario(connection, ws):
+        connection.handle({"type": "stream.open", "stream": -1})
+        for stream_id in range(5):
+            connection.handle({"type": "stream.open", "stream": stream_id})
+        connection.handle({"type": "stream.open", "stream": 0})
+        await settle(connection)
+        assert sorted(connection.streams) == [0, 1, 2, 3]
+        connection.feed(frame(9, 10))
+        connection.feed(b"ab")
+
+    errors = of_type(run(scenario), "error")
+    assert errors[0] == {"type": "error", "error": "stream.open needs a stream id between 0 and 2^32-1"}
+    assert [error.get("stream") for error in errors[1:]] == [4, 0, 9, None]
+
+
+def test_close_during_open_closes_the_stream_once_open(fake_session):
+    FakeSession.opened = threading.Event()
+
+    async def scenario(connection, ws):
+        connection.handle({"type": "stream.open", "stream": 1, "window": 8000})
+        connection.feed(frame(1, 1000))
+        connection.handle({"type": "stream.close", "stream": 1})
+        FakeSession.opened.set()
+        await settle(connection)
+        assert connection.streams == {}
+
+    events = run(scenario)
+    assert [event["type"] for event in events] == [
+        "stream.opened", "transcript.text.delta", "transcript.text.done", "stream.closed"
+    ]
+    assert events[2]["text"] == "1000"
+    assert fake_session[0].closed
+    assert sessions == {}
+
+
+def test_shutdown_closes_streams_still_opening(fake_session):
+    FakeSession.opened = threading.Event()
+
+    async def scenario(connection, ws):
+        connection.handle({"type": "stream.open", "stream": 1})
+        await asyncio.sleep(0)
+        # the client said session.close before the session existed
+        threading.Timer(0.05, FakeSession.opened.set).start()
+
+    events = run(scenario)
+    assert of_type(events, "stream.closed") == [{"type": "stream.closed", "stream": 1}]
+    assert fake_session[0].closed
+    assert sessions == {}
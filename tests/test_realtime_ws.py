@@ -0,0 +1,106 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from asr_fusion.routers.realtime import ws as realtime_ws
+
+
+class FakeSession:
+    """Decodes each message of audio into one word, named after its bytes"""
+
+    def __init__(self, model_manager, model, **kwargs):
+        self.id = "fake"
+        self.model = model
+        self.draft_model = kwargs.get("draft_model")
+        self.pending = []
+        self.words = []
+        self.closed = False
+
+    def info(self):
+        return {"id": self.id, "model": self.model}
+
+    def insert_encoded(self, data: bytes):
+        self.pending.append(data.decode())
+
+    def ready(self) -> bool:
+        return bool(self.pending)
+
+    def process(self):
+        outputs = [(len(self.words), len(self.words) + 1, f" {word}") for word in self.pending]
+        self.words += [text for _, _, text in outputs]
+        self.pending = []
+        return outputs
+
+    def finish(self):
+        return self.process()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.words).strip()
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client(monkeypatch):
+    created = []
+
+    def session(*args, **kwargs):
+        created.append(FakeSession(*args, **kwargs))
+        return created[-1]
+
+    monkeypatch.setattr(realtime_ws, "RealtimeSession", session)
+    app = FastAPI()
+    app.include_router(realtime_ws.router)
+    client = TestClient(app)
+    client.created = created
+    return client
+
+
+def receive_until(ws, event_type: str):
+    events = []
+    while not events or events[-1]["type"] != event_type:
+        events.append(ws.receive_json())
+    return events
+
+
+def test_transcribes_and_finishes(client):
+    with client.websocket_connect("/v1/realtime") as ws:
+        assert ws.receive_json()["type"] == "session.created"
+        ws.send_bytes(b"hello")
+        assert ws.receive_json() == {"type": "transcript.text.delta", "start": 0, "end": 1, "delta": " hello"}
+        ws.send_text(json.dumps({"type": "session.close"}))
+        assert receive_until(ws, "transcript.text.done")[-1]["text"] == "hello"
+    assert client.created[0].closed
+    assert realtime_ws.sessions == {}
+
+
+def test_malformed_events_are_answered_with_errors(client):
+    with client.websocket_connect("/v1/realtime") as ws:
+        assert ws.receive_json()["type"] == "session.created"
+        ws.send_text("{not json")
+        assert ws.receive_json() == {"type": "error", "error": "Text messages must be JSON events"}
+        ws.send_text(json.dumps(["session.close"]))
+        assert ws.receive_json() == {"type": "error", "error": "Text messages must be JSON objects"}
+        # the session goes on
+        ws.send_bytes(b"still")
+        assert ws.receive_json()["delta"] == " still"
+        ws.send_text(json.dumps({"type": "session.close"}))
+        assert receive_until(ws, "transcript.text.done")[-1]["text"] == "still"
+
+
+def test_decode_failure_is_reported_and_closes_the_session(client, monkeypatch):
+    monkeypatch.setattr(FakeSession, "process", lambda self: 1 / 0)
+    with client.websocket_connect("/v1/realtime") as ws:
+        assert ws.receive_json()["type"] == "session.created"
+        ws.send_bytes(b"hello")
+        assert ws.receive_json() == {"type": "error", "error": "division by zero"}
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+        assert closed.value.code == 1011
+    assert client.created[0].closed
+    assert realtime_ws.sessions == {}
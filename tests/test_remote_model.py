@@ -0,0 +1,213 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from asr_fusion.models.remote_model import RemoteError, RemoteModel
+from asr_fusion.models.scheduler import run_as
+
+
+class StubNode:
+    """An ASR Fusion node answering /health and /v1/audio/transcriptions with configurable statuses"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.health_status = 200
+        self.status = 200
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self.answer(stub.health_status, b"{}")
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                stub.requests.append((dict(self.headers), body))
+                if stub.status != 200:
+                    self.answer(stub.status, b'{"detail": "busy"}')
+                elif b'name="stream"\r\n\r\ntrue' in body:
+                    events = [{"type": "transcript.text.delta", "delta": stub.name},
+                              {"type": "transcript.text.done", "text": stub.name}]
+                    self.answer(200, b"".join(b"data: " + json.dumps(e).encode() + b"\n\n" for e in events))
+                else:
+                    self.answer(200, json.dumps({"text": stub.name}).encode())
+
+            def answer(self, status: int, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def closed_port_url() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+@pytest.fixture
+def stubs():
+    nodes = [StubNode(f"node{i}") for i in range(2)]
+    yield nodes
+    for node in nodes:
+        node.close()
+
+
+@pytest.fixture
+def audio_file(tmp_path):
+    path = tmp_path / "audio.wav"
+    path.write_bytes(b"not really audio")
+    return str(path)
+
+
+def remote(urls, **kwargs) -> RemoteModel:
+    kwargs.setdefault("health_interval", 3600.0)
+    return RemoteModel("large-v3", "faster-whisper/large-v3", urls, **kwargs)
+
+
+def placement(model: RemoteModel, sessions):
+    return {session: model.nodes[model._pick(session, []).index].url for session in sessions}
+
+
+SESSIONS = [f"session-{i}" for i in range(500)]
+URLS = [f"http://10.0.0.{i}:8603" for i in range(1, 5)]
+
+
+def test_ring_moves_only_the_sessions_of_an_added_node():
+    before = placement(remote(URLS[:3]), SESSIONS)
+    after = placement(remote(URLS), SESSIONS)
+    moved = [session for session in SESSIONS if before[session] != after[session]]
+    assert moved and all(after[session] == URLS[3] for session in moved)
+    # roughly a fair share moves
+    assert 0.1 < len(moved) / len(SESSIONS) < 0.4
+
+
+def test_ring_moves_only_the_sessions_of_a_removed_node():
+    before = placement(remote(URLS), SESSIONS)
+    after = placement(remote(URLS[:1] + URLS[2:]), SESSIONS)
+    assert all(before[session] == URLS[1] for session in SESSIONS if before[session] != after[session])
+    assert URLS[1] not in after.values()
+
+
+def test_ring_skips_unhealthy_nodes_and_takes_sessions_back():
+    model = remote(URLS)
+    before = placement(model, SESSIONS)
+    model.nodes[2].healthy = False
+    during = placement(model, SESSIONS)
+    assert URLS[2] not in during.values()
+    assert all(before[session] == URLS[2] for session in SESSIONS if before[session] != during[session])
+    model.nodes[2].healthy = True
+    assert placement(model, SESSIONS) == before
+
+
+def test_least_outstanding_node_without_a_session():
+    model = remote(URLS[:2])
+    model.nodes[0].outstanding_seconds = 10.0
+    assert model._pick(None, []) is model.nodes[1]
+    assert model._pick(None, [model.nodes[1]]) is model.nodes[0]
+
+
+def test_transcribes_on_a_node_with_the_request_context(stubs, audio_file):
+    model = remote([stubs[0].url])
+    result = run_as("premium", "batch", model.transcribe_file, audio_file, language="en", cancel=None)
+    assert result == {"text": "node0", "remote": {"model": "faster-whisper/large-v3", "node": stubs[0].url}}
+    headers, body = stubs[0].requests[0]
+    assert (headers["X-Tenant"], headers["X-Priority"]) == ("premium", "batch")
+    assert b'name="model"\r\n\r\nfaster-whisper/large-v3' in body
+    assert b'name="language"\r\n\r\nen' in body
+    assert b"not really audio" in body
+    model.close()
+
+
+def test_fails_over_to_another_node_on_a_server_error(stubs, audio_file):
+    stubs[0].status = 503
+    model = remote([stubs[0].url, stubs[1].url])
+    session = next(s for s in SESSIONS if model._pick(s, []) is model.nodes[0])
+    assert model.transcribe_file(audio_file, session=session)["text"] == "node1"
+    assert len(stubs[0].requests) == 1
+    model.close()
+
+
+def test_fails_over_from_an_unreachable_node(stubs, audio_file):
+    model = remote([closed_port_url(), stubs[1].url])
+    model.nodes[1].outstanding_seconds = 100.0  # the dead node is picked first
+    assert model.transcribe_file(audio_file)["text"] == "node1"
+    assert model.nodes[0].failed == 1
+    model.close()
+
+
+def test_client_errors_are_not_retried(stubs, audio_file):
+    stubs[0].status = 400
+    model = remote([stubs[0].url, stubs[1].url])
+    model.nodes[1].outstanding_seconds = 100.0
+    with pytest.raises(RemoteError) as error:
+        model.transcribe_file(audio_file)
+    assert error.value.status == 400
+    assert stubs[1].requests == []
+    model.close()
+
+
+def test_retries_are_bounded(stubs, audio_file):
+    for stub in stubs:
+        stub.status = 503
+    model = remote([stubs[0].url, stubs[1].url, closed_port_url()], retries=1)
+    with pytest.raises((RemoteError, OSError)):
+        model.transcribe_file(audio_file)
+    assert sum(node.failed for node in model.nodes) == 2
+    model.close()
+
+
+def test_failing_node_leaves_rotation(stubs, audio_file):
+    stubs[0].status = 503
+    model = remote([stubs[0].url], max_failures=2, retries=0)
+    for _ in range(2):
+        with pytest.raises(RemoteError):
+            model.transcribe_file(audio_file)
+    assert not model.nodes[0].healthy
+    model.close()
+
+
+def test_streaming_events_are_passed_on(stubs, audio_file):
+    model = remote([stubs[0].url])
+    events = list(model.transcribe_file_to_streaming(audio_file))
+    assert events == [
+        {"type": "transcript.text.delta", "delta": "node0"},
+        {"type": "transcript.text.done", "text": "node0", "remote": {"model": "faster-whisper/large-v3", "node": stubs[0].url}},
+    ]
+    model.close()
+
+
+def test_health_loop_takes_nodes_out_and_back(stubs):
+    model = remote([stubs[0].url, closed_port_url()], health_interval=0.02, health_timeout=1.0)
+
+    def wait_for(condition):
+        deadline = time.time() + 5
+        while not condition():
+            assert time.time() < deadline, "timed out"
+            time.sleep(0.01)
+
+    wait_for(lambda: not model.nodes[1].healthy and model.nodes[0].last_check is not None)
+    assert model.nodes[0].healthy and model.nodes[0].check_latency is not None
+    stubs[0].health_status = 503
+    wait_for(lambda: not model.nodes[0].healthy)
+    stubs[0].health_status = 200
+    wait_for(lambda: model.nodes[0].healthy)
+    model.close()
+    assert model._stop.is_set()
@@ -0,0 +1,63 @@
+import pytest
+
+from asr_fusion.models.replica_pool import Replica, ReplicaPool
+
+
+class FakeModel:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = 0
+
+    def transcribe_file(self, audio, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("replica failed")
+        return {"text": "ok"}
+
+
+def make_pool(*models, **kwargs) -> ReplicaPool:
+    return ReplicaPool("fake/model", [Replica(i, model) for i, model in enumerate(models)], **kwargs)
+
+
+def test_routes_to_replica_with_least_outstanding_audio():
+    pool = make_pool(FakeModel(), FakeModel(), FakeModel())
+    with pool.acquire(10.0, pin=False) as first:
+        with pool.acquire(2.0, pin=False) as second:
+            with pool.acquire(1.0, pin=False) as third:
+                assert [first.index, second.index, third.index] == [0, 1, 2]
+                # replica 2 holds the least audio, then replica 1
+                with pool.acquire(1.0, pin=False) as fourth:
+                    assert fourth.index == 2
+    assert all(replica.outstanding_seconds == 0.0 for replica in pool.replicas)
+    assert all(replica.in_flight == 0 for replica in pool.replicas)
+
+
+def test_releases_outstanding_audio_and_counts_completions():
+    pool = make_pool(FakeModel(), FakeModel())
+    assert pool.transcribe_file([0.0] * 16000) == {"text": "ok"}
+    assert pool.replicas[0].completed == 1
+    assert pool.replicas[0].audio_seconds == pytest.approx(1.0)
+    assert pool.outstanding_seconds == 0.0
+
+
+def test_unhealthy_replica_leaves_rotation():
+    pool = make_pool(FakeModel(fail=True), FakeModel(), max_failures=2, retry_after=60.0)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            # idle replicas tie, so the lower index is picked while it is healthy
+            pool.transcribe_file([0.0] * 1600)
+    assert not pool.replicas[0].healthy
+    for _ in range(3):
+        pool.transcribe_file([0.0] * 1600)
+    assert pool.replicas[0].model.calls == 2
+    assert pool.replicas[1].model.calls == 3
+
+
+def test_keeps_serving_when_every_replica_is_unhealthy():
+    pool = make_pool(FakeModel(fail=True), max_failures=1, retry_after=60.0)
+    with pytest.raises(RuntimeError):
+        pool.transcribe_file([0.0] * 1600)
+    assert not pool.replicas[0].healthy
+    with pytest.raises(RuntimeError):
+        pool.transcribe_file([0.0] * 1600)
+    assert pool.replicas[0].model.calls == 2
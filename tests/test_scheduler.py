@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+from asr_fusion.models.scheduler import FairScheduler, OTHER_TENANT, tenant_of
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def grant_order(scheduler: FairScheduler, requests):
+    """Tenant and priority of each (tenant, priority, cost) request in the order the scheduler admits them,
+    all queued, in the given order, while the only slot is taken"""
+    order = []
+    threads = []
+
+    def run(tenant, priority, cost):
+        with scheduler.slot(cost, tenant=tenant, priority=priority):
+            order.append((tenant, priority))
+
+    with scheduler.slot(1.0, tenant="holder", priority="realtime"):
+        for request in requests:
+            thread = threading.Thread(target=run, args=request)
+            thread.start()
+            threads.append(thread)
+            wait_until(lambda: len(scheduler.waiting) == len(threads))
+    for thread in threads:
+        thread.join(5.0)
+    return order
+
+
+def test_higher_priority_class_goes_first():
+    scheduler = FairScheduler("model", capacity=1)
+    order = grant_order(scheduler, [("a", "batch", 1.0), ("a", "interactive", 1.0), ("b", "realtime", 1.0)])
+    assert order == [("b", "realtime"), ("a", "interactive"), ("a", "batch")]
+
+
+def test_tenants_share_by_weight():
+    scheduler = FairScheduler("model", capacity=1, weights={"heavy": 2.0})
+    requests = [("heavy", "interactive", 1.0)] * 4 + [("light", "interactive", 1.0)] * 4
+    order = [tenant for tenant, _ in grant_order(scheduler, requests)]
+    # a backlog queued first still only gets its share: two seconds of heavy per second of light
+    assert order == ["heavy", "light", "heavy", "heavy", "light", "heavy", "light", "light"]
+
+
+def test_slot_is_released_on_error():
+    scheduler = FairScheduler("model", capacity=1)
+    try:
+        with scheduler.slot(1.0, tenant="a", priority="interactive"):
+            raise RuntimeError("transcription failed")
+    except RuntimeError:
+        pass
+    assert scheduler.running == 0
+    with scheduler.slot(1.0, tenant="a", priority="interactive"):
+        assert scheduler.running == 1
+
+
+def test_unconfigured_tenants_are_bounded():
+    scheduler = FairScheduler("model", capacity=1, weights={"premium": 2.0}, max_dynamic_tenants=2)
+    for tenant in ("t0", "t1", "t2", "premium"):
+        with scheduler.slot(1.0, tenant=tenant, priority="interactive"):
+            pass
+    assert set(scheduler.tenants) == {"t0", "t1", OTHER_TENANT, "premium"}
+
+    # t0's next request moves the virtual time past t1's finish tag, so t1 is idle and forgotten for t3
+    with scheduler.slot(1.0, tenant="t0", priority="interactive"):
+        pass
+    with scheduler.slot(1.0, tenant="t3", priority="interactive"):
+        pass
+    assert set(scheduler.tenants) == {"t0", "t3", OTHER_TENANT, "premium"}
+    assert scheduler.label("premium") == "premium"
+    assert scheduler.label("t0") == OTHER_TENANT
+
+
+@pytest.mark.parametrize("weights, default_weight", [({"free": 0}, 1.0), ({"free": -1.0}, 1.0), ({}, 0.0)])
+def test_weights_must_be_positive(weights, default_weight):
+    with pytest.raises(ValueError, match="must be positive"):
+        FairScheduler("model", capacity=1, weights=weights, default_weight=default_weight)
+
+
+def test_tenant_of():
+    config = {"api_keys": {"secret": "premium"}}
+    assert tenant_of(config, api_key="secret", tenant="ignored") == "premium"
+    assert tenant_of(config, tenant="team") == "team"
+    assert tenant_of(config, api_key="unmapped").startswith("key-")
+    assert tenant_of(config) == "default"
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from asr_fusion.whisper_streaming.silero_vad import EnergyGate, FixedVADIterator
+
+WINDOW = 512
+
+
+def noise(level: float, samples: int = WINDOW, seed: int = 0) -> np.ndarray:
+    return (level * np.random.default_rng(seed).standard_normal(samples)).astype(np.float32)
+
+
+def tone(level: float, samples: int = WINDOW) -> np.ndarray:
+    return (level * np.sin(2 * np.pi * 200 * np.arange(samples) / 16000)).astype(np.float32)
+
+
+class FakeModel:
+    """Speech wherever a window is louder than threshold_db"""
+
+    def __init__(self, threshold_db: float = -30.0):
+        self.threshold_db = threshold_db
+        self.calls = 0
+
+    def reset_states(self):
+        pass
+
+    def __call__(self, x, sampling_rate):
+        self.calls += 1
+        energy_db, _ = EnergyGate.features(x.numpy())
+        return np.float32(1.0 if energy_db > self.threshold_db else 0.0)
+
+
+def test_features():
+    energy_db, zcr = EnergyGate.features(np.full(WINDOW, 0.1, dtype=np.float32))
+    assert energy_db == pytest.approx(-20.0, abs=0.01)
+    assert zcr == 0.0
+    _, zcr = EnergyGate.features(np.tile([0.1, -0.1], WINDOW // 2).astype(np.float32))
+    assert zcr == 1.0
+
+
+def test_digital_silence_is_gated_before_the_floor_is_known():
+    gate = EnergyGate(warmup_windows=16)
+    assert gate.silent(*gate.features(np.zeros(WINDOW, dtype=np.float32)))
+    assert not gate.silent(*gate.features(noise(0.01)))
+
+
+def test_floor_gates_background_after_warmup():
+    gate = EnergyGate(warmup_windows=4)
+    for seed in range(4):
+        assert not gate.silent(*gate.features(noise(0.01, seed=seed)))
+        gate.update(*gate.features(noise(0.01, seed=seed)), WINDOW, speech=False)
+    assert gate.silent(*gate.features(noise(0.01, seed=10)))
+    # louder than the floor and its margin
+    assert not gate.silent(*gate.features(noise(0.1, seed=11)))
+
+
+def test_quiet_window_crossing_zero_more_often_than_the_background_goes_to_the_model():
+    gate = EnergyGate(warmup_windows=1)
+    gate.update(*gate.features(tone(0.01)), WINDOW, speech=False)
+    assert gate.silent(*gate.features(tone(0.01)))
+    # a hiss as quiet as the hum, like an unvoiced consonant
+    assert not gate.silent(*gate.features(noise(0.007)))
+
+
+def test_floor_falls_at_once_and_rises_slowly():
+    gate = EnergyGate(floor_rise_db=3.0)
+    gate.update(-40.0, 0.1, WINDOW, speech=False)
+    gate.update(-50.0, 0.1, WINDOW, speech=False)
+    assert gate.floor_db == -50.0
+    gate.update(-20.0, 0.1, 16000, speech=False)
+    assert gate.floor_db == pytest.approx(-47.0)
+    # speech leaves the floor alone
+    gate.update(-10.0, 0.1, 16000, speech=True)
+    assert gate.floor_db == pytest.approx(-47.0)
+
+
+def test_iterator_skips_the_model_on_background_and_still_detects_speech():
+    model = FakeModel()
+    vad = FixedVADIterator(model, gate=EnergyGate(warmup_windows=4), min_silence_duration_ms=100)
+    events = []
+    audio = [noise(0.001, seed=i) for i in range(40)] + [tone(0.3)] * 10 + [noise(0.001, seed=i) for i in range(40, 80)]
+    for window in audio:
+        event = vad(window)
+        if event:
+            events.append(event)
+
+    # timed from the end of the first speech window, like the model alone
+    assert events[0] == {"start": 41 * WINDOW - vad.speech_pad_samples}
+    assert "end" in events[1]
+    assert len(events) == 2
+    assert vad.model_calls == model.calls
+    assert vad.gated_windows + vad.model_calls == len(audio)
+    # the background is decided by the gate once the floor is known
+    assert vad.gated_windows > 60
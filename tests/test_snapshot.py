@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from asr_fusion.routers.realtime.snapshot import MAGIC, pack, unpack
+from asr_fusion.whisper_streaming.whisper_online import OnlineASRProcessor
+
+SAMPLING_RATE = 16000
+
+
+class AudioASR:
+    """Names each half-second word after the audio under it, so every decode of the same audio agrees"""
+    sep = ""
+
+    def transcribe(self, audio, init_prompt=""):
+        duration = len(audio) / SAMPLING_RATE
+        return [(t, t + 0.5, f" w{round(float(audio[int(t * SAMPLING_RATE)]) * 1000)}")
+                for t in np.arange(0.0, duration - 0.25, 0.5)]
+
+    def ts_words(self, res):
+        return res
+
+    def segments_end_ts(self, res):
+        return [end for _, end, _ in res]
+
+
+def processor() -> OnlineASRProcessor:
+    return OnlineASRProcessor(AudioASR(), buffer_trimming=("segment", 100), incremental_features=False,
+                              max_buffer_sec=3.0)
+
+
+def test_pack_round_trip():
+    state = {
+        "audio": np.arange(5, dtype=np.float32) / 4,
+        "nested": {"pcm": np.array([1, -2], dtype="<i2"), "empty": np.zeros(0, dtype=np.float32)},
+        "words": [(0.0, 0.5, " hello"), (0.5, 1.0, " wörld")],
+        "count": np.int64(3),
+        "missing": None,
+    }
+    restored = unpack(pack(state))
+    np.testing.assert_array_equal(restored["audio"], state["audio"])
+    assert restored["audio"].dtype == np.float32
+    np.testing.assert_array_equal(restored["nested"]["pcm"], [1, -2])
+    assert restored["nested"]["pcm"].dtype == np.dtype("<i2")
+    assert restored["nested"]["empty"].size == 0
+    assert restored["words"] == [[0.0, 0.5, " hello"], [0.5, 1.0, " wörld"]]
+    assert restored["count"] == 3
+    assert restored["missing"] is None
+
+
+def test_unpack_rejects_other_data():
+    with pytest.raises(ValueError):
+        unpack(b"RIFF0000WAVEfmt ")
+    with pytest.raises(ValueError):
+        unpack(MAGIC)
+    with pytest.raises(ValueError):
+        unpack(pack({"audio": np.ones(100, dtype=np.float32)})[:-4])
+
+
+def test_restored_processor_goes_on_like_the_original():
+    audio = (np.arange(12 * SAMPLING_RATE) // (SAMPLING_RATE // 2)).astype(np.float32) / 1000
+    chunks = np.split(audio, 12)
+    original = processor()
+    for chunk in chunks[:6]:
+        original.insert_audio_chunk(chunk)
+        original.process_iter()
+
+    restored = processor()
+    restored.load_state(unpack(pack(original.state())))
+    assert restored.buffer_time_offset == original.buffer_time_offset > 0
+    assert restored.partial() == original.partial()
+
+    for chunk in chunks[6:]:
+        for online in (original, restored):
+            online.insert_audio_chunk(chunk)
+        assert restored.process_iter() == original.process_iter()
+    # the buffer was bounded along the way
+    assert len(restored.audio_buffer) <= 3 * SAMPLING_RATE
+    assert restored.finish() == original.finish()
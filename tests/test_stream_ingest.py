@@ -0,0 +1,188 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from asr_fusion.models.stream_ingest import (
+    BytePipe,
+    PCMDecoder,
+    WindowedTranscriber,
+    decoder_for,
+    parse_content_type,
+)
+
+SAMPLING_RATE = 16000
+
+
+def split(data: bytes, pieces: int, seed: int = 0):
+    """data cut at random byte offsets, including empty pieces"""
+    cuts = sorted(np.random.default_rng(seed).integers(0, len(data), pieces - 1))
+    return [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+
+
+def decode(decoder, pieces) -> np.ndarray:
+    blocks = []
+    reader = threading.Thread(target=lambda: blocks.extend(decoder.samples()))
+    reader.start()
+    for piece in pieces:
+        decoder.write(piece)
+    decoder.close()
+    reader.join(5)
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+
+
+def test_parse_content_type():
+    assert parse_content_type('Audio/PCM; rate=8000; Channels="2"') == ("audio/pcm", {"rate": "8000", "channels": "2"})
+    assert parse_content_type(None) == ("", {})
+
+
+def test_decoder_for():
+    decoder = decoder_for("audio/L16; rate=8000; channels=2")
+    assert (decoder.dtype, decoder.rate, decoder.channels) == (np.dtype(">i2"), 8000, 2)
+    assert decoder_for("audio/pcm; format=f32le").dtype == np.dtype("<f4")
+    with pytest.raises(ValueError):
+        decoder_for("audio/pcm; format=u8")
+
+
+def test_pcm_s16be_stereo_split_at_arbitrary_bytes():
+    left = np.linspace(-0.5, 0.5, SAMPLING_RATE, dtype=np.float32)
+    right = -left / 2
+    interleaved = (np.stack([left, right], axis=1) * 32768).astype(">i2")
+
+    samples = decode(PCMDecoder("s16be", channels=2), split(interleaved.tobytes(), 97))
+
+    np.testing.assert_allclose(samples, (left + right) / 2, atol=1 / 32768)
+
+
+@pytest.mark.parametrize("rate", [8000, 22050, 44100, 48000])
+def test_resampling_is_continuous_across_writes(rate):
+    tone = np.sin(2 * np.pi * 440 * np.arange(2 * rate) / rate).astype("<f4")
+
+    whole = decode(PCMDecoder("f32le", rate=rate), [tone.tobytes()])
+    pieces = decode(PCMDecoder("f32le", rate=rate), split(tone.tobytes(), 50))
+
+    assert abs(len(whole) - 2 * SAMPLING_RATE) <= 2
+    reference = np.interp(np.arange(len(whole)) * rate / SAMPLING_RATE, np.arange(len(tone)), tone)
+    np.testing.assert_allclose(whole, reference, atol=1e-6)
+    np.testing.assert_allclose(pieces, whole, atol=1e-6)
+
+
+def test_pipe_read_blocks_until_a_write_and_ends_on_close():
+    pipe = BytePipe()
+    read = []
+    reader = threading.Thread(target=lambda: read.extend([pipe.read(3), pipe.read(), pipe.read()]))
+    reader.start()
+    time.sleep(0.05)
+    assert read == []
+    pipe.write(b"abcdef")
+    time.sleep(0.05)
+    pipe.close()
+    reader.join(5)
+    assert read == [b"abc", b"def", b""]
+    with pytest.raises(ValueError):
+        pipe.write(b"late")
+
+
+def test_pipe_write_blocks_while_full():
+    pipe = BytePipe(max_bytes=4)
+    pipe.write(b"1234")
+    written = threading.Event()
+    writer = threading.Thread(target=lambda: (pipe.write(b"5678"), written.set()))
+    writer.start()
+    assert not written.wait(0.05)
+    assert pipe.read(2) == b"12"
+    assert written.wait(5)
+    assert pipe.read() == b"345678"
+
+
+def test_pipe_close_unblocks_a_writer():
+    pipe = BytePipe(max_bytes=4)
+    pipe.write(b"1234")
+    errors = []
+
+    def write():
+        try:
+            pipe.write(b"5678")
+        except ValueError as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    time.sleep(0.05)
+    pipe.close()
+    writer.join(5)
+    assert not writer.is_alive() and len(errors) == 1
+
+
+def test_abort_unblocks_a_writer():
+    decoder = PCMDecoder("f32le", max_queued_seconds=1)
+    errors = []
+
+    def write():
+        try:
+            # more audio than the decoder queues while nothing consumes it
+            decoder.write(np.zeros(3 * SAMPLING_RATE, dtype="<f4").tobytes())
+        except RuntimeError as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    time.sleep(0.1)
+    assert writer.is_alive()
+    decoder.abort()
+    writer.join(5)
+    assert not writer.is_alive() and len(errors) == 1
+
+
+class FakePool:
+    """Hypothesizes one segment per `segment` seconds of the buffer, named after where it starts in the audio"""
+
+    def __init__(self, segment: float = 4.0):
+        self.segment = segment
+        self.calls = []
+
+    def transcribe_file(self, audio, **kwargs):
+        self.calls.append((len(audio) / SAMPLING_RATE, kwargs))
+        duration = len(audio) / SAMPLING_RATE
+        starts = np.arange(0.0, duration, self.segment)
+        segments = [{"start": start, "end": min(start + self.segment, duration),
+                     "text": f" at{round(float(audio[int(start * SAMPLING_RATE)]))}"} for start in starts]
+        return {"language": "de", "segments": segments}
+
+
+def audio(seconds: float) -> np.ndarray:
+    # every sample holds its own second, so a segment's text tells where in the audio it started
+    return (np.arange(int(seconds * SAMPLING_RATE)) // SAMPLING_RATE).astype(np.float32)
+
+
+def test_windowed_transcriber_commits_and_carries_over():
+    pool = FakePool()
+    transcriber = WindowedTranscriber(pool, window=10.0, initial_prompt="Hello")
+    samples = audio(23.0)
+
+    events = []
+    for block in np.array_split(samples, 23):
+        events += list(transcriber.feed(block))
+    # 10 s: 0-4 and 4-8 committed, 8-10 carried over; 2 + 8 s: 8-12 and 12-16, 16-18 carried over
+    assert [(e["start"], e["end"], e["delta"]) for e in events] == [
+        (0.0, 4.0, " at0"), (4.0, 8.0, " at4"), (8.0, 12.0, " at8"), (12.0, 16.0, " at12"),
+    ]
+    assert transcriber.offset == 16.0
+
+    events = list(transcriber.finish())
+    assert [e["delta"] for e in events[:-1]] == [" at16", " at20"]
+    assert events[-1] == {"type": "transcript.text.done", "language": "de", "duration": 23.0,
+                          "text": "at0 at4 at8 at12 at16 at20"}
+
+    first, second = pool.calls[0][1], pool.calls[1][1]
+    assert first["initial_prompt"] == "Hello" and "language" not in first
+    # the committed text is the next prompt, and the first window's language is kept
+    assert second["initial_prompt"] == " at0 at4" and second["language"] == "de"
+
+
+def test_windowed_transcriber_commits_a_window_without_a_safe_cut():
+    transcriber = WindowedTranscriber(FakePool(segment=30.0), window=10.0)
+    events = list(transcriber.feed(audio(10.0)))
+    assert [e["delta"] for e in events] == [" at0"]
+    assert transcriber.offset == 10.0 and len(transcriber.buffer) == 0
@@ -0,0 +1,123 @@
+import numpy as np
+
+from asr_fusion.whisper_streaming.whisper_online import HypothesisBuffer, OnlineASRProcessor
+
+SAMPLING_RATE = 16000
+
+
+class FakeASR:
+    """Hypothesizes a word every half second of the buffer, with new text on every decode, so that no
+    word is ever confirmed by two decodes in a row"""
+    sep = ""
+
+    def __init__(self):
+        self.decodes = 0
+
+    def transcribe(self, audio, init_prompt=""):
+        self.decodes += 1
+        duration = len(audio) / SAMPLING_RATE
+        return [(t, t + 0.5, f" d{self.decodes}w{i}") for i, t in enumerate(np.arange(0.0, duration - 0.25, 0.5))]
+
+    def ts_words(self, res):
+        return res
+
+    def segments_end_ts(self, res):
+        return [res[-1][1]] if res else []
+
+
+def processor(**kwargs) -> OnlineASRProcessor:
+    return OnlineASRProcessor(FakeASR(), buffer_trimming=("segment", 100), incremental_features=False, **kwargs)
+
+
+def words(*spans):
+    return [(beg, end, f" w{i}") for i, (beg, end) in enumerate(spans)]
+
+
+def test_commit_until_commits_through_the_first_word_ending_at_time():
+    hypothesis = HypothesisBuffer()
+    hypothesis.insert(words((0.0, 1.0), (1.0, 2.0), (2.0, 3.0)), 0)
+    assert hypothesis.flush() == []
+
+    assert hypothesis.commit_until(1.5) == [(0.0, 1.0, " w0"), (1.0, 2.0, " w1")]
+    assert hypothesis.last_commited_time == 2.0
+    assert hypothesis.last_commited_word == " w1"
+    assert hypothesis.complete() == [(2.0, 3.0, " w2")]
+    assert hypothesis.commited_in_buffer == [(0.0, 1.0, " w0"), (1.0, 2.0, " w1")]
+
+
+def test_commit_until_past_the_hypothesis_commits_all_of_it():
+    hypothesis = HypothesisBuffer()
+    hypothesis.insert(words((0.0, 1.0), (1.0, 2.0)), 0)
+    hypothesis.flush()
+    assert len(hypothesis.commit_until(10.0)) == 2
+    assert hypothesis.complete() == []
+
+
+def test_chunk_bounded_force_commits_when_nothing_is_confirmed():
+    online = processor(max_buffer_sec=5.0)
+    online.insert_audio_chunk(np.zeros(6 * SAMPLING_RATE, dtype=np.float32))
+
+    beg, end, text = online.process_iter()
+
+    # the first second had to go, and no decode confirmed its words
+    assert (beg, end, text) == (0.0, 1.0, " d1w0 d1w1")
+    assert online.buffer_time_offset == 1.0
+    assert len(online.audio_buffer) / SAMPLING_RATE <= 5.0
+
+
+def test_chunk_bounded_cuts_at_a_confirmed_word_keeping_the_overlap():
+    online = processor(max_buffer_sec=5.0, buffer_overlap_sec=1.0)
+    online.transcript_buffer.commited_in_buffer = words((0.0, 1.0), (1.0, 2.0), (2.0, 3.0), (3.0, 4.0))
+    online.insert_audio_chunk(np.zeros(7 * SAMPLING_RATE, dtype=np.float32))
+
+    assert online.chunk_bounded() == []
+    # the cut must be at 2.0 or later; 3.0 is the latest end that keeps a second of committed audio
+    assert online.buffer_time_offset == 3.0
+    assert len(online.audio_buffer) == 4 * SAMPLING_RATE
+
+
+def test_partial_leaves_out_force_committed_words():
+    online = processor(max_buffer_sec=5.0)
+    hypothesis = words((0.0, 0.5), (0.5, 1.0), (1.0, 1.5), (1.5, 2.0))
+    online.transcript_buffer.buffer = list(hypothesis)
+    # a copy of the hypothesis, as load_state() leaves it
+    online.partial_words = list(hypothesis)
+    online.insert_audio_chunk(np.zeros(6 * SAMPLING_RATE, dtype=np.float32))
+
+    assert online.chunk_bounded() == hypothesis[:2]
+    assert online.partial() == (1.0, 2.0, " w2 w3")
+
+
+def test_draft_partial_leaves_out_committed_words():
+    online = OnlineASRProcessor(FakeASR(), buffer_trimming=("segment", 100), incremental_features=False,
+                                draft_asr=FakeASR(), commit_interval=5.0)
+    # the buffer still holds two seconds of committed audio, kept as context
+    online.transcript_buffer.last_commited_time = 2.0
+    online.insert_audio_chunk(np.zeros(4 * SAMPLING_RATE, dtype=np.float32))
+
+    assert online.process_iter() == (None, None, "")
+    assert online.partial() == (2.0, 4.0, " d1w4 d1w5 d1w6 d1w7")
+
+
+class FakeFeatureExtractor:
+    n_fft = 400
+    hop_length = 160
+    mel_filters = np.zeros((80, 201), dtype=np.float32)
+
+
+class FeaturesASR(FakeASR):
+    def feature_extractor(self):
+        return FakeFeatureExtractor()
+
+
+def test_chunk_at_cuts_hypothesis_and_audio_at_the_same_frame_boundary():
+    online = OnlineASRProcessor(FeaturesASR(), buffer_trimming=("segment", 100))
+    online.transcript_buffer.commited_in_buffer = words((0.0, 1.0), (1.0, 1.005), (1.005, 2.0))
+    online.insert_audio_chunk(np.zeros(3 * SAMPLING_RATE, dtype=np.float32))
+
+    online.chunk_at(1.005)
+
+    # 1.005 s is half a hop into a frame: the cut goes back to 1.0, and the word ending after it stays
+    assert online.buffer_time_offset == 1.0
+    assert len(online.audio_buffer) == 2 * SAMPLING_RATE
+    assert online.transcript_buffer.commited_in_buffer == [(1.0, 1.005, " w1"), (1.005, 2.0, " w2")]